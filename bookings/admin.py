@@ -1,24 +1,101 @@
 from django.contrib import admin
-from .models import Booking, BonusAccount, BonusTransaction
+from django.db.models import Q
+from sauna.paginators import EstimatedCountPaginator
+from users.models import Bathhouse, Room
+from .models import Booking, BookingSeries, BonusAccount, BonusTransaction
+from .services import search
+
+
+class RoomListFilter(admin.SimpleListFilter):
+    """
+    Room filter that loads rooms with their bathhouse in one query (Room.__str__
+    needs bathhouse.name) and narrows them down to the selected bathhouse.
+    """
+
+    title = 'room'
+    parameter_name = 'room__id__exact'
+    bathhouse_parameter = 'bathhouse__id__exact'
+
+    def lookups(self, request, model_admin):
+        rooms = Room.objects.select_related('bathhouse').order_by('bathhouse__name', 'room_number')
+        bathhouse_id = request.GET.get(self.bathhouse_parameter)
+        if bathhouse_id and bathhouse_id.isdigit():
+            rooms = rooms.filter(bathhouse_id=bathhouse_id)
+        return [(room.pk, str(room)) for room in rooms]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.parameter_name: self.value()})
+        return queryset
+
+
+class BonusTransactionRoomListFilter(RoomListFilter):
+    parameter_name = 'booking__room__id__exact'
+    bathhouse_parameter = 'booking__bathhouse__id__exact'
+
 
 @admin.register(Booking)
 class BookingAdmin(admin.ModelAdmin):
     list_display = ('name', 'phone', 'bathhouse', 'room', 'start_time', 'hours', 'confirmed')
+    list_select_related = ('bathhouse', 'room__bathhouse')
     search_fields = ('name', 'phone', 'bathhouse__name', 'room__room_number')
-    list_filter = ('bathhouse', 'room', 'confirmed', 'start_time')
+    list_filter = ('bathhouse', RoomListFilter, 'confirmed')
+    autocomplete_fields = ('bathhouse', 'room', 'series')
+    date_hierarchy = 'start_time'
     ordering = ('-start_time',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Name / phone matching goes through the trigram indexes; bathhouse and
+        room matches are resolved to ids first so every branch of the OR can
+        use an index on booking.
+        """
+        query = search.clean_query(search_term)
+        if not query:
+            return queryset, False
+        bathhouse_ids = list(
+            Bathhouse.objects.filter(name__icontains=query).values_list('id', flat=True)
+        )
+        room_ids = list(Room.objects.filter(room_number=query).values_list('id', flat=True))
+        condition = search.search_condition(query)
+        if bathhouse_ids:
+            condition |= Q(bathhouse_id__in=bathhouse_ids)
+        if room_ids:
+            condition |= Q(room_id__in=room_ids)
+        return queryset.filter(condition), False
+
+
+@admin.register(BookingSeries)
+class BookingSeriesAdmin(admin.ModelAdmin):
+    list_display = ('name', 'phone', 'bathhouse', 'room', 'start_time', 'until', 'interval_weeks', 'cancelled_at')
+    list_select_related = ('bathhouse', 'room__bathhouse')
+    search_fields = ('name', 'phone')
+    list_filter = ('bathhouse',)
+    autocomplete_fields = ('bathhouse', 'room')
+    ordering = ('-created_at',)
 
 
 @admin.register(BonusAccount)
 class BonusAccountAdmin(admin.ModelAdmin):
     list_display = ('phone', 'bathhouse', 'balance')
+    list_select_related = ('bathhouse',)
     search_fields = ('phone', 'bathhouse__name')
     list_filter = ('bathhouse',)
+    autocomplete_fields = ('bathhouse',)
     ordering = ('-balance',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 @admin.register(BonusTransaction)
 class BonusTransactionAdmin(admin.ModelAdmin):
     list_display = ('account', 'booking', 'type', 'amount')
+    list_select_related = ('account__bathhouse', 'booking__bathhouse')
     search_fields = ('account__phone', 'booking__name', 'type')
-    list_filter = ('type', 'booking__bathhouse', 'booking__room')
-    ordering = ('-created_at',)
\ No newline at end of file
+    list_filter = ('type', 'booking__bathhouse', BonusTransactionRoomListFilter)
+    autocomplete_fields = ('account', 'booking')
+    date_hierarchy = 'created_at'
+    ordering = ('-created_at',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
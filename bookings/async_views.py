@@ -0,0 +1,70 @@
+"""
+Async handlers for the public booking reads, see sauna/async_views.py.
+"""
+from django.utils import timezone
+
+from sauna.async_views import anonymous_view, json_response
+
+from .views import (
+    BonusBalanceView,
+    BonusTransactionsView,
+    BookingViewSet,
+    bonus_account,
+    bonus_lookup,
+    bonus_transaction_row,
+    bonus_transactions,
+)
+
+
+async def room_bookings(request):
+    view, throttled = await anonymous_view(BookingViewSet, request, "get_room_bookings")
+    if throttled is not None:
+        return throttled
+    room_id = request.GET.get("room_id")
+    if not room_id:
+        return json_response({"error": "Room ID is required"}, status=400)
+
+    today = timezone.now().date()
+    queryset = view.get_queryset().filter(room_id=room_id, start_time__gte=today)
+    bookings = [booking async for booking in queryset]
+    return json_response(view.get_serializer(bookings, many=True).data)
+
+
+async def bonus_balance(request):
+    _, throttled = await anonymous_view(BonusBalanceView, request)
+    if throttled is not None:
+        return throttled
+    try:
+        bathhouse_id, phone = bonus_lookup(request.GET)
+    except ValueError as e:
+        return json_response({"error": str(e)}, status=400)
+
+    account = await bonus_account(bathhouse_id, phone).only("id", "balance").afirst()
+
+    balance = str(account.balance) if account else "0.00"
+    return json_response({"bathhouse_id": bathhouse_id, "phone": phone, "balance": balance})
+
+
+async def bonus_transaction_list(request):
+    _, throttled = await anonymous_view(BonusTransactionsView, request)
+    if throttled is not None:
+        return throttled
+    try:
+        bathhouse_id, phone = bonus_lookup(request.GET)
+    except ValueError as e:
+        return json_response({"error": str(e)}, status=400)
+
+    account = await bonus_account(bathhouse_id, phone).only("id").afirst()
+    if not account:
+        return json_response({"bathhouse_id": bathhouse_id, "phone": phone, "transactions": []})
+
+    data = [bonus_transaction_row(tx) async for tx in bonus_transactions(account.id)]
+    return json_response({"bathhouse_id": bathhouse_id, "phone": phone, "transactions": data})
+
+
+# url name -> handler
+HANDLERS = {
+    "booking-get-room-bookings": room_bookings,
+    "bonus-balance": bonus_balance,
+    "bonus-transactions": bonus_transaction_list,
+}
@@ -0,0 +1,141 @@
+import json
+import subprocess
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from bookings.services import benchmarks
+from bookings.services.seeding import SEED_ADMIN_USERNAME
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the main API flows against a running server seeded with seed_load: '
+        'throughput, p50/p95/p99 latency and queries per request, optionally saved as '
+        'a JSON baseline or compared against one.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://localhost:8000')
+        parser.add_argument(
+            '--scenarios',
+            default=','.join(benchmarks.SCENARIOS),
+            help=f'Comma-separated subset of: {", ".join(benchmarks.SCENARIOS)}',
+        )
+        parser.add_argument('--requests', type=int, default=300, help='Measured requests per scenario')
+        parser.add_argument('--warmup', type=int, default=20, help='Unmeasured requests per scenario')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--seed', type=int, default=1, help='Seed for picking request targets')
+        parser.add_argument('--admin-username', default=SEED_ADMIN_USERNAME)
+        parser.add_argument(
+            '--admin-password',
+            help='Needed for process_payment (seed with `seed_load --admin-password`)',
+        )
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+        parser.add_argument('--compare', help='Baseline JSON file to compare the results with')
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.15,
+            help='Allowed relative worsening of latency / throughput (default 0.15)',
+        )
+        parser.add_argument(
+            '--query-tolerance',
+            type=float,
+            default=0.0,
+            help='Allowed increase of mean queries per request (default 0)',
+        )
+
+    def handle(self, *args, **options):
+        scenarios = [name.strip() for name in options['scenarios'].split(',') if name.strip()]
+        unknown = [name for name in scenarios if name not in benchmarks.SCENARIOS]
+        if unknown:
+            raise CommandError(f'Unknown scenarios: {", ".join(unknown)}')
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests and --concurrency must be positive')
+
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Could not read baseline {options["compare"]}: {e}')
+
+        base_url = options['base_url'].rstrip('/')
+        token = None
+        try:
+            if 'process_payment' in scenarios:
+                if not options['admin_password']:
+                    raise CommandError('process_payment needs --admin-password')
+                token = benchmarks.obtain_token(
+                    base_url, options['admin_username'], options['admin_password']
+                )
+            results = benchmarks.run(
+                base_url,
+                scenarios,
+                options['requests'],
+                options['concurrency'],
+                options['seed'],
+                warmup=options['warmup'],
+                token=token,
+                progress=self.write_scenario,
+            )
+        except benchmarks.BenchmarkError as e:
+            raise CommandError(str(e))
+
+        report = {
+            'meta': {
+                'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'git_revision': self.git_revision(),
+                'base_url': base_url,
+                'requests': options['requests'],
+                'warmup': options['warmup'],
+                'concurrency': options['concurrency'],
+                'seed': options['seed'],
+            },
+            'scenarios': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+                f.write('\n')
+            self.stdout.write(f'Results written to {options["output"]}.')
+
+        if baseline is not None:
+            for key in ('requests', 'concurrency', 'seed'):
+                if baseline.get('meta', {}).get(key) != report['meta'][key]:
+                    self.stdout.write(
+                        self.style.WARNING(f'Baseline was recorded with a different --{key}')
+                    )
+            regressions = benchmarks.compare(
+                baseline.get('scenarios', {}),
+                results,
+                options['tolerance'],
+                options['query_tolerance'],
+            )
+            if regressions:
+                for name, metric, old, new, change in regressions:
+                    self.stdout.write(
+                        self.style.ERROR(f'REGRESSION {name} {metric}: {old} -> {new} ({change:+.0%})')
+                    )
+                raise CommandError(f'{len(regressions)} regressions against {options["compare"]}')
+            self.stdout.write(self.style.SUCCESS(f'No regressions against {options["compare"]}.'))
+            return
+
+        self.stdout.write(self.style.SUCCESS(f'Benchmarked {len(results)} scenarios.'))
+
+    def write_scenario(self, name, summary):
+        self.stdout.write(
+            f'{name:<20} {summary["throughput_rps"]:>8} req/s  '
+            f'p50 {summary["p50_ms"]:>8} ms  p95 {summary["p95_ms"]:>8} ms  '
+            f'p99 {summary["p99_ms"]:>8} ms  queries {summary["queries_mean"]}  '
+            f'statuses {summary["statuses"]}'
+        )
+
+    def git_revision(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
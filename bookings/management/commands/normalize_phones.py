@@ -0,0 +1,103 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from bookings.models import Booking, BonusAccount, BonusTransaction
+from bookings.utils import normalize_phone
+
+
+class Command(BaseCommand):
+    help = (
+        'Fill phone_normalized for bookings and bonus accounts saved before it existed, '
+        'merging bonus accounts of one bathhouse that turn out to share a phone. '
+        'Migration 0016 does this once; safe to re-run.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Rows per transaction (default 1000)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report how many rows still need normalizing',
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        pending_bookings = Booking.objects.filter(phone_normalized='')
+        pending_accounts = BonusAccount.objects.filter(phone_normalized='')
+
+        if options['dry_run']:
+            self.stdout.write(
+                self.style.WARNING(
+                    f'DRY RUN - {pending_bookings.count()} bookings and '
+                    f'{pending_accounts.count()} bonus accounts need normalizing'
+                )
+            )
+            return
+
+        updated = self.normalize_bookings(pending_bookings, chunk_size)
+        self.stdout.write(self.style.SUCCESS(f'Normalized {updated} bookings.'))
+
+        normalized, merged = self.normalize_accounts(pending_accounts, chunk_size)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Normalized {normalized} bonus accounts, merged {merged} duplicates.'
+            )
+        )
+
+    def normalize_bookings(self, queryset, chunk_size):
+        updated = 0
+        last_pk = None
+        while True:
+            chunk = queryset.order_by('pk')
+            if last_pk is not None:
+                chunk = chunk.filter(pk__gt=last_pk)
+            rows = list(chunk.values_list('pk', 'phone')[:chunk_size])
+            if not rows:
+                return updated
+            last_pk = rows[-1][0]
+            bookings = []
+            for pk, phone in rows:
+                phone_normalized = normalize_phone(phone)
+                if phone_normalized:
+                    bookings.append(Booking(pk=pk, phone_normalized=phone_normalized))
+            # bulk_update skips save() and signals, so rollups are untouched
+            Booking.objects.bulk_update(bookings, ['phone_normalized'])
+            updated += len(bookings)
+            self.stdout.write(f'Normalized {updated} bookings...')
+
+    def normalize_accounts(self, queryset, chunk_size):
+        normalized = merged = 0
+        last_pk = 0
+        while True:
+            with transaction.atomic():
+                accounts = list(
+                    queryset.filter(pk__gt=last_pk)
+                    .order_by('pk')
+                    .select_for_update()[:chunk_size]
+                )
+                if not accounts:
+                    return normalized, merged
+                last_pk = accounts[-1].pk
+                for account in accounts:
+                    phone = normalize_phone(account.phone)
+                    if not phone:
+                        continue
+                    target = (
+                        BonusAccount.objects.select_for_update()
+                        .filter(bathhouse_id=account.bathhouse_id, phone_normalized=phone)
+                        .first()
+                    )
+                    if target is None:
+                        BonusAccount.objects.filter(pk=account.pk).update(phone_normalized=phone)
+                        normalized += 1
+                        continue
+                    BonusTransaction.objects.filter(account=account).update(account=target)
+                    target.balance = target.balance + account.balance
+                    target.save(update_fields=['balance', 'updated_at'])
+                    account.delete()
+                    merged += 1
+            self.stdout.write(f'Processed {normalized + merged} bonus accounts...')
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from bookings.services.customers import rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute CustomerProfile rows from bookings and bonus accounts '
+        '(run after normalize_phones, or to reconcile drift)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bathhouse-id', type=int, help='Only rebuild this bathhouse')
+
+    def handle(self, *args, **options):
+        count = rebuild(bathhouse_id=options['bathhouse_id'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} customer profiles.'))
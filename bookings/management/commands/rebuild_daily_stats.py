@@ -0,0 +1,29 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from bookings.services.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recompute DailyRoomStats for a date range from bookings and bonus transactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date-from', required=True, help='First day (YYYY-MM-DD), inclusive')
+        parser.add_argument('--date-to', required=True, help='Last day (YYYY-MM-DD), inclusive')
+        parser.add_argument('--bathhouse-id', type=int, help='Only rebuild this bathhouse')
+
+    def handle(self, *args, **options):
+        try:
+            date_from = date.fromisoformat(options['date_from'])
+            date_to = date.fromisoformat(options['date_to'])
+        except ValueError:
+            raise CommandError('Dates must be in YYYY-MM-DD format')
+        if date_to < date_from:
+            raise CommandError('--date-to must not be before --date-from')
+
+        count = rebuild(date_from, date_to, bathhouse_id=options['bathhouse_id'])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Rebuilt {count} daily rows for {date_from} .. {date_to}.'
+            )
+        )
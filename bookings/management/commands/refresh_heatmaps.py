@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from bookings.services.heatmaps import refresh_heatmaps
+
+
+class Command(BaseCommand):
+    help = 'Refresh weekday x hour occupancy heatmaps (incrementally, or from scratch with --full)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Rebuild every heatmap from all confirmed bookings',
+        )
+
+    def handle(self, *args, **options):
+        added = refresh_heatmaps(full=options['full'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Heatmaps refreshed with {added} bookings.')
+        )
@@ -0,0 +1,106 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from bookings.services import seeding
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate synthetic bathhouses, rooms, menus, bookings with extras and bonus '
+        'ledgers for load testing. Deterministic for a given --seed and --anchor.'
+    )
+
+    def add_arguments(self, parser):
+        defaults = seeding.DEFAULT_OPTIONS
+        parser.add_argument('--bathhouses', type=int, default=defaults['bathhouses'])
+        parser.add_argument('--rooms-per-bathhouse', type=int, default=defaults['rooms_per_bathhouse'])
+        parser.add_argument(
+            '--customers-per-bathhouse',
+            type=int,
+            default=defaults['customers_per_bathhouse'],
+            help='Size of each bathhouse\'s customer pool (phones), at most 100000',
+        )
+        parser.add_argument(
+            '--bookings',
+            type=int,
+            default=defaults['bookings'],
+            help='Approximate number of bookings; rooms cap out at a full day',
+        )
+        parser.add_argument('--days-back', type=int, default=defaults['days_back'])
+        parser.add_argument('--days-ahead', type=int, default=defaults['days_ahead'])
+        parser.add_argument(
+            '--evening-share',
+            type=float,
+            default=defaults['evening_share'],
+            help='Share of bookings starting in the 17:00-21:00 peak',
+        )
+        parser.add_argument(
+            '--happy-hours-share',
+            type=float,
+            default=defaults['happy_hours_share'],
+            help='Share of bookings placed inside the weekday Happy Hours window',
+        )
+        parser.add_argument('--birthday-rate', type=float, default=defaults['birthday_rate'])
+        parser.add_argument('--paid-rate', type=float, default=defaults['paid_rate'])
+        parser.add_argument('--extras-rate', type=float, default=defaults['extras_rate'])
+        parser.add_argument('--redemption-rate', type=float, default=defaults['redemption_rate'])
+        parser.add_argument('--seed', type=int, default=defaults['seed'])
+        parser.add_argument(
+            '--anchor',
+            help='Date (YYYY-MM-DD) separating history from future bookings, default today',
+        )
+        parser.add_argument('--chunk-size', type=int, default=defaults['chunk_size'])
+        parser.add_argument(
+            '--admin-password',
+            help=f'Password for the "{seeding.SEED_ADMIN_USERNAME}" owner of the seeded bathhouses',
+        )
+        parser.add_argument(
+            '--purge',
+            action='store_true',
+            help='Delete previously seeded bathhouses first',
+        )
+        parser.add_argument(
+            '--skip-aggregates',
+            action='store_true',
+            help='Do not rebuild daily stats, customer profiles and heatmaps afterwards',
+        )
+
+    def handle(self, *args, **options):
+        if options['anchor']:
+            try:
+                options['anchor'] = date.fromisoformat(options['anchor'])
+            except ValueError:
+                raise CommandError('--anchor must be in YYYY-MM-DD format')
+        if not 1 <= options['bathhouses'] <= 99:
+            raise CommandError('--bathhouses must be between 1 and 99')
+        if not 1 <= options['customers_per_bathhouse'] <= 100_000:
+            raise CommandError('--customers-per-bathhouse must be between 1 and 100000')
+        for name in ('evening_share', 'happy_hours_share', 'birthday_rate', 'paid_rate',
+                     'extras_rate', 'redemption_rate'):
+            if not 0 <= options[name] <= 1:
+                raise CommandError(f'--{name.replace("_", "-")} must be between 0 and 1')
+
+        if options['purge']:
+            purged = seeding.purge()
+            self.stdout.write(f'Purged {purged} seeded bathhouses.')
+
+        started = time.monotonic()
+        counts = seeding.seed(
+            {name: options[name] for name in seeding.DEFAULT_OPTIONS},
+            progress=self.stdout.write,
+        )
+        self.stdout.write(
+            f'Inserted {counts["bookings"]} bookings, {counts["extra_items"]} extras, '
+            f'{counts["bonus_accounts"]} bonus accounts and {counts["bonus_transactions"]} '
+            f'bonus transactions in {time.monotonic() - started:.1f}s.'
+        )
+
+        if not options['skip_aggregates']:
+            started = time.monotonic()
+            seeding.rebuild_aggregates(counts['anchor'], options['days_back'], options['days_ahead'])
+            self.stdout.write(f'Rebuilt aggregates in {time.monotonic() - started:.1f}s.')
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Seeded load data around {counts["anchor"]} (seed {options["seed"]}).')
+        )
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-19 12:05
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0005_booking_is_birthday'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='booking',
+            name='sms_code',
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.4 on 2026-10-19 12:07
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0006_remove_booking_sms_code'),
+        ('users', '0007_roomphoto'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='promotions_applied',
+            field=models.JSONField(blank=True, default=list, help_text='Promotions applied when final_price was calculated'),
+        ),
+        migrations.CreateModel(
+            name='DailyRoomStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('bookings_count', models.IntegerField(default=0)),
+                ('booked_hours', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('paid_bookings_count', models.IntegerField(default=0)),
+                ('paid_revenue', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('happy_hours_count', models.IntegerField(default=0)),
+                ('birthday_count', models.IntegerField(default=0)),
+                ('bonus_hour_count', models.IntegerField(default=0)),
+                ('bonus_accrued', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('bonus_redeemed', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('bathhouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='users.bathhouse')),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='users.room')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['bathhouse', 'date'], name='bookings_da_bathhou_6bb365_idx')],
+                'unique_together': {('room', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-19 12:09
+
+import bookings.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0007_booking_promotions_applied_dailyroomstats'),
+        ('users', '0007_roomphoto'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OccupancyHeatmap',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('matrix', models.JSONField(default=bookings.models.empty_heatmap)),
+                ('bookings_count', models.IntegerField(default=0)),
+                ('refreshed_until', models.DateTimeField(help_text='Bookings created up to this moment are included')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('bathhouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='heatmaps', to='users.bathhouse')),
+                ('room', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='heatmaps', to='users.room')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('bathhouse', 'room'), name='unique_room_heatmap'), models.UniqueConstraint(condition=models.Q(('room__isnull', True)), fields=('bathhouse',), name='unique_bathhouse_heatmap')],
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.4 on 2026-10-19 12:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0008_occupancyheatmap'),
+        ('users', '0007_roomphoto'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bonustransaction',
+            index=models.Index(fields=['created_at'], name='bonustx_created_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['start_time'], name='booking_start_time_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-19 12:13
+
+import bookings.utils
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+import django.db.models.functions.text
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0009_booking_start_time_idx'),
+        ('users', '0007_roomphoto'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='booking',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('name'), name='gin_trgm_ops'), name='booking_name_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(bookings.utils.DigitsOnly('phone'), name='gin_trgm_ops'), name='booking_phone_digits_trgm'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.4 on 2026-10-19 12:18
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0010_booking_search_trgm'),
+        ('users', '0007_roomphoto'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='booking',
+            name='booking_phone_digits_trgm',
+        ),
+        migrations.AddField(
+            model_name='bonusaccount',
+            name='phone_normalized',
+            field=models.CharField(blank=True, editable=False, help_text='E.164 form of phone, set on save', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='phone_normalized',
+            field=models.CharField(blank=True, editable=False, help_text='E.164 form of phone, set on save', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['phone_normalized'], name='booking_phone_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['phone_normalized', 'start_time'], name='booking_phone_start_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='bonusaccount',
+            constraint=models.UniqueConstraint(condition=models.Q(('phone_normalized', ''), _negated=True), fields=('bathhouse', 'phone_normalized'), name='unique_bonus_account_phone_normalized'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.4 on 2026-10-19 12:21
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0011_phone_normalized'),
+        ('users', '0007_roomphoto'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('phone', models.CharField(help_text='E.164, as Booking.phone_normalized', max_length=20)),
+                ('name', models.CharField(blank=True, help_text='Name on the latest booking', max_length=100)),
+                ('bookings_count', models.IntegerField(default=0)),
+                ('booked_hours', models.IntegerField(default=0)),
+                ('paid_bookings_count', models.IntegerField(default=0)),
+                ('total_spent', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('birthday_count', models.IntegerField(default=0)),
+                ('first_visit', models.DateTimeField(blank=True, null=True)),
+                ('last_visit', models.DateTimeField(blank=True, null=True)),
+                ('bonus_balance', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('bathhouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='customer_profiles', to='users.bathhouse')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['bathhouse', 'total_spent'], name='bookings_cu_bathhou_93dfee_idx'), models.Index(fields=['bathhouse', 'last_visit'], name='bookings_cu_bathhou_adf551_idx'), models.Index(fields=['bathhouse', 'bookings_count'], name='bookings_cu_bathhou_ebd887_idx')],
+                'unique_together': {('bathhouse', 'phone')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-19 13:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0013_idempotencyrecord'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='group_id',
+            field=models.UUIDField(blank=True, db_index=True, help_text='Shared by the bookings of one group booking (POST bookings/group/)', null=True),
+        ),
+    ]
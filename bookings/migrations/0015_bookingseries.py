@@ -0,0 +1,41 @@
+# Generated by Django 5.2.4 on 2026-10-19 13:29
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0014_booking_group_id'),
+        ('users', '0007_roomphoto'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingSeries',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=100)),
+                ('phone', models.CharField(max_length=20)),
+                ('start_time', models.DateTimeField(help_text='Start of the first occurrence')),
+                ('hours', models.PositiveIntegerField(default=1)),
+                ('interval_weeks', models.PositiveSmallIntegerField(default=1)),
+                ('until', models.DateField(help_text='Last local date an occurrence may fall on')),
+                ('on_conflict', models.CharField(choices=[('fail', 'Fail if any date is taken'), ('skip', 'Skip taken dates')], default='fail', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('cancelled_at', models.DateTimeField(blank=True, null=True)),
+                ('bathhouse', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='booking_series', to='users.bathhouse')),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='booking_series', to='users.room')),
+            ],
+            options={
+                'verbose_name_plural': 'booking series',
+            },
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='series',
+            field=models.ForeignKey(blank=True, help_text='Recurring series this booking is an occurrence of', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='bookings', to='bookings.bookingseries'),
+        ),
+    ]
@@ -0,0 +1,82 @@
+import logging
+
+from django.db import migrations
+
+from bookings.utils import normalize_phone
+
+CHUNK_SIZE = 1000
+
+log = logging.getLogger(__name__)
+
+
+def backfill_bookings(Booking):
+    """Returns the pks of bookings whose phone has no digits or too many; they keep ""."""
+    skipped = []
+    last_pk = None
+    while True:
+        pending = Booking.objects.filter(phone_normalized="").order_by("pk")
+        if last_pk is not None:
+            pending = pending.filter(pk__gt=last_pk)
+        rows = list(pending.values_list("pk", "phone")[:CHUNK_SIZE])
+        if not rows:
+            return skipped
+        last_pk = rows[-1][0]
+        bookings = []
+        for pk, phone in rows:
+            phone_normalized = normalize_phone(phone)
+            if phone_normalized:
+                bookings.append(Booking(pk=pk, phone_normalized=phone_normalized))
+            else:
+                skipped.append(pk)
+        Booking.objects.bulk_update(bookings, ["phone_normalized"])
+
+
+def backfill_accounts(BonusAccount, BonusTransaction):
+    """
+    Accounts of one bathhouse that turn out to share a phone are merged, as in
+    normalize_phones. Returns the pks of accounts whose phone could not be normalized.
+    """
+    skipped = []
+    for account in BonusAccount.objects.filter(phone_normalized="").order_by("pk").iterator(chunk_size=CHUNK_SIZE):
+        phone = normalize_phone(account.phone)
+        if not phone:
+            skipped.append(account.pk)
+            continue
+        target = BonusAccount.objects.filter(
+            bathhouse_id=account.bathhouse_id, phone_normalized=phone
+        ).first()
+        if target is None:
+            BonusAccount.objects.filter(pk=account.pk).update(phone_normalized=phone)
+            continue
+        BonusTransaction.objects.filter(account_id=account.pk).update(account_id=target.pk)
+        target.balance += account.balance
+        target.save(update_fields=["balance", "updated_at"])
+        account.delete()
+    return skipped
+
+
+def backfill(apps, schema_editor):
+    skipped_bookings = backfill_bookings(apps.get_model("bookings", "Booking"))
+    skipped_accounts = backfill_accounts(
+        apps.get_model("bookings", "BonusAccount"), apps.get_model("bookings", "BonusTransaction")
+    )
+    if skipped_bookings or skipped_accounts:
+        log.warning(
+            "Left phone_normalized empty for phones that are not valid E.164: bookings [%s], bonus accounts [%s]",
+            ", ".join(map(str, skipped_bookings)),
+            ", ".join(map(str, skipped_accounts)),
+        )
+    # Customer profiles, which skipped every booking without a normalized
+    # phone, are rebuilt by 0017 once their columns have their current names
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0015_bookingseries'),
+        ('users', '0007_roomphoto'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
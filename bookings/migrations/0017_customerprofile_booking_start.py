@@ -0,0 +1,39 @@
+# Generated by Django 5.2.4 on 2026-10-19 14:03
+
+from django.db import migrations, models
+
+from bookings.services.customers import rebuild as rebuild_customer_profiles
+
+
+def rebuild(apps, schema_editor):
+    rebuild_customer_profiles(apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0016_backfill_phone_normalized'),
+        ('users', '0007_roomphoto'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='customerprofile',
+            name='bookings_cu_bathhou_adf551_idx',
+        ),
+        migrations.RenameField(
+            model_name='customerprofile',
+            old_name='first_visit',
+            new_name='first_booking_start',
+        ),
+        migrations.RenameField(
+            model_name='customerprofile',
+            old_name='last_visit',
+            new_name='last_booking_start',
+        ),
+        migrations.AddIndex(
+            model_name='customerprofile',
+            index=models.Index(fields=['bathhouse', 'last_booking_start'], name='bookings_cu_bathhou_5b39cf_idx'),
+        ),
+        migrations.RunPython(rebuild, migrations.RunPython.noop),
+    ]
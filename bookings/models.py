@@ -1,8 +1,16 @@
+import logging
 from datetime import timedelta
+from sauna.logs import pricing_trace_enabled
 from users.models import Bathhouse, Room, ExtraItem
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.db import models
+from django.db.models.functions import Upper
+from .utils import normalize_phone
 import uuid
 from decimal import Decimal
+import pytz
+
+log = logging.getLogger(__name__)
 
 CONFIRMATION_TIMEOUT_MINUTES = 10
 
@@ -17,11 +25,13 @@ class Booking(models.Model):
     room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name="bookings")
     name = models.CharField(max_length=100)
     phone = models.CharField(max_length=20)
+    phone_normalized = models.CharField(
+        max_length=20, blank=True, editable=False, help_text="E.164 form of phone, set on save"
+    )
     start_time = models.DateTimeField()
     hours = models.PositiveIntegerField(default=1)
     # TODO: For testing purposes, this should be set to False in production
     confirmed = models.BooleanField(default=True)
-    sms_code = models.CharField(max_length=10, blank=True, null=True)
     is_paid = models.BooleanField(default=False, help_text="Whether the booking has been paid")
     created_at = models.DateTimeField(auto_now_add=True)
     is_birthday = models.BooleanField(default=False, help_text="Customer confirmed birthday")
@@ -32,11 +42,77 @@ class Booking(models.Model):
         blank=True,
         help_text="The final calculated price at the time of booking creation"
     )
+    promotions_applied = models.JSONField(
+        default=list,
+        blank=True,
+        help_text="Promotions applied when final_price was calculated"
+    )
+    group_id = models.UUIDField(
+        null=True,
+        blank=True,
+        db_index=True,
+        help_text="Shared by the bookings of one group booking (POST bookings/group/)",
+    )
+    series = models.ForeignKey(
+        "BookingSeries",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="bookings",
+        help_text="Recurring series this booking is an occurrence of",
+    )
 
-    def calculate_final_price(self):
+    # Fields whose last saved values are kept on the instance so that
+    # post_save / post_delete can move the booking between daily rollups
+    # and customer profiles.
+    TRACKED_FIELDS = (
+        "bathhouse_id",
+        "room_id",
+        "start_time",
+        "hours",
+        "final_price",
+        "is_paid",
+        "promotions_applied",
+        "phone_normalized",
+        "is_birthday",
+        "name",
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["start_time"], name="booking_start_time_idx"),
+            # Serve name__icontains (UPPER(name) LIKE UPPER('%...%')) and the
+            # partial phone search in services/search.py
+            GinIndex(OpClass(Upper("name"), name="gin_trgm_ops"), name="booking_name_trgm"),
+            GinIndex(
+                fields=["phone_normalized"], opclasses=["gin_trgm_ops"], name="booking_phone_trgm"
+            ),
+            models.Index(fields=["phone_normalized", "start_time"], name="booking_phone_start_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.phone_normalized = normalize_phone(self.phone)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "phone" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "phone_normalized"}
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {
+            name: value
+            for name, value in zip(field_names, values)
+            if name in cls.TRACKED_FIELDS
+        }
+        return instance
+
+    def calculate_final_price(self, extra_items=None):
         """
         Calculate the final price for this booking.
         Applies promotions: Happy Hours, Birthday, and Bonus Hour (+1 hour) per rules.
+        `extra_items` prices these ExtraItems (with their items loaded) instead
+        of the saved ones, for a booking that is not saved yet.
         """
         # Base room price (may be adjusted by Bonus Hour)
         hours_to_charge = self.hours
@@ -50,9 +126,6 @@ class Booking(models.Model):
         if (getattr(self.bathhouse, "happy_hours_enabled", False) and 
             hh_pct > 0 and self.bathhouse.happy_hours_start_time and self.bathhouse.happy_hours_end_time):
             # Convert UTC start_time to local time (assuming UTC+6 for Kazakhstan)
-            from django.utils import timezone
-            import pytz
-            
             # Convert to local timezone (UTC+6 for Kazakhstan)
             local_tz = pytz.timezone('Asia/Almaty')
             start_time_local = self.start_time.astimezone(local_tz)
@@ -62,10 +135,6 @@ class Booking(models.Model):
             hh_end = self.bathhouse.happy_hours_end_time
             hh_days = getattr(self.bathhouse, "happy_hours_days", []) or []
             
-            print(f"DEBUG: Time comparison - Start local: {start_time_local.time()}, End local: {end_time_local.time()}, HH Start: {hh_start}, HH End: {hh_end}")
-            print(f"DEBUG: Date comparison - Start date: {start_time_local.date()}, End date: {end_time_local.date()}")
-            print(f"DEBUG: Day comparison - Weekday: {start_time_local.strftime('%A').upper()}, HH Days: {hh_days}")
-            
             # Entire booking must be within same-day window
             # Compare by time component
             if (
@@ -75,12 +144,10 @@ class Booking(models.Model):
                 (not hh_days or start_time_local.strftime("%A").upper() in hh_days)
             ):
                 happy_hours_applies = True
-                print(f"DEBUG: Happy Hours applies! Start: {start_time_local.time()}, End: {end_time_local.time()}, HH Start: {hh_start}, HH End: {hh_end}")
 
         # Bonus Hour (+1) only if NOT happy hours
         bonus_hour_applies = False
         awarded_hours = 0
-        print(f"DEBUG: happy_hours_applies = {happy_hours_applies}")
         if (not happy_hours_applies and getattr(self.bathhouse, "bonus_hour_enabled", False)):
             min_hours = getattr(self.bathhouse, "min_hours_for_bonus", 0) or 0
             days = getattr(self.bathhouse, "bonus_hour_days", []) or []
@@ -92,22 +159,19 @@ class Booking(models.Model):
                 start_time_local = self.start_time.astimezone(local_tz)
             
             weekday_str = start_time_local.strftime("%A").upper()
-            print(f"DEBUG: Checking Bonus Hour - enabled: {getattr(self.bathhouse, 'bonus_hour_enabled', False)}, min_hours: {min_hours}, hours: {self.hours}, days: {days}, weekday: {weekday_str}")
             if award > 0 and self.hours >= min_hours and weekday_str in days:
                 bonus_hour_applies = True
                 awarded_hours = int(award)
                 hours_to_charge = max(0, self.hours - awarded_hours)
-                print(f"DEBUG: Bonus Hour applied! Awarded: {awarded_hours} hours, hours_to_charge: {hours_to_charge}")
-        else:
-            print(f"DEBUG: Bonus Hour NOT applied - happy_hours_applies: {happy_hours_applies}, bonus_enabled: {getattr(self.bathhouse, 'bonus_hour_enabled', False)}")
 
         # Room price based on possibly reduced chargeable hours
         room_price = self.room.price_per_hour * hours_to_charge
         
         # Add extra items price
+        if extra_items is None:
+            extra_items = self.extra_items.all()
         extra_items_price = sum(
-            extra_item.item.price * extra_item.quantity
-            for extra_item in self.extra_items.all()
+            extra_item.item.price * extra_item.quantity for extra_item in extra_items
         )
         subtotal = room_price + extra_items_price
 
@@ -144,6 +208,36 @@ class Booking(models.Model):
         # Temporarily annotate the instance for serializer representation
         self._promotions_applied = promotions_applied
 
+        if pricing_trace_enabled():
+            log.info(
+                "Priced booking %s: %s h (%s charged) x %s + extras %s = %s, total %s",
+                self.id,
+                self.hours,
+                hours_to_charge,
+                self.room.price_per_hour,
+                extra_items_price,
+                subtotal,
+                total,
+                extra={
+                    "pricing": {
+                        "booking": self.id,
+                        "bathhouse": self.bathhouse_id,
+                        "room": self.room_id,
+                        "start_time": self.start_time,
+                        "hours": self.hours,
+                        "hours_charged": hours_to_charge,
+                        "room_price": room_price,
+                        "extras_price": extra_items_price,
+                        "subtotal": subtotal,
+                        "total": total,
+                        "happy_hours": happy_hours_applies,
+                        "bonus_hour": bonus_hour_applies,
+                        "birthday": bool(self.is_birthday),
+                        "promotions": promotions_applied,
+                    }
+                },
+            )
+
         return total
     
     def get_final_price(self):
@@ -158,18 +252,200 @@ class Booking(models.Model):
     def __str__(self):
         return f"Booking by {self.name} at {self.bathhouse.name} from {self.start_time} to {self.start_time + timedelta(hours=self.hours)}"
 
+    @classmethod
+    def created_together(cls, booking_id):
+        """
+        Bookings created in one request with `booking_id`: its group booking
+        or series, otherwise just the booking itself. Confirmed and cleaned up
+        together.
+        """
+        row = cls.objects.filter(pk=booking_id).values("group_id", "series_id").first()
+        if row and row["group_id"]:
+            return cls.objects.filter(group_id=row["group_id"])
+        if row and row["series_id"]:
+            return cls.objects.filter(series_id=row["series_id"])
+        return cls.objects.filter(pk=booking_id)
+
+
+class BookingSeries(models.Model):
+    """
+    A recurring booking: the same room and local time every `interval_weeks`
+    weeks from start_time until `until`. Each occurrence is a Booking.
+    """
+
+    ON_CONFLICT_FAIL = "fail"
+    ON_CONFLICT_SKIP = "skip"
+    ON_CONFLICT_CHOICES = [
+        (ON_CONFLICT_FAIL, "Fail if any date is taken"),
+        (ON_CONFLICT_SKIP, "Skip taken dates"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    bathhouse = models.ForeignKey(Bathhouse, on_delete=models.CASCADE, related_name="booking_series")
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name="booking_series")
+    name = models.CharField(max_length=100)
+    phone = models.CharField(max_length=20)
+    start_time = models.DateTimeField(help_text="Start of the first occurrence")
+    hours = models.PositiveIntegerField(default=1)
+    interval_weeks = models.PositiveSmallIntegerField(default=1)
+    until = models.DateField(help_text="Last local date an occurrence may fall on")
+    on_conflict = models.CharField(max_length=10, choices=ON_CONFLICT_CHOICES, default=ON_CONFLICT_FAIL)
+    created_at = models.DateTimeField(auto_now_add=True)
+    cancelled_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = "booking series"
+
+    def occurrence_starts(self):
+        """Start times of all occurrences, keeping the local (Asia/Almaty) time of day."""
+        local_tz = pytz.timezone("Asia/Almaty")
+        first = self.start_time.astimezone(local_tz).replace(tzinfo=None)
+        starts = []
+        step = timedelta(weeks=self.interval_weeks)
+        current = first
+        while current.date() <= self.until:
+            starts.append(local_tz.localize(current))
+            current += step
+        return starts
+
+    def __str__(self):
+        return f"Series of {self.name} in room {self.room_id} from {self.start_time:%Y-%m-%d} to {self.until}"
+
+
+class DailyRoomStats(models.Model):
+    """
+    Per-room daily rollup (Asia/Almaty calendar days) kept up to date by
+    bookings.signals. Rebuild with `manage.py rebuild_daily_stats`.
+    """
+
+    bathhouse = models.ForeignKey(
+        Bathhouse, on_delete=models.CASCADE, related_name="daily_stats"
+    )
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name="daily_stats")
+    date = models.DateField()
+    bookings_count = models.IntegerField(default=0)
+    booked_hours = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+    paid_bookings_count = models.IntegerField(default=0)
+    paid_revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+    happy_hours_count = models.IntegerField(default=0)
+    birthday_count = models.IntegerField(default=0)
+    bonus_hour_count = models.IntegerField(default=0)
+    bonus_accrued = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+    bonus_redeemed = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("room", "date")
+        indexes = [models.Index(fields=["bathhouse", "date"])]
+
+    def __str__(self):
+        return f"Room {self.room_id} @ {self.date}: {self.bookings_count} bookings, {self.revenue}"
+
+
+def empty_heatmap():
+    return [[0] * 24 for _ in range(7)]
+
+
+class OccupancyHeatmap(models.Model):
+    """
+    Booked hours by local weekday (0 = Monday) x hour, per room and per
+    bathhouse (room is NULL). Refreshed by bookings.tasks.refresh_occupancy_heatmaps.
+    """
+
+    bathhouse = models.ForeignKey(
+        Bathhouse, on_delete=models.CASCADE, related_name="heatmaps"
+    )
+    room = models.ForeignKey(
+        Room, on_delete=models.CASCADE, related_name="heatmaps", null=True, blank=True
+    )
+    matrix = models.JSONField(default=empty_heatmap)
+    bookings_count = models.IntegerField(default=0)
+    refreshed_until = models.DateTimeField(
+        help_text="Bookings created up to this moment are included"
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["bathhouse", "room"], name="unique_room_heatmap"
+            ),
+            models.UniqueConstraint(
+                fields=["bathhouse"],
+                condition=models.Q(room__isnull=True),
+                name="unique_bathhouse_heatmap",
+            ),
+        ]
+
+    def __str__(self):
+        return f"Heatmap {self.bathhouse_id}/{self.room_id or '*'} until {self.refreshed_until}"
+
+
+class CustomerProfile(models.Model):
+    """
+    Per-bathhouse customer aggregates keyed by normalized phone. Kept up to
+    date from booking and bonus account changes by services/customers.py;
+    `manage.py rebuild_customer_profiles` recomputes them from scratch.
+    """
+
+    bathhouse = models.ForeignKey(
+        Bathhouse, on_delete=models.CASCADE, related_name="customer_profiles"
+    )
+    phone = models.CharField(max_length=20, help_text="E.164, as Booking.phone_normalized")
+    name = models.CharField(max_length=100, blank=True, help_text="Name on the latest booking")
+    bookings_count = models.IntegerField(default=0)
+    booked_hours = models.IntegerField(default=0)
+    paid_bookings_count = models.IntegerField(default=0)
+    total_spent = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+    birthday_count = models.IntegerField(default=0)
+    first_booking_start = models.DateTimeField(null=True, blank=True)
+    last_booking_start = models.DateTimeField(null=True, blank=True)
+    bonus_balance = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal("0.00"))
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("bathhouse", "phone")
+        indexes = [
+            models.Index(fields=["bathhouse", "total_spent"]),
+            models.Index(fields=["bathhouse", "last_booking_start"]),
+            models.Index(fields=["bathhouse", "bookings_count"]),
+        ]
+
+    def __str__(self):
+        return f"{self.phone} @ {self.bathhouse_id}: {self.bookings_count} bookings, {self.total_spent}"
+
 
 class BonusAccount(models.Model):
     bathhouse = models.ForeignKey(
         Bathhouse, on_delete=models.CASCADE, related_name="bonus_accounts"
     )
     phone = models.CharField(max_length=20)
+    phone_normalized = models.CharField(
+        max_length=20, blank=True, editable=False, help_text="E.164 form of phone, set on save"
+    )
     balance = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal("0.00"))
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ("bathhouse", "phone")
+        constraints = [
+            # Rows created before phone_normalized existed keep "" until
+            # migration 0016 (or `manage.py normalize_phones`) fills them in
+            models.UniqueConstraint(
+                fields=["bathhouse", "phone_normalized"],
+                condition=~models.Q(phone_normalized=""),
+                name="unique_bonus_account_phone_normalized",
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.phone_normalized = normalize_phone(self.phone)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "phone" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "phone_normalized"}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.phone} @ {self.bathhouse.name}: {self.balance}"
@@ -193,10 +469,37 @@ class BonusTransaction(models.Model):
     amount = models.DecimalField(max_digits=12, decimal_places=2)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=["created_at"], name="bonustx_created_at_idx")]
+
     def __str__(self):
         return f"{self.type} {self.amount} for {self.account.phone} ({self.account.bathhouse_id})"
 
 
+class IdempotencyRecord(models.Model):
+    """
+    Responses to requests sent with an Idempotency-Key, used while Redis is
+    unavailable (see services/idempotency.py). A row without a status is a
+    request still in progress.
+    """
+
+    scope = models.CharField(max_length=150, help_text="Endpoint and client the key belongs to")
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64, help_text="SHA-256 of the request")
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["scope", "key"], name="unique_idempotency_key"),
+        ]
+
+    def __str__(self):
+        return f"{self.scope} {self.key} -> {self.status_code or 'in progress'}"
+
+
 def accrue_bonus_for_booking(booking: "Booking"):
     """Accrue bonus based on configured tiered percentages and booking final price.
 
@@ -231,8 +534,15 @@ def accrue_bonus_for_booking(booking: "Booking"):
 
     amount = (final_price * applicable_percent / Decimal("100")).quantize(Decimal("0.01"))
 
+    phone_normalized = normalize_phone(booking.phone)
+    if not phone_normalized:
+        # Accounts without a phone are not unique, there is nobody to credit
+        return None
+
     account, _ = BonusAccount.objects.get_or_create(
-        bathhouse=booking.bathhouse, phone=booking.phone
+        bathhouse=booking.bathhouse,
+        phone_normalized=phone_normalized,
+        defaults={"phone": booking.phone},
     )
 
     # Prevent duplicate accruals for the same booking
@@ -1,13 +1,52 @@
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import (
+    BooleanField,
+    DateTimeField,
+    DurationField,
+    ExpressionWrapper,
+    F,
+    Prefetch,
+    Q,
+    Value,
+    prefetch_related_objects,
+)
 from rest_framework import serializers
-from .models import CONFIRMATION_TIMEOUT_MINUTES, Booking
-from users.serializers import ExtraItemInputSerializer, ExtraItemSerializer
-from users.models import BathhouseItem, ExtraItem, Room
+from .models import CONFIRMATION_TIMEOUT_MINUTES, Booking, BookingSeries, CustomerProfile
+from users.serializers import (
+    ExtraItemInputSerializer,
+    ExtraItemSerializer,
+    PrefetchedPrimaryKeyField,
+    prefetch_related_field,
+)
+from users.models import Bathhouse, BathhouseItem, ExtraItem, Room
 from datetime import timedelta
 from django.utils import timezone
 from datetime import timezone as dt_timezone
-from .utils import generate_random_4_digit_number
-from .tasks import delete_unconfirmed_booking
+from .services import holds, otp
+from .services import customers, rollups
+from .services.reminders import schedule_booking_reminders
+from .tasks import (
+    delete_unconfirmed_booking,
+    notify_new_booking,
+    notify_new_group_booking,
+    notify_new_series,
+)
+from .utils import normalize_phone
+import logging
 import pytz
+import uuid
+
+log = logging.getLogger(__name__)
+
+
+def validate_phone_number(value):
+    """
+    Phones are looked up by normalize_phone(); one without digits would match
+    legacy rows, and one longer than E.164 allows would not fit phone_normalized.
+    """
+    if not normalize_phone(value):
+        raise serializers.ValidationError("Введите корректный номер телефона.", code="invalid_phone")
+    return value
 
 
 class BookingSerializer(serializers.ModelSerializer):
@@ -15,10 +54,25 @@ class BookingSerializer(serializers.ModelSerializer):
         many=True, write_only=True, required=False
     )
     extra_items = ExtraItemSerializer(many=True, read_only=True)
+    # From POST /holds/: the customer's own hold does not block the booking
+    hold_id = serializers.CharField(write_only=True, required=False, max_length=32)
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """Everything to_representation() and get_final_price() read, in three queries."""
+        return queryset.select_related("bathhouse", "room").prefetch_related(
+            Prefetch("extra_items", queryset=ExtraItem.objects.select_related("item"))
+        )
 
     class Meta:
         model = Booking
         fields = "__all__"
+        read_only_fields = ["promotions_applied", "group_id", "series"]
+        extra_kwargs = {
+            # validate() and the price need the room's bathhouse
+            "room": {"queryset": Room.objects.select_related("bathhouse")},
+            "phone": {"validators": [validate_phone_number]},
+        }
 
     def validate(self, data):
         room = data.get("room")
@@ -27,29 +81,69 @@ class BookingSerializer(serializers.ModelSerializer):
         phone = data.get("phone")
 
         if not all([room, start_time, hours, phone]):
-            raise serializers.ValidationError("Все поля обязательны для заполнения.")
+            raise serializers.ValidationError(
+                "Все поля обязательны для заполнения.", code="missing_fields"
+            )
 
+        self.validate_slot(room, start_time, hours)
+
+        if self.instance is not None:
+            # New bookings are checked in create(), under the room lock
+            self.check_availability(room, start_time, hours, phone)
+        elif holds.held_by_others(
+            room.id, start_time, start_time + timedelta(hours=hours), data.get("hold_id")
+        ):
+            raise serializers.ValidationError(
+                "Это время сейчас оформляет другой клиент. Попробуйте позже.", code="held"
+            )
+
+        extra_items_data = data.get("extra_items_data", [])
+        if extra_items_data:
+            for item_data in extra_items_data:
+                item_instance = item_data.get("item")
+                if not item_instance:
+                    raise serializers.ValidationError(
+                        "Каждый товар должен быть указан с ID.", code="invalid_extra_item"
+                    )
+                if item_instance.bathhouse_id != room.bathhouse_id:
+                    raise serializers.ValidationError(
+                        "Товары должны принадлежать той же бане, что и комната.",
+                        code="invalid_extra_item",
+                    )
+
+        return data
+
+    MAX_DAYS_AHEAD = 15
+
+    @staticmethod
+    def validate_slot(room, start_time, hours, max_days_ahead=MAX_DAYS_AHEAD):
+        """Checks of a single (room, start_time, hours) that need no queries."""
         now = timezone.now()
 
         if start_time < now:
-            raise serializers.ValidationError("Нельзя бронировать на прошедшее время.")
+            raise serializers.ValidationError(
+                "Нельзя бронировать на прошедшее время.", code="past_start"
+            )
 
-        # Проверяем, что нельзя бронировать более чем за 15 дней
-        max_days_ahead = 15
+        # Проверяем, что нельзя бронировать более чем за 15 дней (серии — дальше)
         latest_allowed = now + timedelta(days=max_days_ahead)
         if start_time > latest_allowed:
             raise serializers.ValidationError(
-                f"Нельзя бронировать более чем за {max_days_ahead} дня вперёд."
+                f"Нельзя бронировать более чем за {max_days_ahead} дня вперёд.",
+                code="too_far_ahead",
             )
 
         if not isinstance(hours, int) or hours <= 0:
             raise serializers.ValidationError(
-                "Количество часов должно быть положительным целым числом."
+                "Количество часов должно быть положительным целым числом.",
+                code="invalid_hours",
             )
 
         bathhouse = room.bathhouse
         if not bathhouse:
-            raise serializers.ValidationError("Комната не принадлежит ни одной бане.")
+            raise serializers.ValidationError(
+                "Комната не принадлежит ни одной бане.", code="room_without_bathhouse"
+            )
 
         if not bathhouse.is_24_hours:
             # Convert UTC start_time to local time (UTC+5)
@@ -63,82 +157,142 @@ class BookingSerializer(serializers.ModelSerializer):
             if work_start < work_end:
                 if not (work_start <= booking_time <= work_end):
                     raise serializers.ValidationError(
-                        "Бронь должна быть в рабочее время бани."
+                        "Бронь должна быть в рабочее время бани.",
+                        code="outside_working_hours",
                     )
             else:  # Overnight working hours
                 if not (booking_time >= work_start or booking_time <= work_end):
                     raise serializers.ValidationError(
-                        "Бронь должна быть в рабочее время бани."
+                        "Бронь должна быть в рабочее время бани.",
+                        code="outside_working_hours",
                     )
 
-        new_end_time = start_time + timedelta(hours=hours)
+    @staticmethod
+    def check_availability(room, start_time, hours, phone=None):
+        """
+        One query for both conflicts: a booking of the room overlapping the
+        new one, or an unfinished booking on the same phone overlapping it
+        (skipped without a phone).
+        """
+        BookingSerializer.check_slots_availability([(room, start_time, hours)], phone)
 
+    @staticmethod
+    def check_slots_availability(slots, phone=None):
+        """check_availability() for several (room, start_time, hours) at once, still in one query."""
+        now = timezone.now()
+        end_time = ExpressionWrapper(
+            F("start_time") + F("hours") * Value(timedelta(hours=1), output_field=DurationField()),
+            output_field=DateTimeField(),
+        )
         # Проверяем пересечение с другими бронями в комнате
-        for booking in Booking.objects.filter(room=room):
-            existing_start = booking.start_time
-            existing_end = booking.start_time + timedelta(hours=booking.hours)
-
-            if start_time < existing_end and new_end_time > existing_start:
-                raise serializers.ValidationError(
-                    "Это время уже занято для этой комнаты."
-                )
-
-        # Проверяем активные бронирования по телефону
-        active_bookings = Booking.objects.filter(
-            phone=phone, start_time__lt=new_end_time
-        ).exclude(start_time__gte=new_end_time)
-
-        for booking in active_bookings:
-            booking_end = booking.start_time + timedelta(hours=booking.hours)
-            if booking_end > now:
-                raise serializers.ValidationError(
-                    "У вас уже есть активная бронь, пока она не закончится — нельзя бронировать новую."
-                )
+        overlap = Q()
+        latest_end_time = None
+        for room, start_time, hours in slots:
+            new_end_time = start_time + timedelta(hours=hours)
+            overlap |= Q(room=room, start_time__lt=new_end_time, end_time__gt=start_time)
+            latest_end_time = max(latest_end_time or new_end_time, new_end_time)
+        # Проверяем активные бронирования по телефону ("" would match legacy rows)
+        phone_normalized = normalize_phone(phone)
+        active = Q(
+            phone_normalized=phone_normalized,
+            start_time__lt=latest_end_time,
+            end_time__gt=now,
+        ) if phone_normalized else Q(pk__in=[])
 
-        extra_items_data = data.get("extra_items_data", [])
-        # print(extra_items_data)
-        if extra_items_data:
-            for item_data in extra_items_data:
-                # print(item_data)
-                item_instance = item_data.get("item")
-                if not item_instance:
-                    raise serializers.ValidationError(
-                        "Каждый товар должен быть указан с ID."
-                    )
-                if item_instance.bathhouse != bathhouse:
-                    raise serializers.ValidationError(
-                        "Товары должны принадлежать той же бане, что и комната."
-                    )
+        # Availability is always checked on the primary: a replica may lag
+        # behind a booking that was just made (see sauna/db_router.py)
+        conflict = (
+            Booking.objects.using(DEFAULT_DB_ALIAS)
+            .alias(end_time=end_time)
+            .filter(overlap | active)
+            .annotate(is_overlap=ExpressionWrapper(overlap, output_field=BooleanField()))
+            .order_by("-is_overlap")
+            .values_list("is_overlap", flat=True)
+            .first()
+        )
+        if conflict:
+            raise serializers.ValidationError(
+                "Это время уже занято для этой комнаты.", code="overlap"
+            )
+        if conflict is not None:
+            raise serializers.ValidationError(
+                "У вас уже есть активная бронь, пока она не закончится — нельзя бронировать новую.",
+                code="active_booking",
+            )
 
-        return data
+    @staticmethod
+    def booked_ranges(room, ranges, phone=None):
+        """
+        (start, end) of the bookings that overlap any of `ranges`, in one
+        query on the primary: the room's, and with `phone` also the
+        customer's own bookings in any room.
+        """
+        end_time = ExpressionWrapper(
+            F("start_time") + F("hours") * Value(timedelta(hours=1), output_field=DurationField()),
+            output_field=DateTimeField(),
+        )
+        overlap = Q()
+        for start_time, new_end_time in ranges:
+            overlap |= Q(start_time__lt=new_end_time, end_time__gt=start_time)
+        owner = Q(room=room)
+        phone_normalized = normalize_phone(phone)
+        if phone_normalized:
+            owner |= Q(phone_normalized=phone_normalized)
+        return list(
+            Booking.objects.using(DEFAULT_DB_ALIAS)
+            .filter(owner)
+            .annotate(end_time=end_time)
+            .filter(overlap)
+            .values_list("start_time", "end_time")
+        )
 
     def create(self, validated_data):
         extra_items_data = validated_data.pop("extra_items_data", [])
-        instance = Booking.objects.create(**validated_data)
-
-        for item_data in extra_items_data:
-            quantity = item_data["quantity"]
+        hold_id = validated_data.pop("hold_id", None)
+        instance = Booking(**validated_data)
+        extra_items = [
+            ExtraItem(booking=instance, item=item_data["item"], quantity=item_data["quantity"])
+            for item_data in extra_items_data
+        ]
+        # Priced before anything is written, so the booking is inserted once
+        instance.final_price = instance.calculate_final_price(extra_items)
+        instance.promotions_applied = instance._promotions_applied
 
-            bathhouse_item = item_data["item"]
-
-            # Создаём ExtraItem
-            ExtraItem.objects.create(
-                item=bathhouse_item, quantity=quantity, booking=instance
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            # Bookings of the same room are created one at a time: the check
+            # below sees every booking committed before this lock was granted
+            Room.objects.select_for_update().only("id").get(pk=instance.room_id)
+            self.check_availability(
+                instance.room, instance.start_time, instance.hours, instance.phone
             )
+            instance.save(force_insert=True)
+            ExtraItem.objects.bulk_create(extra_items)
+            transaction.on_commit(lambda: self.booking_created(instance, hold_id))
 
-        # Calculate and save the final price
-        instance.final_price = instance.calculate_final_price()
+        # What to_representation() reads, in one query
+        prefetch_related_objects(
+            [instance], Prefetch("extra_items", queryset=ExtraItem.objects.select_related("item"))
+        )
+        return instance
 
-        sms_code = generate_random_4_digit_number()
-        print(sms_code)
-        instance.sms_code = sms_code
-        instance.save()
+    @staticmethod
+    def booking_created(instance, hold_id=None):
+        """Side effects of a new booking, run once it is committed."""
+        if hold_id:
+            try:
+                holds.release(hold_id)
+            except holds.HoldError:
+                pass  # expires on its own
+        if not instance.confirmed:
+            try:
+                otp.issue_code(otp.PURPOSE_CONFIRM, instance.id, instance.phone)
+            except otp.OTPError:
+                log.warning("Could not send confirmation code for booking %s", instance.id)
 
         delete_unconfirmed_booking.apply_async(
             (instance.id,), countdown=60 * CONFIRMATION_TIMEOUT_MINUTES
         )
-
-        return instance
+        notify_new_booking.delay(instance.id)
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
@@ -165,3 +319,361 @@ class BookingSerializer(serializers.ModelSerializer):
             representation["promotions_applied"] = promotions
 
         return representation
+
+
+class SlotHoldSerializer(serializers.Serializer):
+    room = serializers.PrimaryKeyRelatedField(queryset=Room.objects.select_related("bathhouse"))
+    start_time = serializers.DateTimeField()
+    hours = serializers.IntegerField(min_value=1)
+    # Holds are throttled per phone as well as per IP (see SlotHoldView)
+    phone = serializers.CharField(max_length=20, validators=[validate_phone_number])
+
+    def validate(self, data):
+        # Only slots that could be booked can be held
+        BookingSerializer.validate_slot(data["room"], data["start_time"], data["hours"])
+        BookingSerializer.check_availability(
+            data["room"], data["start_time"], data["hours"], data["phone"]
+        )
+        return data
+
+
+class GroupSlotListSerializer(serializers.ListSerializer):
+    """Loads the rooms and extra items of all slots in two queries."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            prefetch_related_field(self.child.fields["room"], data)
+            items = self.child.fields["extra_items_data"].child.fields["item"]
+            prefetch_related_field(
+                items,
+                [
+                    entry
+                    for slot in data
+                    if isinstance(slot, dict) and isinstance(slot.get("extra_items_data"), list)
+                    for entry in slot["extra_items_data"]
+                ],
+            )
+        return super().to_internal_value(data)
+
+
+class GroupSlotSerializer(serializers.Serializer):
+    room = PrefetchedPrimaryKeyField(queryset=Room.objects.select_related("bathhouse"))
+    start_time = serializers.DateTimeField()
+    hours = serializers.IntegerField(min_value=1)
+    extra_items_data = ExtraItemInputSerializer(many=True, required=False)
+    hold_id = serializers.CharField(required=False, max_length=32)
+
+    class Meta:
+        list_serializer_class = GroupSlotListSerializer
+
+    def validate(self, data):
+        BookingSerializer.validate_slot(data["room"], data["start_time"], data["hours"])
+        return data
+
+
+class GroupBookingSerializer(serializers.Serializer):
+    """
+    Several rooms of one bathhouse booked by one customer, all or nothing:
+    POST bookings/group/. The slots are checked against existing bookings
+    in one query and created in one transaction.
+    """
+
+    MAX_SLOTS = 10
+
+    bathhouse = serializers.PrimaryKeyRelatedField(queryset=Bathhouse.objects.all())
+    name = serializers.CharField(max_length=100)
+    phone = serializers.CharField(max_length=20, validators=[validate_phone_number])
+    is_birthday = serializers.BooleanField(default=False)
+    slots = GroupSlotSerializer(many=True, min_length=1, max_length=MAX_SLOTS)
+
+    def validate(self, data):
+        bathhouse = data["bathhouse"]
+        slots = data["slots"]
+        for slot in slots:
+            if slot["room"].bathhouse_id != bathhouse.id:
+                raise serializers.ValidationError(
+                    "Все комнаты должны принадлежать одной бане.", code="invalid_room"
+                )
+            for item_data in slot.get("extra_items_data", []):
+                if item_data["item"].bathhouse_id != bathhouse.id:
+                    raise serializers.ValidationError(
+                        "Товары должны принадлежать той же бане, что и комната.",
+                        code="invalid_extra_item",
+                    )
+
+        ranges = sorted(
+            (slot["room"].id, slot["start_time"], slot["start_time"] + timedelta(hours=slot["hours"]))
+            for slot in slots
+        )
+        for (room_id, _, end_time), (next_room_id, next_start_time, _) in zip(ranges, ranges[1:]):
+            if room_id == next_room_id and next_start_time < end_time:
+                raise serializers.ValidationError(
+                    "Слоты одной комнаты в заявке пересекаются.", code="overlap"
+                )
+
+        for slot in slots:
+            start_time = slot["start_time"]
+            end_time = start_time + timedelta(hours=slot["hours"])
+            if holds.held_by_others(slot["room"].id, start_time, end_time, slot.get("hold_id")):
+                raise serializers.ValidationError(
+                    "Это время сейчас оформляет другой клиент. Попробуйте позже.", code="held"
+                )
+        return data
+
+    def create(self, validated_data):
+        group_id = uuid.uuid4()
+        bookings, extra_items, hold_ids = [], [], []
+        for slot in validated_data["slots"]:
+            booking = Booking(
+                bathhouse=validated_data["bathhouse"],
+                room=slot["room"],
+                name=validated_data["name"],
+                phone=validated_data["phone"],
+                is_birthday=validated_data["is_birthday"],
+                start_time=slot["start_time"],
+                hours=slot["hours"],
+                group_id=group_id,
+            )
+            booking_extras = [
+                ExtraItem(booking=booking, item=item_data["item"], quantity=item_data["quantity"])
+                for item_data in slot.get("extra_items_data", [])
+            ]
+            booking.final_price = booking.calculate_final_price(booking_extras)
+            booking.promotions_applied = booking._promotions_applied
+            bookings.append(booking)
+            extra_items.extend(booking_extras)
+            if slot.get("hold_id"):
+                hold_ids.append(slot["hold_id"])
+
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            # Rooms are locked in id order, so two groups sharing rooms cannot deadlock
+            room_ids = sorted({booking.room_id for booking in bookings})
+            list(Room.objects.select_for_update().filter(pk__in=room_ids).order_by("pk").only("id"))
+            BookingSerializer.check_slots_availability(
+                [(booking.room, booking.start_time, booking.hours) for booking in bookings],
+                validated_data["phone"],
+            )
+            for booking in bookings:
+                booking.save(force_insert=True)
+            ExtraItem.objects.bulk_create(extra_items)
+            transaction.on_commit(lambda: self.group_created(bookings, hold_ids))
+
+        prefetch_related_objects(
+            bookings, Prefetch("extra_items", queryset=ExtraItem.objects.select_related("item"))
+        )
+        return bookings
+
+    @staticmethod
+    def group_created(bookings, hold_ids):
+        """booking_created() for a group: one code, one cleanup task and one notification."""
+        for hold_id in hold_ids:
+            try:
+                holds.release(hold_id)
+            except holds.HoldError:
+                pass  # expires on its own
+        lead = bookings[0]
+        if not lead.confirmed:
+            # Confirming the first booking confirms the group (see confirm_booking_sms)
+            try:
+                otp.issue_code(otp.PURPOSE_CONFIRM, lead.id, lead.phone)
+            except otp.OTPError:
+                log.warning("Could not send confirmation code for booking group %s", lead.group_id)
+
+        delete_unconfirmed_booking.apply_async(
+            (lead.id,), countdown=60 * CONFIRMATION_TIMEOUT_MINUTES
+        )
+        notify_new_group_booking.delay(lead.group_id)
+
+    def to_representation(self, bookings):
+        return {
+            "group_id": str(bookings[0].group_id),
+            "bookings": BookingSerializer(bookings, many=True, context=self.context).data,
+            "final_price": str(sum(booking.get_final_price() for booking in bookings)),
+        }
+
+
+class BookingSeriesSerializer(serializers.ModelSerializer):
+    """
+    POST bookings/series/: a weekly booking, created as one Booking per
+    occurrence. Occurrences that overlap existing bookings of the room or of
+    the customer (found in one query) fail the series or, with
+    on_conflict=skip, are left out.
+    """
+
+    # Series may be booked further ahead than single bookings
+    MAX_DAYS_AHEAD = 183
+
+    bookings = serializers.SerializerMethodField()
+    skipped = serializers.SerializerMethodField()
+
+    class Meta:
+        model = BookingSeries
+        fields = [
+            "id",
+            "bathhouse",
+            "room",
+            "name",
+            "phone",
+            "start_time",
+            "hours",
+            "interval_weeks",
+            "until",
+            "on_conflict",
+            "created_at",
+            "cancelled_at",
+            "bookings",
+            "skipped",
+        ]
+        read_only_fields = ["created_at", "cancelled_at"]
+        extra_kwargs = {
+            "room": {"queryset": Room.objects.select_related("bathhouse")},
+            "phone": {"validators": [validate_phone_number]},
+            "hours": {"min_value": 1},
+            "interval_weeks": {"min_value": 1},
+        }
+
+    def validate(self, data):
+        room = data["room"]
+        start_time = data["start_time"]
+        if room.bathhouse_id != data["bathhouse"].id:
+            raise serializers.ValidationError(
+                "Комната не принадлежит выбранной бане.", code="invalid_room"
+            )
+        # Every occurrence has the same local time, so the first one stands for all
+        BookingSerializer.validate_slot(room, start_time, data["hours"], self.MAX_DAYS_AHEAD)
+
+        latest_allowed = timezone.localdate() + timedelta(days=self.MAX_DAYS_AHEAD)
+        if data["until"] > latest_allowed:
+            raise serializers.ValidationError(
+                f"Серию можно бронировать не более чем на {self.MAX_DAYS_AHEAD} дней вперёд.",
+                code="too_far_ahead",
+            )
+        if not BookingSeries(**data).occurrence_starts():
+            raise serializers.ValidationError(
+                "Дата окончания серии раньше первой брони.", code="empty_series"
+            )
+        return data
+
+    def create(self, validated_data):
+        series = BookingSeries(**validated_data)
+        delta = timedelta(hours=series.hours)
+        starts = series.occurrence_starts()
+        held = {
+            start_time
+            for start_time in starts
+            if holds.held_by_others(series.room_id, start_time, start_time + delta)
+        }
+
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            Room.objects.select_for_update().only("id").get(pk=series.room_id)
+            booked = BookingSerializer.booked_ranges(
+                series.room, [(start_time, start_time + delta) for start_time in starts], series.phone
+            )
+            taken = [
+                start_time
+                for start_time in starts
+                if start_time in held
+                or any(start < start_time + delta and start_time < end for start, end in booked)
+            ]
+            if taken and series.on_conflict == BookingSeries.ON_CONFLICT_FAIL:
+                raise serializers.ValidationError(
+                    {
+                        "non_field_errors": [
+                            serializers.ErrorDetail(
+                                "Некоторые даты серии уже заняты: "
+                                + ", ".join(f"{timezone.localtime(t):%d.%m.%Y}" for t in taken),
+                                code="overlap",
+                            )
+                        ],
+                        "taken": [serializers.DateTimeField().to_representation(t) for t in taken],
+                    }
+                )
+            if len(taken) == len(starts):
+                raise serializers.ValidationError(
+                    "Все даты серии уже заняты.", code="overlap"
+                )
+
+            series.save(force_insert=True)
+            # The customer's active-booking rule does not apply between
+            # occurrences of one series; phone_normalized is set by save(),
+            # which bulk_create skips
+            bookings = [
+                Booking(
+                    bathhouse=series.bathhouse,
+                    room=series.room,
+                    name=series.name,
+                    phone=series.phone,
+                    phone_normalized=normalize_phone(series.phone),
+                    start_time=start_time,
+                    hours=series.hours,
+                    series=series,
+                )
+                for start_time in starts
+                if start_time not in taken
+            ]
+            for booking in bookings:
+                booking.final_price = booking.calculate_final_price([])
+                booking.promotions_applied = booking._promotions_applied
+            Booking.objects.bulk_create(bookings)
+            rollups.bookings_created(bookings)
+            customers.bookings_created(bookings)
+            transaction.on_commit(lambda: self.series_created(series, bookings))
+
+        series._bookings = bookings
+        series._skipped = taken
+        return series
+
+    @staticmethod
+    def series_created(series, bookings):
+        """Like GroupBookingSerializer.group_created(); reminders too, as bulk_create sends no post_save."""
+        for booking in bookings:
+            schedule_booking_reminders(booking)
+        lead = bookings[0]
+        if not lead.confirmed:
+            # Confirming the first occurrence confirms the series (see confirm_booking_sms)
+            try:
+                otp.issue_code(otp.PURPOSE_CONFIRM, lead.id, lead.phone)
+            except otp.OTPError:
+                log.warning("Could not send confirmation code for booking series %s", series.id)
+
+        delete_unconfirmed_booking.apply_async(
+            (lead.id,), countdown=60 * CONFIRMATION_TIMEOUT_MINUTES
+        )
+        notify_new_series.delay(series.id)
+
+    def get_bookings(self, series):
+        bookings = getattr(series, "_bookings", None)
+        if bookings is None:
+            bookings = series.bookings.order_by("start_time")
+        return [
+            {
+                "id": str(booking.id),
+                "start_time": serializers.DateTimeField().to_representation(booking.start_time),
+                "final_price": str(booking.final_price),
+                "is_paid": booking.is_paid,
+            }
+            for booking in bookings
+        ]
+
+    def get_skipped(self, series):
+        return [
+            serializers.DateTimeField().to_representation(start_time)
+            for start_time in getattr(series, "_skipped", [])
+        ]
+
+
+class CustomerProfileSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CustomerProfile
+        fields = [
+            "phone",
+            "name",
+            "bookings_count",
+            "booked_hours",
+            "paid_bookings_count",
+            "total_spent",
+            "birthday_count",
+            "first_booking_start",
+            "last_booking_start",
+            "bonus_balance",
+        ]
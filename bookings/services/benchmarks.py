@@ -0,0 +1,352 @@
+"""
+Endpoint benchmarks against a running server (`manage.py bench_endpoints`).
+
+Each scenario turns the data made by `manage.py seed_load` into a fixed list
+of requests (same --seed, same requests), which is replayed by concurrent
+clients. Per scenario we record throughput, latency percentiles, the status
+mix and the queries per request read back from the Server-Timing header set
+by QueryInstrumentationMiddleware. Results are stored as JSON so a later run
+can be compared against a baseline.
+
+The server should run with STAGE=DEV (no Telegram) and THROTTLING_ENABLED=0,
+otherwise the anonymous endpoints are rate limited. process_payment marks
+bookings paid, so compare runs made on freshly seeded data.
+"""
+from __future__ import annotations
+
+import itertools
+import math
+import random
+import re
+import threading
+import time
+from datetime import datetime, time as dt_time, timedelta
+
+import httpx
+
+from bookings.models import Booking, BonusAccount
+from bookings.services.rollups import LOCAL_TZ
+from bookings.services.seeding import seeded_bathhouses
+from users.models import Room
+
+BENCH_ROOM_NUMBER = "bench"
+CONTENDED_SLOTS = 4  # the create scenario races for this many 2-hour slots
+
+_QUERIES = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+class Request:
+    __slots__ = ("method", "path", "params", "json", "auth")
+
+    def __init__(self, method, path, params=None, json=None, auth=False):
+        self.method = method
+        self.path = path
+        self.params = params
+        self.json = json
+        self.auth = auth
+
+
+# ---- Scenarios ----
+
+
+def _targets():
+    bathhouses = list(seeded_bathhouses().order_by("id").values_list("id", flat=True))
+    if not bathhouses:
+        raise BenchmarkError("No seeded bathhouses, run `manage.py seed_load` first")
+    rooms = list(
+        Room.objects.filter(bathhouse_id__in=bathhouses)
+        .exclude(room_number=BENCH_ROOM_NUMBER)
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+    return bathhouses, rooms
+
+
+def catalog_browse(rng, count):
+    """Bathhouse list, then the rooms, menu and categories of one bathhouse."""
+    bathhouses, _ = _targets()
+    pages = itertools.cycle(
+        [
+            ("/api/users/bathhouses/", False),
+            ("/api/users/rooms/", True),
+            ("/api/users/bathhouse-items/", True),
+            ("/api/users/menu-categories/", True),
+        ]
+    )
+    requests = []
+    for _ in range(count):
+        path, per_bathhouse = next(pages)
+        params = {"bathhouse_id": rng.choice(bathhouses)} if per_bathhouse else None
+        requests.append(Request("GET", path, params=params))
+    return requests
+
+
+def room_bookings(rng, count):
+    _, rooms = _targets()
+    return [
+        Request("GET", "/api/bookings/bookings/room-bookings/", params={"room_id": rng.choice(rooms)})
+        for _ in range(count)
+    ]
+
+
+def booking_create(rng, count):
+    """Every client races for the same few slots of one room, so most requests hit the overlap check."""
+    room = _bench_room()
+    day = datetime.now(LOCAL_TZ).date() + timedelta(days=7)
+    slots = [
+        datetime.combine(day, dt_time(10 + 2 * slot), tzinfo=LOCAL_TZ).isoformat()
+        for slot in range(CONTENDED_SLOTS)
+    ]
+    return [
+        Request(
+            "POST",
+            "/api/bookings/bookings/",
+            json={
+                "bathhouse": room.bathhouse_id,
+                "room": room.id,
+                "name": "Нагрузочный тест",
+                # unique phones so the active-booking rule does not kick in
+                "phone": f"+7701{number:07d}",
+                "start_time": rng.choice(slots),
+                "hours": 2,
+            },
+        )
+        for number in range(count)
+    ]
+
+
+def _bench_room():
+    bathhouse_id = seeded_bathhouses().order_by("id").values_list("id", flat=True).first()
+    if bathhouse_id is None:
+        raise BenchmarkError("No seeded bathhouses, run `manage.py seed_load` first")
+    room, _ = Room.objects.get_or_create(
+        bathhouse_id=bathhouse_id,
+        room_number=BENCH_ROOM_NUMBER,
+        defaults={"is_available": False, "price_per_hour": 5000},
+    )
+    return room
+
+
+def cleanup_booking_create():
+    Booking.objects.filter(
+        room__room_number=BENCH_ROOM_NUMBER, bathhouse__in=seeded_bathhouses()
+    ).delete()
+
+
+def process_payment(rng, count):
+    """Pay distinct unpaid future bookings without redeeming bonuses."""
+    bookings = list(
+        Booking.objects.filter(
+            bathhouse__in=seeded_bathhouses(),
+            is_paid=False,
+            confirmed=True,
+            start_time__gte=datetime.now(LOCAL_TZ),
+        )
+        .exclude(room__room_number=BENCH_ROOM_NUMBER)
+        .order_by("id")
+        .values_list("id", "bathhouse_id", "phone")[:count]
+    )
+    if len(bookings) < count:
+        raise BenchmarkError(
+            f"Only {len(bookings)} unpaid future bookings left for process_payment, reseed the data"
+        )
+    return [
+        Request(
+            "POST",
+            f"/api/bookings/bookings/{booking_id}/process-payment/",
+            params={"bathhouse_id": bathhouse_id, "phone": phone},
+            json={"amount": 0},
+            auth=True,
+        )
+        for booking_id, bathhouse_id, phone in bookings
+    ]
+
+
+def _bonus_accounts():
+    accounts = list(
+        BonusAccount.objects.filter(bathhouse__in=seeded_bathhouses())
+        .order_by("id")
+        .values_list("bathhouse_id", "phone")[:5000]
+    )
+    if not accounts:
+        raise BenchmarkError("No seeded bonus accounts, run `manage.py seed_load` first")
+    return accounts
+
+
+def bonus_balance(rng, count):
+    accounts = _bonus_accounts()
+    return [
+        Request(
+            "GET",
+            "/api/bookings/bonus/balance/",
+            params=dict(zip(("bathhouse_id", "phone"), rng.choice(accounts))),
+        )
+        for _ in range(count)
+    ]
+
+
+def bonus_transactions(rng, count):
+    accounts = _bonus_accounts()
+    return [
+        Request(
+            "GET",
+            "/api/bookings/bonus/transactions/",
+            params=dict(zip(("bathhouse_id", "phone"), rng.choice(accounts))),
+        )
+        for _ in range(count)
+    ]
+
+
+# name -> (build requests, cleanup or None)
+SCENARIOS = {
+    "catalog_browse": (catalog_browse, None),
+    "room_bookings": (room_bookings, None),
+    "booking_create": (booking_create, cleanup_booking_create),
+    "process_payment": (process_payment, None),
+    "bonus_balance": (bonus_balance, None),
+    "bonus_transactions": (bonus_transactions, None),
+}
+
+
+# ---- Running ----
+
+
+def obtain_token(base_url, username, password) -> str:
+    response = httpx.post(
+        f"{base_url}/api/users/token/", json={"username": username, "password": password}, timeout=30
+    )
+    if response.status_code != 200:
+        raise BenchmarkError(
+            f"Could not log in as {username} ({response.status_code}); "
+            f"seed with `seed_load --admin-password ...`"
+        )
+    return response.json()["access"]
+
+
+def replay(base_url, requests, concurrency, token=None):
+    """Send the requests from `concurrency` threads; return ([(ms, status, queries)], wall seconds)."""
+    results = []
+    lock = threading.Lock()
+    positions = itertools.count()
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+
+    def worker():
+        with httpx.Client(base_url=base_url, timeout=60) as client:
+            while True:
+                position = next(positions)
+                if position >= len(requests):
+                    return
+                request = requests[position]
+                started = time.perf_counter()
+                try:
+                    response = client.request(
+                        request.method,
+                        request.path,
+                        params=request.params,
+                        json=request.json,
+                        headers=headers if request.auth else None,
+                    )
+                    status, timing = response.status_code, response.headers.get("Server-Timing", "")
+                except httpx.HTTPError:
+                    status, timing = 0, ""
+                elapsed = (time.perf_counter() - started) * 1000
+                match = _QUERIES.search(timing)
+                with lock:
+                    results.append((elapsed, status, int(match.group(1)) if match else None))
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - started
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, math.ceil(pct / 100 * len(values)) - 1))]
+
+
+def summarize(results, wall_seconds) -> dict:
+    latencies = [ms for ms, _, _ in results]
+    queries = [count for _, _, count in results if count is not None]
+    statuses = {}
+    for _, status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        "requests": len(results),
+        "errors": sum(1 for _, status, _ in results if status == 0 or status >= 500),
+        "statuses": dict(sorted(statuses.items())),
+        "throughput_rps": round(len(results) / wall_seconds, 2) if wall_seconds else None,
+        "mean_ms": round(sum(latencies) / len(latencies), 2) if latencies else None,
+        "p50_ms": _round(percentile(latencies, 50)),
+        "p95_ms": _round(percentile(latencies, 95)),
+        "p99_ms": _round(percentile(latencies, 99)),
+        "queries_mean": round(sum(queries) / len(queries), 2) if queries else None,
+        "queries_max": max(queries) if queries else None,
+    }
+
+
+def _round(value):
+    return round(value, 2) if value is not None else None
+
+
+def run(base_url, scenarios, requests_per_scenario, concurrency, seed, warmup=0, token=None, progress=None):
+    progress = progress or (lambda *args: None)
+    report = {}
+    for name in scenarios:
+        build, cleanup = SCENARIOS[name]
+        if cleanup:
+            cleanup()
+        try:
+            requests = build(random.Random(f"{seed}:{name}"), warmup + requests_per_scenario)
+            if warmup:
+                replay(base_url, requests[:warmup], concurrency, token)
+                if cleanup:
+                    cleanup()
+            results, wall_seconds = replay(base_url, requests[warmup:], concurrency, token)
+        finally:
+            if cleanup:
+                cleanup()
+        report[name] = summarize(results, wall_seconds)
+        progress(name, report[name])
+    return report
+
+
+# ---- Comparing ----
+
+# metric -> +1 if higher is worse, -1 if lower is worse
+COMPARED_METRICS = {"p50_ms": 1, "p95_ms": 1, "p99_ms": 1, "throughput_rps": -1}
+
+
+def compare(baseline: dict, current: dict, tolerance: float, query_tolerance: float = 0.0):
+    """
+    Return [(scenario, metric, baseline, current, change)] for every metric
+    that got worse by more than `tolerance` (a fraction) or, for queries per
+    request, by more than `query_tolerance` queries.
+    """
+    regressions = []
+    for name, now in current.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        for metric, direction in COMPARED_METRICS.items():
+            old, new = before.get(metric), now.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if change * direction > tolerance:
+                regressions.append((name, metric, old, new, change))
+        old, new = before.get("queries_mean"), now.get("queries_mean")
+        if old is not None and new is not None and new - old > query_tolerance:
+            regressions.append((name, "queries_mean", old, new, (new - old) / old if old else math.inf))
+        if now.get("errors", 0) > before.get("errors", 0):
+            regressions.append((name, "errors", before.get("errors", 0), now["errors"], math.inf))
+    return regressions
@@ -0,0 +1,236 @@
+"""
+Incremental maintenance of CustomerProfile.
+
+Works like services/rollups.py: a booking contributes fixed counters to the
+profile of its (bathhouse, normalized phone); on save the previous
+contribution is subtracted and the new one added, on delete it is subtracted.
+The first / last booking start (and the name on the latest booking) are
+moved with GREATEST / LEAST, and re-read from bookings only when a booking
+leaves a profile or changes its start time (a max cannot be decremented).
+Counters and dates cover every booking, upcoming and unconfirmed ones
+included: they describe bookings made, not visits that took place. Bonus
+balances are copied from BonusAccount whenever it is saved. Everything is
+applied after commit.
+"""
+from __future__ import annotations
+
+from decimal import Decimal
+
+from django.apps import apps as global_apps
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, DecimalField, F, Max, Min, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest, Least
+
+ZERO = Decimal("0.00")
+
+
+def booking_contribution(values: dict):
+    """Return ((bathhouse_id, phone), counters), or None for bookings without a phone."""
+    phone = values.get("phone_normalized")
+    if not phone:
+        return None
+    price = values.get("final_price") or ZERO
+    is_paid = bool(values.get("is_paid"))
+    counters = {
+        "bookings_count": 1,
+        "booked_hours": values["hours"] or 0,
+        "paid_bookings_count": 1 if is_paid else 0,
+        "total_spent": price if is_paid else ZERO,
+        "birthday_count": 1 if values.get("is_birthday") else 0,
+    }
+    return (values["bathhouse_id"], phone), counters
+
+
+def _change(changes, key):
+    return changes.setdefault(
+        key, {"counters": {}, "start": None, "name": None, "recompute_starts": False}
+    )
+
+
+def _merge(change, counters, sign):
+    target = change["counters"]
+    for field, delta in counters.items():
+        target[field] = target.get(field, 0) + sign * delta
+
+
+def booking_changed(previous, current) -> None:
+    """Same contract as rollups.booking_changed()."""
+    changes = {}
+    old = booking_contribution(previous) if previous is not None else None
+    new = booking_contribution(current) if current is not None else None
+    if old:
+        change = _change(changes, old[0])
+        _merge(change, old[1], -1)
+        if new is None or new[0] != old[0] or current["start_time"] != previous["start_time"]:
+            change["recompute_starts"] = True
+    if new:
+        change = _change(changes, new[0])
+        _merge(change, new[1], 1)
+        change["start"] = current["start_time"]
+        change["name"] = current["name"]
+    _apply_on_commit(changes)
+
+
+def bookings_created(bookings) -> None:
+    """For bulk_create paths, which do not send post_save."""
+    from bookings.services.rollups import current_values
+
+    changes = {}
+    for booking in bookings:
+        values = current_values(booking)
+        new = booking_contribution(values)
+        if new is None:
+            continue
+        change = _change(changes, new[0])
+        _merge(change, new[1], 1)
+        if change["start"] is None or values["start_time"] >= change["start"]:
+            change["start"] = values["start_time"]
+            change["name"] = values["name"]
+    _apply_on_commit(changes)
+
+
+def bonus_account_saved(account) -> None:
+    if not account.phone_normalized:
+        return
+    key = (account.bathhouse_id, account.phone_normalized)
+    balance = account.balance
+    transaction.on_commit(lambda: apply_balance(key, balance), robust=True)
+
+
+def _apply_on_commit(changes) -> None:
+    for change in changes.values():
+        change["counters"] = {
+            field: delta for field, delta in change["counters"].items() if delta
+        }
+    changes = {
+        key: change
+        for key, change in changes.items()
+        if change["counters"] or change["start"] is not None or change["recompute_starts"]
+    }
+    if changes:
+        transaction.on_commit(lambda: apply_changes(changes), robust=True)
+
+
+def apply_changes(changes) -> None:
+    from bookings.models import CustomerProfile
+
+    for (bathhouse_id, phone), change in changes.items():
+        profiles = CustomerProfile.objects.filter(bathhouse_id=bathhouse_id, phone=phone)
+        counters = change["counters"]
+        start = change["start"]
+        updates = {field: F(field) + delta for field, delta in counters.items()}
+        if start is not None:
+            # SET expressions see the old row, so the name follows the latest booking
+            updates["name"] = Case(
+                When(
+                    Q(last_booking_start__isnull=True) | Q(last_booking_start__lte=start),
+                    then=Value(change["name"]),
+                ),
+                default=F("name"),
+            )
+            updates["last_booking_start"] = Greatest(F("last_booking_start"), Value(start))
+            updates["first_booking_start"] = Least(F("first_booking_start"), Value(start))
+
+        if not profiles.update(**updates) and start is not None:
+            try:
+                with transaction.atomic():
+                    CustomerProfile.objects.create(
+                        bathhouse_id=bathhouse_id,
+                        phone=phone,
+                        name=change["name"] or "",
+                        first_booking_start=start,
+                        last_booking_start=start,
+                        **counters,
+                    )
+            except IntegrityError:
+                # Created concurrently by another request
+                profiles.update(**updates)
+
+        if change["recompute_starts"]:
+            _recompute_starts(bathhouse_id, phone)
+
+
+def _recompute_starts(bathhouse_id, phone) -> None:
+    from bookings.models import Booking, CustomerProfile
+
+    bookings = Booking.objects.filter(bathhouse_id=bathhouse_id, phone_normalized=phone)
+    latest = bookings.order_by("-start_time").values("name", "start_time").first()
+    updates = {
+        "first_booking_start": bookings.order_by("start_time").values_list("start_time", flat=True).first(),
+        "last_booking_start": latest["start_time"] if latest else None,
+    }
+    if latest:
+        updates["name"] = latest["name"]
+    CustomerProfile.objects.filter(bathhouse_id=bathhouse_id, phone=phone).update(**updates)
+
+
+def apply_balance(key, balance) -> None:
+    from bookings.models import CustomerProfile
+
+    bathhouse_id, phone = key
+    profiles = CustomerProfile.objects.filter(bathhouse_id=bathhouse_id, phone=phone)
+    if profiles.update(bonus_balance=balance):
+        return
+    try:
+        with transaction.atomic():
+            CustomerProfile.objects.create(bathhouse_id=bathhouse_id, phone=phone, bonus_balance=balance)
+    except IntegrityError:
+        profiles.update(bonus_balance=balance)
+
+
+def rebuild(bathhouse_id=None, apps=global_apps) -> int:
+    """
+    Recompute CustomerProfile rows from bookings and bonus accounts, one
+    bathhouse at a time. Migrations pass their historical `apps`.
+    """
+    Booking = apps.get_model("bookings", "Booking")
+    BonusAccount = apps.get_model("bookings", "BonusAccount")
+    CustomerProfile = apps.get_model("bookings", "CustomerProfile")
+    Bathhouse = apps.get_model("users", "Bathhouse")
+
+    bathhouse_ids = Bathhouse.objects.order_by("id").values_list("id", flat=True)
+    if bathhouse_id is not None:
+        bathhouse_ids = bathhouse_ids.filter(id=bathhouse_id)
+
+    total = 0
+    for current_id in list(bathhouse_ids):
+        bookings = Booking.objects.filter(bathhouse_id=current_id).exclude(phone_normalized="")
+        profiles = {}
+        for row in bookings.values("phone_normalized").annotate(
+            bookings_count=Count("id"),
+            booked_hours=Coalesce(Sum("hours"), 0),
+            paid_bookings_count=Count("id", filter=Q(is_paid=True)),
+            total_spent=Coalesce(
+                Sum("final_price", filter=Q(is_paid=True)),
+                Value(ZERO, output_field=DecimalField(max_digits=14, decimal_places=2)),
+            ),
+            birthday_count=Count("id", filter=Q(is_birthday=True)),
+            first_booking_start=Min("start_time"),
+            last_booking_start=Max("start_time"),
+        ).order_by().iterator(chunk_size=2000):
+            phone = row.pop("phone_normalized")
+            profiles[phone] = CustomerProfile(bathhouse_id=current_id, phone=phone, **row)
+
+        latest_names = (
+            bookings.order_by("phone_normalized", "-start_time")
+            .distinct("phone_normalized")
+            .values_list("phone_normalized", "name")
+        )
+        for phone, name in latest_names.iterator(chunk_size=2000):
+            profiles[phone].name = name
+
+        balances = (
+            BonusAccount.objects.filter(bathhouse_id=current_id)
+            .exclude(phone_normalized="")
+            .values_list("phone_normalized", "balance")
+        )
+        for phone, balance in balances.iterator(chunk_size=2000):
+            if phone not in profiles:
+                profiles[phone] = CustomerProfile(bathhouse_id=current_id, phone=phone)
+            profiles[phone].bonus_balance = balance
+
+        with transaction.atomic():
+            CustomerProfile.objects.filter(bathhouse_id=current_id).delete()
+            CustomerProfile.objects.bulk_create(profiles.values(), batch_size=1000)
+        total += len(profiles)
+    return total
@@ -0,0 +1,204 @@
+"""
+Streaming exports of bookings and the bonus ledger.
+
+Rows are read with .values() through a server-side cursor
+(.iterator(chunk_size=...)) and written out one at a time, so memory use does
+not depend on the size of the export. CSV is produced straight into a
+StreamingHttpResponse. XLSX cannot be streamed (the file is a zip archive with
+its index at the end), so it is written with XlsxWriter's constant_memory mode
+into a temporary file that is then streamed back.
+
+CSV text cells starting with =, +, -, @, tab or CR get a leading ' so that
+spreadsheet apps do not evaluate customer input as a formula (phones
+therefore read '+7...). XLSX cells are written as strings and need no escaping.
+"""
+from __future__ import annotations
+
+import csv
+import tempfile
+import uuid
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+import xlsxwriter
+from django.contrib.postgres.aggregates import StringAgg
+from django.db.models import CharField, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Concat
+from django.http import FileResponse, StreamingHttpResponse
+
+from bookings.models import Booking, BonusTransaction
+from users.models import ExtraItem
+
+LOCAL_TZ = ZoneInfo("Asia/Almaty")
+CHUNK_SIZE = 2000
+
+CSV_CONTENT_TYPE = "text/csv; charset=utf-8"
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+FORMATS = ("csv", "xlsx")
+
+BOOKING_COLUMNS = (
+    ("id", "ID"),
+    ("bathhouse_id", "Bathhouse ID"),
+    ("bathhouse__name", "Bathhouse"),
+    ("room_id", "Room ID"),
+    ("room__room_number", "Room"),
+    ("name", "Name"),
+    ("phone", "Phone"),
+    ("start_time", "Start"),
+    ("hours", "Hours"),
+    ("confirmed", "Confirmed"),
+    ("is_paid", "Paid"),
+    ("is_birthday", "Birthday"),
+    ("final_price", "Final price"),
+    ("promotions_applied", "Promotions"),
+    ("extras", "Extras"),
+    ("created_at", "Created at"),
+)
+
+BONUS_TRANSACTION_COLUMNS = (
+    ("id", "ID"),
+    ("account__bathhouse_id", "Bathhouse ID"),
+    ("account__phone", "Phone"),
+    ("booking_id", "Booking ID"),
+    ("type", "Type"),
+    ("amount", "Amount"),
+    ("created_at", "Created at"),
+)
+
+MONEY_FIELDS = {"final_price", "amount"}
+
+
+def local_range(date_from, date_to):
+    """Aware [start, end) bounds covering Asia/Almaty days date_from..date_to."""
+    start = datetime.combine(date_from, time.min, tzinfo=LOCAL_TZ) if date_from else None
+    end = (
+        datetime.combine(date_to + timedelta(days=1), time.min, tzinfo=LOCAL_TZ)
+        if date_to
+        else None
+    )
+    return start, end
+
+
+def bookings_queryset(bathhouse_ids, date_from=None, date_to=None):
+    """Bookings starting within the given local days, as .values() rows."""
+    extras = (
+        ExtraItem.objects.filter(booking_id=OuterRef("pk"))
+        .values("booking_id")
+        .annotate(
+            summary=StringAgg(
+                Concat("item__name", Value(" x"), Cast("quantity", CharField())),
+                delimiter="; ",
+                order_by="item__name",
+            )
+        )
+        .values("summary")
+    )
+    qs = Booking.objects.filter(bathhouse_id__in=bathhouse_ids)
+    start, end = local_range(date_from, date_to)
+    if start:
+        qs = qs.filter(start_time__gte=start)
+    if end:
+        qs = qs.filter(start_time__lt=end)
+    return (
+        qs.annotate(extras=Subquery(extras, output_field=CharField()))
+        .order_by("start_time", "id")
+        .values(*(field for field, _ in BOOKING_COLUMNS))
+    )
+
+
+def bonus_transactions_queryset(bathhouse_ids, date_from=None, date_to=None):
+    """Ledger entries created within the given local days, as .values() rows."""
+    qs = BonusTransaction.objects.filter(account__bathhouse_id__in=bathhouse_ids)
+    start, end = local_range(date_from, date_to)
+    if start:
+        qs = qs.filter(created_at__gte=start)
+    if end:
+        qs = qs.filter(created_at__lt=end)
+    return qs.order_by("id").values(*(field for field, _ in BONUS_TRANSACTION_COLUMNS))
+
+
+def _format_promotions(promotions) -> str:
+    parts = []
+    for promotion in promotions or []:
+        if promotion.get("type") == "BONUS_HOUR":
+            parts.append(f"BONUS_HOUR +{promotion.get('hours_awarded')}h")
+        else:
+            parts.append(f"{promotion.get('type')} -{promotion.get('amount')}")
+    return "; ".join(parts)
+
+
+def _cell(field, value):
+    if value is None:
+        return ""
+    if field == "promotions_applied":
+        return _format_promotions(value)
+    if isinstance(value, datetime):
+        return value.astimezone(LOCAL_TZ).strftime("%Y-%m-%d %H:%M")
+    if isinstance(value, bool):
+        return "yes" if value else "no"
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+def _rows(queryset, columns):
+    for row in queryset.iterator(chunk_size=CHUNK_SIZE):
+        yield [_cell(field, row[field]) for field, _ in columns]
+
+
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def _csv_safe(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+class _Echo:
+    """File-like object whose write() just hands the line back to csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def _csv_stream(queryset, columns):
+    writer = csv.writer(_Echo())
+    # BOM so Excel picks up UTF-8 (names are mostly Cyrillic)
+    yield "\ufeff" + writer.writerow([title for _, title in columns])
+    for row in _rows(queryset, columns):
+        yield writer.writerow([_csv_safe(value) for value in row])
+
+
+def _xlsx_file(queryset, columns):
+    fh = tempfile.TemporaryFile()
+    workbook = xlsxwriter.Workbook(fh, {"constant_memory": True, "in_memory": False})
+    sheet = workbook.add_worksheet()
+    bold = workbook.add_format({"bold": True})
+    money = workbook.add_format({"num_format": "0.00"})
+    sheet.write_row(0, 0, [title for _, title in columns], bold)
+    money_columns = {i for i, (field, _) in enumerate(columns) if field in MONEY_FIELDS}
+    for row_number, row in enumerate(_rows(queryset, columns), start=1):
+        for col, value in enumerate(row):
+            if col in money_columns and value != "":
+                sheet.write_number(row_number, col, float(value), money)
+            elif isinstance(value, str):
+                sheet.write_string(row_number, col, value)
+            else:
+                sheet.write(row_number, col, value)
+    workbook.close()
+    fh.seek(0)
+    return fh
+
+
+def export_response(queryset, columns, file_format: str, filename: str):
+    if file_format == "xlsx":
+        return FileResponse(
+            _xlsx_file(queryset, columns),
+            as_attachment=True,
+            filename=f"{filename}.xlsx",
+            content_type=XLSX_CONTENT_TYPE,
+        )
+    response = StreamingHttpResponse(_csv_stream(queryset, columns), content_type=CSV_CONTENT_TYPE)
+    response["Content-Disposition"] = f'attachment; filename="{filename}.csv"'
+    return response
@@ -0,0 +1,130 @@
+"""
+Weekday x hour demand heatmaps.
+
+Bookings are grouped in SQL by (room, local ISO weekday, local start hour,
+length) and only those groups are expanded into hour cells here, so a refresh
+reads a few thousand rows no matter how many bookings it covers.
+
+All heatmap rows share one watermark (refreshed_until): each run adds the
+bookings created between the previous watermark and now minus a lag long
+enough for unconfirmed bookings to have expired.
+
+Incremental runs never subtract: a booking cancelled, deleted or moved after
+it was counted stays in its old cell, and one confirmed after the lag (by an
+admin) is never added. The nightly full=True rebuild in CELERY_BEAT_SCHEDULE
+corrects both, so heatmaps drift by at most a day.
+"""
+from __future__ import annotations
+
+from datetime import timedelta
+from zoneinfo import ZoneInfo
+
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import ExtractHour, ExtractIsoWeekDay
+from django.utils import timezone
+
+from bookings.models import (
+    CONFIRMATION_TIMEOUT_MINUTES,
+    Booking,
+    OccupancyHeatmap,
+    empty_heatmap,
+)
+
+LOCAL_TZ = ZoneInfo("Asia/Almaty")
+WEEKDAYS = ["MONDAY", "TUESDAY", "WEDNESDAY", "THURSDAY", "FRIDAY", "SATURDAY", "SUNDAY"]
+REFRESH_LAG = timedelta(minutes=CONFIRMATION_TIMEOUT_MINUTES + 5)
+
+
+def _aggregate(bookings):
+    """Return {(bathhouse_id, room_id): (matrix, bookings_count)} for a queryset."""
+    result = {}
+    groups = (
+        bookings.annotate(
+            weekday=ExtractIsoWeekDay("start_time", tzinfo=LOCAL_TZ),
+            hour=ExtractHour("start_time", tzinfo=LOCAL_TZ),
+        )
+        .values("bathhouse_id", "room_id", "weekday", "hour", "hours")
+        .annotate(n=Count("id"))
+        .order_by()
+    )
+    for row in groups:
+        key = (row["bathhouse_id"], row["room_id"])
+        if key not in result:
+            result[key] = (empty_heatmap(), [0])
+        matrix, count = result[key]
+        count[0] += row["n"]
+        cell = (row["weekday"] - 1) * 24 + row["hour"]
+        for offset in range(row["hours"]):
+            day, hour = divmod((cell + offset) % (7 * 24), 24)
+            matrix[day][hour] += row["n"]
+    return {key: (matrix, count[0]) for key, (matrix, count) in result.items()}
+
+
+def _add(target, source):
+    for day in range(7):
+        for hour in range(24):
+            target[day][hour] += source[day][hour]
+
+
+@transaction.atomic
+def refresh_heatmaps(full: bool = False, now=None) -> int:
+    """
+    Fold newly created bookings into the heatmaps (or rebuild them with full=True).
+    Returns the number of bookings added.
+    """
+    upper = (now or timezone.now()) - REFRESH_LAG
+    existing = {
+        (heatmap.bathhouse_id, heatmap.room_id): heatmap
+        for heatmap in OccupancyHeatmap.objects.select_for_update()
+    }
+    since = None
+    if existing and not full:
+        since = min(heatmap.refreshed_until for heatmap in existing.values())
+        if since >= upper:
+            return 0
+
+    bookings = Booking.objects.filter(confirmed=True, created_at__lte=upper)
+    if since is not None:
+        bookings = bookings.filter(created_at__gt=since)
+    per_room = _aggregate(bookings)
+
+    per_bathhouse = {}
+    for (bathhouse_id, _room_id), (matrix, count) in per_room.items():
+        total = per_bathhouse.setdefault((bathhouse_id, None), (empty_heatmap(), [0]))
+        _add(total[0], matrix)
+        total[1][0] += count
+    changes = dict(per_room)
+    changes.update({key: (matrix, count[0]) for key, (matrix, count) in per_bathhouse.items()})
+
+    to_create = []
+    for key, (matrix, count) in changes.items():
+        heatmap = existing.get(key)
+        if heatmap is None:
+            to_create.append(
+                OccupancyHeatmap(
+                    bathhouse_id=key[0],
+                    room_id=key[1],
+                    matrix=matrix,
+                    bookings_count=count,
+                    refreshed_until=upper,
+                )
+            )
+            continue
+        if full:
+            heatmap.matrix = matrix
+            heatmap.bookings_count = count
+        else:
+            _add(heatmap.matrix, matrix)
+            heatmap.bookings_count += count
+
+    for key, heatmap in existing.items():
+        if full and key not in changes:
+            heatmap.matrix = empty_heatmap()
+            heatmap.bookings_count = 0
+        heatmap.refreshed_until = upper
+    OccupancyHeatmap.objects.bulk_update(
+        existing.values(), ["matrix", "bookings_count", "refreshed_until"], batch_size=500
+    )
+    OccupancyHeatmap.objects.bulk_create(to_create, batch_size=500)
+    return sum(count for matrix, count in per_room.values())
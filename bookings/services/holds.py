@@ -0,0 +1,140 @@
+"""
+Short holds on a room slot while a customer is in checkout.
+
+POST /api/bookings/holds/ grants a lease on (room, start, end) for
+SLOT_HOLD_TTL_SECONDS unless another live hold overlaps it. Requests carry
+the customer's phone and are throttled per phone and per IP, so one client
+cannot hold every room. The client sends the returned hold_id with the
+booking, and BookingSerializer.validate refuses bookings that overlap
+somebody else's hold. A hold ends when its booking is
+created, when the client releases it, or when it expires.
+
+Layout:
+    holds:room:<room_id>   HASH  hold_id -> "<start> <end> <expires_ms>"
+    holds:hold:<hold_id>   STRING room_id (to release a hold by its id)
+
+Expired entries are removed by the next acquire on the room; readers skip
+them. Holds only save wasted work, so reads fail open when Redis is down.
+"""
+from __future__ import annotations
+
+import logging
+import math
+import time
+import uuid
+from datetime import datetime, timezone as dt_timezone
+
+import redis
+from django.conf import settings
+
+from sauna.redis_client import get_redis, get_script
+
+log = logging.getLogger(__name__)
+
+ROOM_KEY = "holds:room:{room_id}"
+HOLD_KEY = "holds:hold:{hold_id}"
+
+# Returns 0 when the hold was granted, otherwise when (ms) the last
+# overlapping hold expires.
+ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local start, stop = tonumber(ARGV[2]), tonumber(ARGV[3])
+local expires = tonumber(ARGV[4])
+local blocked_until = 0
+local latest = expires
+local entries = redis.call('HGETALL', KEYS[1])
+for i = 1, #entries, 2 do
+    local s, e, exp = string.match(entries[i + 1], '(%S+) (%S+) (%S+)')
+    exp = tonumber(exp)
+    if exp <= now then
+        redis.call('HDEL', KEYS[1], entries[i])
+    else
+        latest = math.max(latest, exp)
+        if tonumber(s) < stop and start < tonumber(e) then
+            blocked_until = math.max(blocked_until, exp)
+        end
+    end
+end
+if blocked_until > 0 then
+    return blocked_until
+end
+redis.call('HSET', KEYS[1], ARGV[5], ARGV[2] .. ' ' .. ARGV[3] .. ' ' .. ARGV[4])
+redis.call('PEXPIREAT', KEYS[1], latest)
+redis.call('SET', KEYS[2], ARGV[6], 'PXAT', expires)
+return 0
+"""
+
+
+class HoldError(RuntimeError):
+    pass
+
+
+class SlotHeld(HoldError):
+    def __init__(self, retry_after: int):
+        super().__init__(f"Slot is held, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+def acquire(room_id: int, start_time: datetime, end_time: datetime) -> tuple[str, datetime]:
+    """
+    Hold [start_time, end_time) in the room. Returns (hold_id, expires_at).
+
+    Raises SlotHeld when another hold overlaps and HoldError when Redis is
+    unavailable.
+    """
+    hold_id = uuid.uuid4().hex
+    now_ms = int(time.time() * 1000)
+    expires_ms = now_ms + settings.SLOT_HOLD_TTL_SECONDS * 1000
+    try:
+        blocked_until = get_script(ACQUIRE_SCRIPT)(
+            keys=[ROOM_KEY.format(room_id=room_id), HOLD_KEY.format(hold_id=hold_id)],
+            args=[
+                now_ms,
+                start_time.timestamp(),
+                end_time.timestamp(),
+                expires_ms,
+                hold_id,
+                room_id,
+            ],
+        )
+    except redis.RedisError as e:
+        log.exception("Failed to acquire slot hold")
+        raise HoldError("Hold storage unavailable") from e
+    if blocked_until:
+        raise SlotHeld(max(1, math.ceil((int(blocked_until) - now_ms) / 1000)))
+    return hold_id, datetime.fromtimestamp(expires_ms / 1000, tz=dt_timezone.utc)
+
+
+def held_by_others(room_id: int, start_time: datetime, end_time: datetime, hold_id=None) -> bool:
+    """Whether a live hold other than `hold_id` overlaps the slot. False if Redis is down."""
+    try:
+        entries = get_redis().hgetall(ROOM_KEY.format(room_id=room_id))
+    except redis.RedisError:
+        log.warning("Could not read slot holds for room %s", room_id, exc_info=True)
+        return False
+    now_ms = time.time() * 1000
+    start, end = start_time.timestamp(), end_time.timestamp()
+    for other_id, value in entries.items():
+        if other_id == hold_id:
+            continue
+        held_start, held_end, expires = (float(part) for part in value.split())
+        if expires > now_ms and held_start < end and start < held_end:
+            return True
+    return False
+
+
+def release(hold_id: str) -> bool:
+    """End a hold early. Returns whether it existed."""
+    client = get_redis()
+    try:
+        room_id = client.get(HOLD_KEY.format(hold_id=hold_id))
+        if room_id is None:
+            return False
+        pipe = client.pipeline(transaction=True)
+        pipe.hdel(ROOM_KEY.format(room_id=room_id), hold_id)
+        pipe.delete(HOLD_KEY.format(hold_id=hold_id))
+        pipe.execute()
+    except redis.RedisError as e:
+        log.exception("Failed to release slot hold")
+        raise HoldError("Hold storage unavailable") from e
+    return True
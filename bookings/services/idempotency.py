@@ -0,0 +1,260 @@
+"""
+Idempotency-Key support for endpoints that clients retry on flaky networks
+(booking creation, payment processing).
+
+A request that sends an Idempotency-Key header runs once per key: its first
+successful (2xx) response is stored for IDEMPOTENCY_TTL_SECONDS and replayed,
+with the Idempotent-Replayed header, to every retry with the same key and
+body. Reusing a key with a different request gets 422. Error responses are
+not stored, so a corrected request can reuse its key.
+
+A duplicate that arrives while the first request is still running waits up
+to IDEMPOTENCY_WAIT_SECONDS for its response, then gets 409 with Retry-After.
+The lock expires after IDEMPOTENCY_LOCK_SECONDS if its request never ends.
+
+Keys are scoped by endpoint and user; anonymous callers are told apart by
+client IP (see REST_FRAMEWORK["NUM_PROXIES"]). Responses live in Redis:
+
+    idempotency:<scope>:<key>        STRING {"fingerprint", "status", "data"}
+    idempotency:lock:<scope>:<key>   STRING lock token
+
+When Redis is unavailable the same protocol runs on IdempotencyRecord rows:
+a row without a status is the lock.
+"""
+from __future__ import annotations
+
+import functools
+import hashlib
+import json
+import logging
+import time
+import uuid
+from datetime import timedelta
+
+import redis
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.throttling import BaseThrottle
+from rest_framework.utils.encoders import JSONEncoder
+
+from sauna import metrics
+from sauna.redis_client import get_redis, get_script
+
+from ..models import IdempotencyRecord
+
+log = logging.getLogger(__name__)
+
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+POLL_INTERVAL = 0.1
+
+RESPONSE_KEY = "idempotency:{scope}:{key}"
+LOCK_KEY = "idempotency:lock:{scope}:{key}"
+
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def fingerprint(request) -> str:
+    body = json.dumps(request.data, sort_keys=True, cls=JSONEncoder)
+    return hashlib.sha256(f"{request.method} {request.get_full_path()} {body}".encode()).hexdigest()
+
+
+def client_scope(request) -> str:
+    """The user's pk, or "anon:<client IP>" so anonymous clients never share keys."""
+    user = request.user
+    if user.is_authenticated:
+        return str(user.pk)
+    return f"anon:{BaseThrottle().get_ident(request)}"
+
+
+def _replay(stored: dict, request_fingerprint: str, scope: str) -> Response:
+    if stored["fingerprint"] != request_fingerprint:
+        metrics.IDEMPOTENCY_REQUESTS.labels(scope, "mismatch").inc()
+        return Response(
+            {"error": f"{HEADER} was already used for a different request"},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    metrics.IDEMPOTENCY_REQUESTS.labels(scope, "replayed").inc()
+    response = Response(stored["data"], status=stored["status"])
+    response[REPLAYED_HEADER] = "true"
+    return response
+
+
+def _in_progress(scope: str) -> Response:
+    metrics.IDEMPOTENCY_REQUESTS.labels(scope, "in_progress").inc()
+    response = Response(
+        {"error": "A request with this Idempotency-Key is still being processed"},
+        status=status.HTTP_409_CONFLICT,
+    )
+    response["Retry-After"] = "1"
+    return response
+
+
+def _wait_for(load):
+    """Poll `load` until it returns a response or IDEMPOTENCY_WAIT_SECONDS pass."""
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        stored = load()
+        if stored is not None:
+            return stored
+    return None
+
+
+def _stored(response) -> dict | None:
+    if not status.is_success(response.status_code):
+        return None
+    # Through JSON so the replay matches what the first client received
+    return {"status": response.status_code, "data": json.loads(json.dumps(response.data, cls=JSONEncoder))}
+
+
+def _run_with_redis(scope, key, request_fingerprint, run):
+    client = get_redis()
+    response_key = RESPONSE_KEY.format(scope=scope, key=key)
+    lock_key = LOCK_KEY.format(scope=scope, key=key)
+
+    def load():
+        value = client.get(response_key)
+        return json.loads(value) if value else None
+
+    stored = load()
+    if stored is None:
+        token = uuid.uuid4().hex
+        if client.set(lock_key, token, nx=True, px=settings.IDEMPOTENCY_LOCK_SECONDS * 1000):
+            # The previous holder may have stored its response and let go in between
+            stored = load()
+            if stored is None:
+                return _run_locked_redis(client, response_key, lock_key, token, request_fingerprint, run)
+            get_script(RELEASE_SCRIPT)(keys=[lock_key], args=[token])
+        else:
+            stored = _wait_for(load)
+            if stored is None:
+                return _in_progress(scope)
+    return _replay(stored, request_fingerprint, scope)
+
+
+def _run_locked_redis(client, response_key, lock_key, token, request_fingerprint, run):
+    try:
+        response = run()
+        stored = _stored(response)
+        if stored is not None:
+            try:
+                client.set(
+                    response_key,
+                    json.dumps({"fingerprint": request_fingerprint, **stored}),
+                    ex=settings.IDEMPOTENCY_TTL_SECONDS,
+                )
+            except redis.RedisError:
+                log.warning("Could not store the response for %s", response_key, exc_info=True)
+        return response
+    finally:
+        try:
+            get_script(RELEASE_SCRIPT)(keys=[lock_key], args=[token])
+        except redis.RedisError:
+            # Expires on its own after IDEMPOTENCY_LOCK_SECONDS
+            log.warning("Could not release %s", lock_key, exc_info=True)
+
+
+def _run_with_db(scope, key, request_fingerprint, run):
+    records = IdempotencyRecord.objects.filter(scope=scope, key=key)
+
+    def load():
+        record = records.filter(expires_at__gt=timezone.now(), status_code__isnull=False).first()
+        if record is None:
+            return None
+        return {"fingerprint": record.fingerprint, "status": record.status_code, "data": record.response}
+
+    stored = load()
+    if stored is None:
+        records.filter(expires_at__lte=timezone.now()).delete()
+        try:
+            with transaction.atomic():
+                record = IdempotencyRecord.objects.create(
+                    scope=scope,
+                    key=key,
+                    fingerprint=request_fingerprint,
+                    expires_at=timezone.now() + timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS),
+                )
+        except IntegrityError:
+            # Somebody else holds the key
+            stored = _wait_for(load)
+            if stored is None:
+                return _in_progress(scope)
+        else:
+            return _run_locked_db(record, run)
+    return _replay(stored, request_fingerprint, scope)
+
+
+def _run_locked_db(record, run):
+    try:
+        response = run()
+    except BaseException:
+        record.delete()
+        raise
+    stored = _stored(response)
+    if stored is None:
+        record.delete()
+    else:
+        record.status_code = stored["status"]
+        record.response = stored["data"]
+        record.expires_at = timezone.now() + timedelta(seconds=settings.IDEMPOTENCY_TTL_SECONDS)
+        record.save(update_fields=["status_code", "response", "expires_at"])
+    return response
+
+
+def idempotent(scope: str):
+    """
+    Make a view method idempotent per Idempotency-Key. Requests without the
+    header run as before.
+    """
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            key = request.headers.get(HEADER)
+            if key is None:
+                return method(view, request, *args, **kwargs)
+            if not key or len(key) > MAX_KEY_LENGTH:
+                return Response(
+                    {"error": f"{HEADER} must be 1 to {MAX_KEY_LENGTH} characters"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+            key_scope = f"{scope}:{client_scope(request)}"
+            request_fingerprint = fingerprint(request)
+
+            ran = False
+
+            def run():
+                nonlocal ran
+                ran = True
+                metrics.IDEMPOTENCY_REQUESTS.labels(scope, "executed").inc()
+                return method(view, request, *args, **kwargs)
+
+            try:
+                return _run_with_redis(key_scope, key, request_fingerprint, run)
+            except redis.RedisError:
+                if ran:
+                    # Raised by the view itself: running it again could repeat its writes
+                    raise
+                log.warning("Idempotency storage unavailable, falling back to the database", exc_info=True)
+                return _run_with_db(key_scope, key, request_fingerprint, run)
+
+        return wrapper
+
+    return decorator
+
+
+def purge_expired() -> int:
+    """Delete expired IdempotencyRecord rows. Returns how many were deleted."""
+    deleted, _ = IdempotencyRecord.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
@@ -0,0 +1,92 @@
+"""
+Telegram notifications about new bookings, sent by the notify_new_booking,
+notify_new_group_booking and notify_new_series tasks after the bookings are
+committed.
+"""
+from __future__ import annotations
+
+import html
+from zoneinfo import ZoneInfo
+
+LOCAL_TZ = ZoneInfo("Asia/Almaty")
+
+
+def _extras_lines(booking) -> str:
+    return (
+        "\n".join(
+            f"• ID: <code>{extra.item_id}</code> — Кол-во: <b>{extra.quantity}</b>"
+            for extra in booking.extra_items.all()
+        )
+        or "—"
+    )
+
+
+def new_booking_text(booking) -> str:
+    """`booking` with bathhouse, room and extra_items loaded."""
+    extras_lines = _extras_lines(booking)
+    start_time = booking.start_time.astimezone(LOCAL_TZ).strftime("%d.%m.%y %H:%M")
+    room = booking.room
+    room_type = "Сауна" if room.is_sauna else "Баня"
+
+    return (
+        f"🧖 <b>Новая бронь</b>\n"
+        f"<b>ID: </b> <code>{booking.id}</code> \n"
+        "——————————————\n"
+        f"👤 <b>Имя:</b> {html.escape(booking.name)}\n"
+        f"📞 <b>Телефон:</b> {html.escape(booking.phone)}\n"
+        f"🏛️ <b>Баня:</b> ID <code>{booking.bathhouse_id}</code> — {html.escape(str(booking.bathhouse.name))}\n"
+        f"🚪 <b>Комната:</b> ID <code>{room.id}</code> — {room_type}, № {html.escape(str(room.room_number))}\n"
+        f"🕒 <b>Начало:</b> {start_time}\n"
+        f"⏳ <b>Часы:</b> {booking.hours}\n"
+        f"🧺 <b>Доп. услуги:</b>\n{extras_lines}"
+    )
+
+
+def new_group_booking_text(bookings) -> str:
+    """Bookings of one group, each with bathhouse, room and extra_items loaded."""
+    first = bookings[0]
+    slots = []
+    for booking in bookings:
+        room = booking.room
+        room_type = "Сауна" if room.is_sauna else "Баня"
+        start_time = booking.start_time.astimezone(LOCAL_TZ).strftime("%d.%m.%y %H:%M")
+        slots.append(
+            f"🚪 <b>Комната:</b> ID <code>{room.id}</code> — {room_type}, № {html.escape(str(room.room_number))}\n"
+            f"<b>ID брони: </b> <code>{booking.id}</code>\n"
+            f"🕒 <b>Начало:</b> {start_time}\n"
+            f"⏳ <b>Часы:</b> {booking.hours}\n"
+            f"🧺 <b>Доп. услуги:</b>\n{_extras_lines(booking)}"
+        )
+
+    return (
+        f"🧖 <b>Новая групповая бронь</b> ({len(bookings)} комн.)\n"
+        f"<b>ID группы: </b> <code>{first.group_id}</code> \n"
+        "——————————————\n"
+        f"👤 <b>Имя:</b> {html.escape(first.name)}\n"
+        f"📞 <b>Телефон:</b> {html.escape(first.phone)}\n"
+        f"🏛️ <b>Баня:</b> ID <code>{first.bathhouse_id}</code> — {html.escape(str(first.bathhouse.name))}\n"
+        "——————————————\n" + "\n\n".join(slots)
+    )
+
+
+def new_series_text(series, bookings) -> str:
+    """`series` with bathhouse and room loaded, `bookings` its occurrences."""
+    room = series.room
+    room_type = "Сауна" if room.is_sauna else "Баня"
+    dates = ", ".join(
+        booking.start_time.astimezone(LOCAL_TZ).strftime("%d.%m") for booking in bookings
+    )
+    first = series.start_time.astimezone(LOCAL_TZ)
+
+    return (
+        f"🔁 <b>Новая серия броней</b> ({len(bookings)} шт.)\n"
+        f"<b>ID серии: </b> <code>{series.id}</code> \n"
+        "——————————————\n"
+        f"👤 <b>Имя:</b> {html.escape(series.name)}\n"
+        f"📞 <b>Телефон:</b> {html.escape(series.phone)}\n"
+        f"🏛️ <b>Баня:</b> ID <code>{series.bathhouse_id}</code> — {html.escape(str(series.bathhouse.name))}\n"
+        f"🚪 <b>Комната:</b> ID <code>{room.id}</code> — {room_type}, № {html.escape(str(room.room_number))}\n"
+        f"🕒 <b>Время:</b> {first:%H:%M}, каждые {series.interval_weeks} нед.\n"
+        f"⏳ <b>Часы:</b> {series.hours}\n"
+        f"📅 <b>Даты:</b> {dates or '—'}"
+    )
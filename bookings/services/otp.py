@@ -0,0 +1,136 @@
+"""
+One-time SMS codes for booking confirmation and cancellation.
+
+Codes are never stored in the database: Redis keeps an HMAC of the code
+together with an attempt counter under a TTL. Sending is throttled per phone
+(a short cooldown plus an hourly cap) and the SMS itself goes out via Celery.
+"""
+from __future__ import annotations
+
+import hashlib
+import hmac
+import logging
+
+import redis
+from django.conf import settings
+from django.db import transaction
+
+from sauna.redis_client import get_redis, get_script
+from bookings.utils import generate_random_4_digit_number, normalize_phone
+
+log = logging.getLogger(__name__)
+
+PURPOSE_CONFIRM = "confirm"
+PURPOSE_CANCEL = "cancel"
+
+MESSAGES = {
+    PURPOSE_CONFIRM: "Код подтверждения брони: {code}",
+    PURPOSE_CANCEL: "Код отмены брони: {code}",
+}
+
+CODE_KEY = "otp:{purpose}:{booking_id}"
+COOLDOWN_KEY = "otp:cooldown:{phone}"
+SENDS_KEY = "otp:sends:{phone}"
+
+# Returns 0 when sending is allowed, otherwise seconds until it is.
+THROTTLE_SCRIPT = """
+if not redis.call('SET', KEYS[1], 1, 'NX', 'EX', ARGV[1]) then
+    return math.max(redis.call('TTL', KEYS[1]), 1)
+end
+local sends = redis.call('INCR', KEYS[2])
+if sends == 1 then
+    redis.call('EXPIRE', KEYS[2], ARGV[3])
+end
+if sends > tonumber(ARGV[2]) then
+    return math.max(redis.call('TTL', KEYS[2]), 1)
+end
+return 0
+"""
+
+# Returns 1 on match, 0 on mismatch, -1 when there is no active code.
+VERIFY_SCRIPT = """
+local stored = redis.call('HGET', KEYS[1], 'hash')
+if not stored then
+    return -1
+end
+local attempts = redis.call('HINCRBY', KEYS[1], 'attempts', 1)
+if stored == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    return 1
+end
+if attempts >= tonumber(ARGV[2]) then
+    redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+VERIFIED = 1
+MISMATCH = 0
+MISSING = -1
+
+
+class OTPError(RuntimeError):
+    pass
+
+
+class OTPThrottled(OTPError):
+    def __init__(self, retry_after: int):
+        super().__init__(f"Too many SMS requests, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+def _hash(purpose: str, booking_id, code: str) -> str:
+    message = f"{purpose}:{booking_id}:{code}".encode()
+    return hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()
+
+
+def issue_code(purpose: str, booking_id, phone: str) -> None:
+    """
+    Store a fresh code for (purpose, booking) and send it to `phone` via Celery.
+    Throttling is keyed on the normalized phone.
+
+    Raises OTPThrottled when the phone asked for too many codes and OTPError
+    when Redis is unavailable.
+    """
+    from bookings.tasks import send_sms_task
+
+    phone = normalize_phone(phone) or phone
+    client = get_redis()
+    try:
+        retry_after = get_script(THROTTLE_SCRIPT)(
+            keys=[COOLDOWN_KEY.format(phone=phone), SENDS_KEY.format(phone=phone)],
+            args=[settings.OTP_RESEND_COOLDOWN_SECONDS, settings.OTP_MAX_SENDS_PER_HOUR, 3600],
+        )
+        if retry_after:
+            raise OTPThrottled(int(retry_after))
+
+        code = str(generate_random_4_digit_number())
+        key = CODE_KEY.format(purpose=purpose, booking_id=booking_id)
+        pipe = client.pipeline(transaction=True)
+        pipe.delete(key)
+        pipe.hset(key, mapping={"hash": _hash(purpose, booking_id, code), "attempts": 0})
+        pipe.expire(key, settings.OTP_CODE_TTL_SECONDS)
+        pipe.execute()
+    except redis.RedisError as e:
+        log.exception("Failed to store OTP code")
+        raise OTPError("OTP storage unavailable") from e
+
+    text = MESSAGES[purpose].format(code=code)
+    transaction.on_commit(lambda: send_sms_task.delay(phone, text))
+
+
+def verify_code(purpose: str, booking_id, code: str) -> int:
+    """
+    Check `code` against the stored hash. Returns VERIFIED, MISMATCH or MISSING.
+
+    A successful check consumes the code; too many wrong attempts drop it.
+    """
+    try:
+        result = get_script(VERIFY_SCRIPT)(
+            keys=[CODE_KEY.format(purpose=purpose, booking_id=booking_id)],
+            args=[_hash(purpose, booking_id, str(code).strip()), settings.OTP_MAX_ATTEMPTS],
+        )
+        return int(result)
+    except redis.RedisError as e:
+        log.exception("Failed to verify OTP code")
+        raise OTPError("OTP storage unavailable") from e
@@ -0,0 +1,234 @@
+"""
+Pre-visit reminders stored in Redis, bucketed by minute.
+
+Layout:
+    reminders:buckets              ZSET  minute -> minute (index of non-empty buckets)
+    reminders:bucket:<minute>      ZSET  "<booking_id>:<offset>" -> due timestamp
+    reminders:booking:<booking_id> HASH  offset -> minute (to find entries on reschedule)
+
+A single beat task pops every due bucket with one Lua script and sends the
+batch, so the Celery queue does not grow with the number of bookings and
+overlapping runs never pop the same entry. Entries whose message could not be
+sent go back into their bucket for the next run.
+"""
+from __future__ import annotations
+
+import html
+import logging
+import uuid
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import redis
+from django.conf import settings
+from django.utils import timezone
+
+from sauna.redis_client import get_redis, get_script
+from users.services.telegram import send_message
+
+log = logging.getLogger(__name__)
+
+BUCKETS_KEY = "reminders:buckets"
+BUCKET_KEY = "reminders:bucket:{minute}"
+BOOKING_KEY = "reminders:booking:{booking_id}"
+
+# Telegram rejects messages longer than 4096 characters
+MESSAGE_LIMIT = 4000
+FETCH_CHUNK_SIZE = 500
+
+# Returns a flat list of bucket minute, member pairs
+POP_SCRIPT = """
+local minutes = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+local due = {}
+for _, minute in ipairs(minutes) do
+    local bucket = ARGV[2] .. minute
+    for _, member in ipairs(redis.call('ZRANGE', bucket, 0, -1)) do
+        due[#due + 1] = minute
+        due[#due + 1] = member
+    end
+    redis.call('DEL', bucket)
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+return due
+"""
+
+
+def _minute(dt: datetime) -> int:
+    return int(dt.timestamp()) // 60
+
+
+def _offsets():
+    return tuple(int(m) for m in settings.BOOKING_REMINDER_OFFSETS_MINUTES)
+
+
+def schedule_booking_reminders(booking) -> None:
+    """(Re)schedule all reminders for a booking. Safe to call on every save."""
+    client = get_redis()
+    booking_key = BOOKING_KEY.format(booking_id=booking.id)
+    now = timezone.now()
+    try:
+        previous = client.hgetall(booking_key)
+        pipe = client.pipeline(transaction=True)
+        for offset, minute in previous.items():
+            pipe.zrem(BUCKET_KEY.format(minute=minute), f"{booking.id}:{offset}")
+        pipe.delete(booking_key)
+
+        for offset in _offsets():
+            due = booking.start_time - timedelta(minutes=offset)
+            if due <= now:
+                continue
+            minute = _minute(due)
+            pipe.zadd(BUCKET_KEY.format(minute=minute), {f"{booking.id}:{offset}": due.timestamp()})
+            pipe.zadd(BUCKETS_KEY, {minute: minute})
+            pipe.hset(booking_key, offset, minute)
+        pipe.expireat(booking_key, booking.start_time + timedelta(days=1))
+        pipe.execute()
+    except redis.RedisError:
+        log.exception("Failed to schedule reminders for booking %s", booking.id)
+
+
+def cancel_booking_reminders(booking_id) -> None:
+    client = get_redis()
+    booking_key = BOOKING_KEY.format(booking_id=booking_id)
+    try:
+        previous = client.hgetall(booking_key)
+        if not previous:
+            return
+        pipe = client.pipeline(transaction=True)
+        for offset, minute in previous.items():
+            pipe.zrem(BUCKET_KEY.format(minute=minute), f"{booking_id}:{offset}")
+        pipe.delete(booking_key)
+        pipe.execute()
+    except redis.RedisError:
+        log.exception("Failed to cancel reminders for booking %s", booking_id)
+
+
+def pop_due_reminders(now: datetime | None = None) -> list[tuple[uuid.UUID, int, int]]:
+    """
+    Atomically remove every bucket up to the current minute.
+
+    Returns a list of (booking_id, offset_minutes, bucket_minute).
+    """
+    now_minute = _minute(now or timezone.now())
+    result = get_script(POP_SCRIPT)(keys=[BUCKETS_KEY], args=[now_minute, BUCKET_KEY.format(minute="")])
+
+    due = []
+    for minute, member in zip(result[0::2], result[1::2]):
+        booking_id, offset = member.rsplit(":", 1)
+        due.append((uuid.UUID(booking_id), int(offset), int(minute)))
+    return due
+
+
+def requeue_reminders(entries) -> None:
+    """Put popped (booking_id, offset, bucket_minute) entries back for the next run."""
+    if not entries:
+        return
+    try:
+        pipe = get_redis().pipeline(transaction=True)
+        for booking_id, offset, minute in entries:
+            pipe.zadd(BUCKET_KEY.format(minute=minute), {f"{booking_id}:{offset}": minute * 60})
+            pipe.zadd(BUCKETS_KEY, {minute: minute})
+            pipe.hset(BOOKING_KEY.format(booking_id=booking_id), offset, minute)
+        pipe.execute()
+    except redis.RedisError:
+        log.exception(
+            "Failed to requeue reminders, they are lost: %s",
+            ", ".join(f"{booking_id}:{offset}" for booking_id, offset, _minute_ in entries),
+        )
+
+
+def dispatch_due_reminders(now: datetime | None = None) -> int:
+    """Pop due buckets and send reminders for bookings that are still valid."""
+    from bookings.models import Booking
+
+    now = now or timezone.now()
+    try:
+        due = pop_due_reminders(now)
+    except redis.RedisError:
+        log.exception("Failed to pop due reminders")
+        return 0
+    if not due:
+        return 0
+
+    client = get_redis()
+    try:
+        pipe = client.pipeline(transaction=False)
+        for booking_id, offset, _minute_ in due:
+            pipe.hdel(BOOKING_KEY.format(booking_id=booking_id), offset)
+        pipe.execute()
+    except redis.RedisError:
+        log.exception("Failed to clean up reminder index")
+
+    reminders = []
+    for start in range(0, len(due), FETCH_CHUNK_SIZE):
+        chunk = due[start:start + FETCH_CHUNK_SIZE]
+        bookings = Booking.objects.select_related("bathhouse", "room").in_bulk(
+            {booking_id for booking_id, _, _ in chunk}
+        )
+        for booking_id, offset, minute in chunk:
+            booking = bookings.get(booking_id)
+            if booking is None or not booking.confirmed or booking.start_time <= now:
+                continue
+            # Stale entry left behind by a reschedule that failed half-way
+            if _minute(booking.start_time - timedelta(minutes=offset)) != minute:
+                continue
+            reminders.append((offset, minute, booking))
+
+    failed = send_reminders(reminders)
+    requeue_reminders([(booking.id, offset, minute) for offset, minute, booking in failed])
+    return len(reminders) - len(failed)
+
+
+def send_reminders(reminders) -> list:
+    """
+    Send one digest per offset through the notification chat. Takes and
+    returns (offset, bucket_minute, booking) tuples: the ones whose message
+    could not be sent.
+    """
+    failed = []
+    local_tz = ZoneInfo("Asia/Almaty")
+    by_offset: dict[int, list] = {}
+    for reminder in reminders:
+        by_offset.setdefault(reminder[0], []).append(reminder)
+
+    for offset, batch in sorted(by_offset.items(), reverse=True):
+        batch.sort(key=lambda reminder: reminder[2].start_time)
+        header = f"⏰ <b>Напоминание: визиты через {_format_offset(offset)}</b>\n"
+        lines = []
+        for _offset_, _minute_, booking in batch:
+            start_local = booking.start_time.astimezone(local_tz).strftime("%d.%m %H:%M")
+            lines.append(
+                f"• {start_local} — {html.escape(booking.name)}, "
+                f"{html.escape(booking.phone)} — {html.escape(booking.bathhouse.name)}, "
+                f"№ {html.escape(str(booking.room.room_number))}"
+            )
+        sent = 0
+        for text, count in _chunk_message(header, lines):
+            try:
+                send_message(chat_type="notification", text=text)
+            except Exception:
+                log.exception("Failed to send booking reminders, retrying next run")
+                failed.extend(batch[sent:sent + count])
+            sent += count
+    return failed
+
+
+def _format_offset(minutes: int) -> str:
+    if minutes % 60 == 0:
+        return f"{minutes // 60} ч"
+    return f"{minutes} мин"
+
+
+def _chunk_message(header: str, lines: list[str]):
+    """Yield (text, number of lines in it) for messages under MESSAGE_LIMIT."""
+    text = header
+    count = 0
+    for line in lines:
+        if len(text) + len(line) + 1 > MESSAGE_LIMIT and count:
+            yield text, count
+            text = header
+            count = 0
+        text += line + "\n"
+        count += 1
+    if count:
+        yield text, count
@@ -0,0 +1,217 @@
+"""
+Incremental maintenance of DailyRoomStats.
+
+Every booking contributes a fixed set of counters to the row of its room and
+local (Asia/Almaty) start date. On save we subtract the contribution of the
+last loaded values and add the new one, on delete we subtract it; bonus
+transactions add to the accrued / redeemed totals of their booking's day.
+Changes are applied after commit with UPDATE ... SET x = x + delta, falling
+back to INSERT for the first booking of a room and day.
+"""
+from __future__ import annotations
+
+import logging
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+from zoneinfo import ZoneInfo
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum, Value, DecimalField
+from django.db.models.functions import Coalesce, TruncDate
+
+log = logging.getLogger(__name__)
+
+LOCAL_TZ = ZoneInfo("Asia/Almaty")
+ZERO = Decimal("0.00")
+
+PROMOTION_COUNTERS = {
+    "HAPPY_HOURS": "happy_hours_count",
+    "BIRTHDAY": "birthday_count",
+    "BONUS_HOUR": "bonus_hour_count",
+}
+
+
+def local_date(dt) -> date:
+    return dt.astimezone(LOCAL_TZ).date()
+
+
+def booking_contribution(values: dict):
+    """Return ((bathhouse_id, room_id, date), counters) for a booking's field values."""
+    price = values.get("final_price") or ZERO
+    is_paid = bool(values.get("is_paid"))
+    counters = {
+        "bookings_count": 1,
+        "booked_hours": values["hours"] or 0,
+        "revenue": price,
+        "paid_bookings_count": 1 if is_paid else 0,
+        "paid_revenue": price if is_paid else ZERO,
+    }
+    for promotion in values.get("promotions_applied") or []:
+        field = PROMOTION_COUNTERS.get(promotion.get("type"))
+        if field:
+            counters[field] = counters.get(field, 0) + 1
+    key = (values["bathhouse_id"], values["room_id"], local_date(values["start_time"]))
+    return key, counters
+
+
+def current_values(booking) -> dict:
+    return {name: getattr(booking, name) for name in booking.TRACKED_FIELDS}
+
+
+def loaded_values(booking):
+    """Values as last read from / written to the database, or None if unknown."""
+    values = getattr(booking, "_loaded_values", None)
+    if values is None or any(name not in values for name in booking.TRACKED_FIELDS):
+        return None
+    return values
+
+
+def _merge(changes, key, counters, sign):
+    target = changes[key]
+    for field, delta in counters.items():
+        target[field] = target.get(field, 0) + sign * delta
+
+
+def booking_changed(previous, current) -> None:
+    """
+    Move a booking's contribution from `previous` to `current` (field value
+    dicts, see current_values()); previous is None for new bookings and
+    current is None for deleted ones.
+    """
+    changes = defaultdict(dict)
+    if previous is not None:
+        _merge(changes, *booking_contribution(previous), -1)
+    if current is not None:
+        _merge(changes, *booking_contribution(current), 1)
+    _apply_on_commit(changes)
+
+
+def bookings_created(bookings) -> None:
+    """For bulk_create paths, which do not send post_save."""
+    changes = defaultdict(dict)
+    for booking in bookings:
+        _merge(changes, *booking_contribution(current_values(booking)), 1)
+        booking._loaded_values = current_values(booking)
+    _apply_on_commit(changes)
+
+
+def bookings_updated(bookings) -> None:
+    """For bulk_update paths, which do not send post_save. `bookings` were loaded from the database."""
+    changes = defaultdict(dict)
+    for booking in bookings:
+        _merge(changes, *booking_contribution(loaded_values(booking)), -1)
+        booking._loaded_values = current_values(booking)
+        _merge(changes, *booking_contribution(booking._loaded_values), 1)
+    _apply_on_commit(changes)
+
+
+def bonus_transaction_changed(tx, sign: int) -> None:
+    from bookings.models import Booking, BonusTransaction
+
+    try:
+        booking = tx.booking
+    except Booking.DoesNotExist:
+        # Deleted in the same cascade; its day is being removed anyway
+        return
+    if booking is None:
+        return
+    field = "bonus_accrued" if tx.type == BonusTransaction.ACCRUAL else "bonus_redeemed"
+    key = (booking.bathhouse_id, booking.room_id, local_date(booking.start_time))
+    changes = defaultdict(dict)
+    _merge(changes, key, {field: tx.amount}, sign)
+    _apply_on_commit(changes)
+
+
+def _apply_on_commit(changes) -> None:
+    changes = {
+        key: {field: delta for field, delta in counters.items() if delta}
+        for key, counters in changes.items()
+    }
+    changes = {key: counters for key, counters in changes.items() if counters}
+    if changes:
+        transaction.on_commit(lambda: apply_changes(changes), robust=True)
+
+
+def apply_changes(changes) -> None:
+    from bookings.models import DailyRoomStats
+
+    for (bathhouse_id, room_id, day), counters in changes.items():
+        updates = {field: F(field) + delta for field, delta in counters.items()}
+        if DailyRoomStats.objects.filter(room_id=room_id, date=day).update(**updates):
+            continue
+        if all(delta <= 0 for delta in counters.values()):
+            # Nothing to subtract from; the row will be correct after a rebuild.
+            continue
+        try:
+            with transaction.atomic():
+                DailyRoomStats.objects.create(
+                    bathhouse_id=bathhouse_id, room_id=room_id, date=day, **counters
+                )
+        except IntegrityError:
+            # Created concurrently by another request
+            DailyRoomStats.objects.filter(room_id=room_id, date=day).update(**updates)
+
+
+def rebuild(date_from: date, date_to: date, bathhouse_id=None) -> int:
+    """Recompute DailyRoomStats for [date_from, date_to] from bookings and the ledger."""
+    from bookings.models import Booking, BonusTransaction, DailyRoomStats
+
+    decimal_zero = Value(ZERO, output_field=DecimalField(max_digits=14, decimal_places=2))
+    bookings = Booking.objects.annotate(
+        day=TruncDate("start_time", tzinfo=LOCAL_TZ)
+    ).filter(day__gte=date_from, day__lte=date_to)
+    transactions = BonusTransaction.objects.filter(booking__isnull=False).annotate(
+        day=TruncDate("booking__start_time", tzinfo=LOCAL_TZ)
+    ).filter(day__gte=date_from, day__lte=date_to)
+    stats = DailyRoomStats.objects.filter(date__gte=date_from, date__lte=date_to)
+    if bathhouse_id is not None:
+        bookings = bookings.filter(bathhouse_id=bathhouse_id)
+        transactions = transactions.filter(booking__bathhouse_id=bathhouse_id)
+        stats = stats.filter(bathhouse_id=bathhouse_id)
+
+    rows = {}
+    promotion_counts = {
+        field: Count("id", filter=Q(promotions_applied__contains=[{"type": promotion}]))
+        for promotion, field in PROMOTION_COUNTERS.items()
+    }
+    for row in bookings.values("bathhouse_id", "room_id", "day").annotate(
+        bookings_count=Count("id"),
+        booked_hours=Coalesce(Sum("hours"), 0),
+        revenue=Coalesce(Sum("final_price"), decimal_zero),
+        paid_bookings_count=Count("id", filter=Q(is_paid=True)),
+        paid_revenue=Coalesce(Sum("final_price", filter=Q(is_paid=True)), decimal_zero),
+        **promotion_counts,
+    ):
+        key = (row.pop("room_id"), row.pop("day"))
+        rows[key] = DailyRoomStats(room_id=key[0], date=key[1], **row)
+
+    for row in transactions.values(
+        "booking__bathhouse_id", "booking__room_id", "day"
+    ).annotate(
+        accrued=Coalesce(Sum("amount", filter=Q(type=BonusTransaction.ACCRUAL)), decimal_zero),
+        redeemed=Coalesce(Sum("amount", filter=Q(type=BonusTransaction.REDEMPTION)), decimal_zero),
+    ):
+        key = (row["booking__room_id"], row["day"])
+        if key not in rows:
+            rows[key] = DailyRoomStats(
+                bathhouse_id=row["booking__bathhouse_id"], room_id=key[0], date=key[1]
+            )
+        rows[key].bonus_accrued = row["accrued"]
+        rows[key].bonus_redeemed = row["redeemed"]
+
+    with transaction.atomic():
+        stats.delete()
+        DailyRoomStats.objects.bulk_create(rows.values(), batch_size=1000)
+    return len(rows)
+
+
+def open_hours_per_day(bathhouse) -> int:
+    """Hours a room can be booked on a regular day."""
+    if bathhouse.is_24_hours or not bathhouse.start_of_work or not bathhouse.end_of_work:
+        return 24
+    start = timedelta(hours=bathhouse.start_of_work.hour, minutes=bathhouse.start_of_work.minute)
+    end = timedelta(hours=bathhouse.end_of_work.hour, minutes=bathhouse.end_of_work.minute)
+    if end <= start:  # Overnight working hours
+        end += timedelta(days=1)
+    return max(1, round((end - start).total_seconds() / 3600))
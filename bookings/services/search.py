@@ -0,0 +1,100 @@
+"""
+Booking search by customer name and phone.
+
+Matching is plain substring matching, which PostgreSQL answers from the
+pg_trgm GIN indexes on UPPER(name) and on phone_normalized (see
+Booking.Meta.indexes), so it stays fast for "%...%" patterns. Matches are
+ranked by trigram similarity with a boost for prefix matches.
+"""
+from __future__ import annotations
+
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db.models import Case, Count, FloatField, Max, Q, Value, When
+from django.db.models.functions import Greatest, Upper
+
+from bookings.models import Booking
+from bookings.utils import normalize_phone
+
+MIN_QUERY_LENGTH = 2
+MIN_PHONE_DIGITS = 3
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+
+def clean_query(query) -> str:
+    return " ".join((query or "").split())
+
+
+def query_digits(query: str) -> str:
+    """
+    Phone digits of the query, with a national number rewritten to +7, also
+    while it is still being typed ("8 701" looks for "7701").
+    """
+    digits = normalize_phone(query).lstrip("+")
+    if query.startswith("8") and digits.startswith("8"):
+        digits = "7" + digits[1:]
+    return digits if len(digits) >= MIN_PHONE_DIGITS else ""
+
+
+def search_condition(query: str) -> Q:
+    condition = Q(name__icontains=query)
+    digits = query_digits(query)
+    if digits:
+        condition |= Q(phone_normalized__contains=digits)
+    return condition
+
+
+def rank_expression(query: str):
+    name_rank = TrigramSimilarity(Upper("name"), query.upper()) + Case(
+        When(name__istartswith=query, then=Value(0.5)),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+    digits = query_digits(query)
+    if not digits:
+        return name_rank
+    phone_rank = Case(
+        When(phone_normalized__startswith="+" + digits, then=Value(1.0)),
+        When(phone_normalized__contains=digits, then=Value(0.8)),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+    return Greatest(name_rank, phone_rank)
+
+
+def search_bookings(bathhouse_ids, query: str, limit: int = DEFAULT_LIMIT):
+    """Best matching bookings of the given bathhouses, most relevant first."""
+    return (
+        Booking.objects.filter(bathhouse_id__in=bathhouse_ids)
+        .filter(search_condition(query))
+        .annotate(rank=rank_expression(query))
+        .order_by("-rank", "-start_time")
+        .values(
+            "id",
+            "name",
+            "phone",
+            "start_time",
+            "hours",
+            "bathhouse_id",
+            "room_id",
+            "room__room_number",
+            "confirmed",
+            "is_paid",
+            "rank",
+        )[:limit]
+    )
+
+
+def suggest_customers(bathhouse_ids, query: str, limit: int = DEFAULT_LIMIT):
+    """Distinct (name, normalized phone) pairs for as-you-type autocomplete."""
+    return (
+        Booking.objects.filter(bathhouse_id__in=bathhouse_ids)
+        .filter(search_condition(query))
+        .values("name", "phone_normalized")
+        .annotate(
+            rank=Max(rank_expression(query)),
+            last_visit=Max("start_time"),
+            bookings=Count("id"),
+        )
+        .order_by("-rank", "-last_visit")[:limit]
+    )
@@ -0,0 +1,409 @@
+"""
+Synthetic data for load and scale testing (`manage.py seed_load`).
+
+Everything is drawn from one random.Random(seed) and laid out relative to an
+anchor date, so the same seed and anchor always produce the same rows (UUIDs
+included). Bookings are generated room by room and day by day, so they never
+overlap and memory stays flat; rows are written with bulk_create in chunks,
+which bypasses save() and the signals. DailyRoomStats, CustomerProfile and
+the heatmaps are therefore rebuilt once at the end (unless skipped).
+
+Seeded bathhouses are named with SEED_PREFIX so they can be purged later.
+"""
+from __future__ import annotations
+
+import logging
+import random
+import uuid
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import connection, transaction
+
+from bookings.models import Booking, BonusAccount, BonusTransaction
+from bookings.services import customers, heatmaps, rollups
+from bookings.services.rollups import LOCAL_TZ
+from users.models import Bathhouse, BathhouseItem, ExtraItem, MenuCategory, Room, User
+
+log = logging.getLogger(__name__)
+
+SEED_PREFIX = "[seed] "
+SEED_ADMIN_USERNAME = "seed_admin"
+
+WEEKDAYS = ("MONDAY", "TUESDAY", "WEDNESDAY", "THURSDAY", "FRIDAY", "SATURDAY", "SUNDAY")
+HAPPY_HOURS = (time(10, 0), time(16, 0))
+EVENING_START_HOURS = (17, 18, 19, 20, 21)
+# Booking length in hours -> relative weight
+HOURS_WEIGHTS = {1: 5, 2: 40, 3: 30, 4: 15, 5: 7, 6: 3}
+REGULARS_SHARE = 0.4
+
+FIRST_NAMES = (
+    "Алексей", "Айдар", "Дмитрий", "Ерлан", "Иван", "Нурлан", "Сергей", "Тимур",
+    "Анна", "Айгерим", "Дана", "Екатерина", "Жанна", "Мария", "Ольга", "Сауле",
+)
+LAST_NAMES = (
+    "Ахметов", "Иванов", "Касымов", "Ким", "Смирнов", "Сулейменов", "Петров", "Омаров",
+)
+MENU = {
+    "Напитки": (("Чай травяной", 1500), ("Квас", 1200), ("Морс", 1000), ("Пиво", 1800)),
+    "Еда": (("Шашлык", 4500), ("Плов", 3500), ("Сырная тарелка", 3000)),
+    "Веники": (("Веник берёзовый", 2500), ("Веник дубовый", 3000), ("Веник эвкалиптовый", 3500)),
+    "Аксессуары": (("Простыня", 800), ("Полотенце", 700), ("Шапка для бани", 1500)),
+}
+
+
+DEFAULT_OPTIONS = {
+    "bathhouses": 5,
+    "rooms_per_bathhouse": 4,
+    "customers_per_bathhouse": 2000,
+    "bookings": 100_000,
+    "days_back": 365,
+    "days_ahead": 60,
+    "evening_share": 0.55,  # bookings starting 17:00-21:00
+    "happy_hours_share": 0.15,  # bookings inside the weekday Happy Hours window
+    "birthday_rate": 0.03,
+    "paid_rate": 0.9,  # of past bookings
+    "extras_rate": 0.5,
+    "redemption_rate": 0.1,
+    "seed": 42,
+    "anchor": None,  # date the history / future is laid around, default today
+    "chunk_size": 5000,
+    "admin_password": None,  # for SEED_ADMIN_USERNAME, the owner of every seeded bathhouse
+}
+
+
+class LoadSeeder:
+    def __init__(self, options: dict, progress=None):
+        self.options = {**DEFAULT_OPTIONS, **options}
+        self.rng = random.Random(self.options["seed"])
+        self.anchor = self.options["anchor"] or datetime.now(LOCAL_TZ).date()
+        self.progress = progress or (lambda message: None)
+        self.hours_choices = list(HOURS_WEIGHTS)
+        self.hours_weights = list(HOURS_WEIGHTS.values())
+        self.counts = {"bookings": 0, "extra_items": 0, "bonus_accounts": 0, "bonus_transactions": 0}
+        self._reset_buffers()
+
+    def _reset_buffers(self):
+        self.booking_rows = []
+        self.extra_rows = []
+        self.new_accounts = []
+        self.transaction_rows = []
+
+    def uuid(self) -> uuid.UUID:
+        return uuid.UUID(int=self.rng.getrandbits(128), version=4)
+
+    def run(self) -> dict:
+        bathhouses = self.create_bathhouses()
+        self.accounts = {}
+        room_days = [
+            (bathhouse, room, items)
+            for bathhouse, rooms, items in bathhouses
+            for room in rooms
+        ]
+        days = [
+            self.anchor + timedelta(days=offset)
+            for offset in range(-self.options["days_back"], self.options["days_ahead"])
+        ]
+        per_room_day = self.options["bookings"] / max(1, len(room_days) * len(days))
+        for day in days:
+            for bathhouse, room, items in room_days:
+                # Expected bookings per room and day, with weekends 30% busier
+                expected = per_room_day * (1.3 if day.weekday() >= 5 else 0.88)
+                count = int(expected) + (1 if self.rng.random() < expected % 1 else 0)
+                if count:
+                    self.add_room_day(bathhouse, room, items, day, count)
+            if len(self.booking_rows) >= self.options["chunk_size"]:
+                self.flush()
+        self.flush()
+        return self.counts
+
+    # ---- Catalogue ----
+
+    def create_bathhouses(self):
+        owner, created = User.objects.get_or_create(
+            username=SEED_ADMIN_USERNAME, defaults={"role": "bath_admin"}
+        )
+        if self.options["admin_password"]:
+            owner.set_password(self.options["admin_password"])
+            owner.save(update_fields=["password"])
+        elif created:
+            owner.set_unusable_password()
+            owner.save(update_fields=["password"])
+
+        result = []
+        for index in range(self.options["bathhouses"]):
+            is_24_hours = index % 3 == 2
+            bathhouse = Bathhouse.objects.create(
+                name=f"{SEED_PREFIX}Баня №{index + 1}",
+                address=f"г. Алматы, ул. Нагрузочная, {index + 1}",
+                owner=owner,
+                phone=f"+7727000{index:04d}",
+                is_24_hours=is_24_hours,
+                start_of_work=None if is_24_hours else time(10, 0),
+                end_of_work=None if is_24_hours else time(2, 0),
+                happy_hours_enabled=True,
+                happy_hours_start_time=HAPPY_HOURS[0],
+                happy_hours_end_time=HAPPY_HOURS[1],
+                happy_hours_discount_percentage=Decimal("20.00"),
+                happy_hours_days=list(WEEKDAYS[:5]),
+                birthday_discount_enabled=True,
+                birthday_discount_percentage=Decimal("10.00"),
+                bonus_hour_enabled=index % 2 == 0,
+                min_hours_for_bonus=3,
+                bonus_hours_awarded=1,
+                bonus_hour_days=list(WEEKDAYS[:4]),
+                bonus_threshold_amount=Decimal("20000.00"),
+                lower_bonus_percentage=Decimal("3.00"),
+                higher_bonus_percentage=Decimal("5.00"),
+            )
+            rooms = Room.objects.bulk_create(
+                [
+                    Room(
+                        bathhouse=bathhouse,
+                        room_number=str(number + 1),
+                        capacity=f"{self.rng.choice((4, 6, 8, 10, 15))} человек",
+                        is_sauna=number % 2 == 0,
+                        is_bathhouse=number % 2 == 1,
+                        price_per_hour=Decimal(self.rng.randrange(3000, 15001, 500)),
+                        holiday_price_per_hour=Decimal(self.rng.randrange(5000, 20001, 500)),
+                        has_pool=self.rng.random() < 0.5,
+                        has_steam_room=True,
+                        heated_by_wood=self.rng.random() < 0.7,
+                    )
+                    for number in range(self.options["rooms_per_bathhouse"])
+                ]
+            )
+            items = []
+            for category_name, category_items in MENU.items():
+                category = MenuCategory.objects.create(name=category_name, bathhouse=bathhouse)
+                items += BathhouseItem.objects.bulk_create(
+                    [
+                        BathhouseItem(
+                            bathhouse=bathhouse, category=category, name=name, price=Decimal(price)
+                        )
+                        for name, price in category_items
+                    ]
+                )
+            customer_pool = [
+                (
+                    f"{self.rng.choice(FIRST_NAMES)} {self.rng.choice(LAST_NAMES)}",
+                    f"+7700{index:02d}{number:05d}",
+                )
+                for number in range(self.options["customers_per_bathhouse"])
+            ]
+            bathhouse.seed_customers = customer_pool
+            result.append((bathhouse, rooms, items))
+            self.progress(f"Created {bathhouse.name} with {len(rooms)} rooms")
+        return result
+
+    # ---- Bookings ----
+
+    def open_hours(self, bathhouse):
+        """Local start hours (may exceed 23 for after-midnight) a room is open on a day."""
+        if bathhouse.is_24_hours:
+            return 0, 24
+        return 10, 16  # 10:00 .. 02:00
+
+    def add_room_day(self, bathhouse, room, items, day, count):
+        opens, length = self.open_hours(bathhouse)
+        busy = [False] * length
+        weekday = WEEKDAYS[day.weekday()]
+        for _ in range(count):
+            for _attempt in range(5):
+                hours = self.rng.choices(self.hours_choices, self.hours_weights)[0]
+                roll = self.rng.random() - self.options["evening_share"]
+                if roll < 0:
+                    start = self.rng.choice(EVENING_START_HOURS)
+                elif roll < self.options["happy_hours_share"] and weekday in bathhouse.happy_hours_days:
+                    hours = min(hours, 3)
+                    start = self.rng.randrange(HAPPY_HOURS[0].hour, HAPPY_HOURS[1].hour - hours + 1)
+                else:
+                    start = self.rng.randrange(opens, opens + length - hours + 1)
+                slot = start - opens
+                if slot < 0 or slot + hours > length or any(busy[slot:slot + hours]):
+                    continue
+                busy[slot:slot + hours] = [True] * hours
+                self.add_booking(bathhouse, room, items, day, start, hours)
+                break
+
+    def add_booking(self, bathhouse, room, items, day, start_hour, hours):
+        start_local = datetime.combine(day, time()).replace(tzinfo=LOCAL_TZ) + timedelta(hours=start_hour)
+        is_past = day < self.anchor
+        name, phone = self.pick_customer(bathhouse)
+        booking = Booking(
+            id=self.uuid(),
+            bathhouse=bathhouse,
+            room=room,
+            name=name,
+            phone=phone,
+            phone_normalized=phone,
+            start_time=start_local,
+            hours=hours,
+            confirmed=True,
+            is_paid=self.rng.random() < (self.options["paid_rate"] if is_past else 0.2),
+            is_birthday=self.rng.random() < self.options["birthday_rate"],
+        )
+
+        extras = []
+        if items and self.rng.random() < self.options["extras_rate"]:
+            for item in self.rng.sample(items, self.rng.randint(1, min(3, len(items)))):
+                extras.append(ExtraItem(item=item, booking=booking, quantity=self.rng.randint(1, 3)))
+        booking.final_price, booking.promotions_applied = self.price(
+            bathhouse, room, extras, start_local, hours, booking.is_birthday
+        )
+
+        self.booking_rows.append(booking)
+        self.extra_rows += extras
+        if booking.is_paid and is_past:
+            self.add_bonus_transactions(bathhouse, booking)
+
+    def pick_customer(self, bathhouse):
+        # Regulars (the first 5% of the pool) make REGULARS_SHARE of the visits
+        pool = bathhouse.seed_customers
+        if self.rng.random() < REGULARS_SHARE:
+            return pool[self.rng.randrange(max(1, len(pool) // 20))]
+        return pool[self.rng.randrange(len(pool))]
+
+    def price(self, bathhouse, room, extras, start_local, hours, is_birthday):
+        """Same rules as Booking.calculate_final_price(), without its queries."""
+        end_local = start_local + timedelta(hours=hours)
+        weekday = WEEKDAYS[start_local.weekday()]
+        promotions = []
+        happy_hours = (
+            start_local.time() >= bathhouse.happy_hours_start_time
+            and end_local.time() <= bathhouse.happy_hours_end_time
+            and start_local.date() == end_local.date()
+            and weekday in bathhouse.happy_hours_days
+        )
+        chargeable = hours
+        bonus_hour = (
+            not happy_hours
+            and bathhouse.bonus_hour_enabled
+            and hours >= bathhouse.min_hours_for_bonus
+            and weekday in bathhouse.bonus_hour_days
+        )
+        if bonus_hour:
+            chargeable = max(0, hours - bathhouse.bonus_hours_awarded)
+
+        total = room.price_per_hour * chargeable + sum(
+            (extra.item.price * extra.quantity for extra in extras), Decimal("0.00")
+        )
+        if happy_hours:
+            percent = bathhouse.happy_hours_discount_percentage
+            discount = (total * percent / Decimal("100")).quantize(Decimal("0.01"))
+            total -= discount
+            promotions.append({"type": "HAPPY_HOURS", "percent": str(percent), "amount": str(discount)})
+        if is_birthday and not happy_hours:
+            percent = bathhouse.birthday_discount_percentage
+            discount = (total * percent / Decimal("100")).quantize(Decimal("0.01"))
+            total -= discount
+            promotions.append({"type": "BIRTHDAY", "percent": str(percent), "amount": str(discount)})
+        if bonus_hour:
+            promotions.append({"type": "BONUS_HOUR", "hours_awarded": bathhouse.bonus_hours_awarded})
+        return total.quantize(Decimal("0.01")), promotions
+
+    def add_bonus_transactions(self, bathhouse, booking):
+        """Redeem part of the balance now and then, and accrue like accrue_bonus_for_booking()."""
+        key = (bathhouse.id, booking.phone_normalized)
+        account = self.accounts.get(key)
+        if account is None:
+            account = BonusAccount(
+                bathhouse=bathhouse, phone=booking.phone, phone_normalized=booking.phone_normalized
+            )
+            self.accounts[key] = account
+            self.new_accounts.append(account)
+
+        if account.balance > 0 and self.rng.random() < self.options["redemption_rate"]:
+            amount = min(account.balance, (booking.final_price * Decimal("0.2")).quantize(Decimal("0.01")))
+            if amount > 0:
+                account.balance -= amount
+                self.transaction_rows.append(
+                    BonusTransaction(
+                        account=account, booking=booking, type=BonusTransaction.REDEMPTION, amount=amount
+                    )
+                )
+
+        if bathhouse.bonus_threshold_amount > 0 and booking.final_price >= bathhouse.bonus_threshold_amount:
+            percent = bathhouse.higher_bonus_percentage
+        else:
+            percent = bathhouse.lower_bonus_percentage
+        amount = (booking.final_price * percent / Decimal("100")).quantize(Decimal("0.01"))
+        if amount > 0:
+            account.balance += amount
+            self.transaction_rows.append(
+                BonusTransaction(
+                    account=account, booking=booking, type=BonusTransaction.ACCRUAL, amount=amount
+                )
+            )
+
+    def flush(self):
+        if not self.booking_rows:
+            return
+        batch_size = self.options["chunk_size"]
+        with transaction.atomic():
+            Booking.objects.bulk_create(self.booking_rows, batch_size=batch_size)
+            ExtraItem.objects.bulk_create(self.extra_rows, batch_size=batch_size)
+            BonusAccount.objects.bulk_create(self.new_accounts, batch_size=batch_size)
+            BonusTransaction.objects.bulk_create(self.transaction_rows, batch_size=batch_size)
+        self.counts["bookings"] += len(self.booking_rows)
+        self.counts["extra_items"] += len(self.extra_rows)
+        self.counts["bonus_accounts"] += len(self.new_accounts)
+        self.counts["bonus_transactions"] += len(self.transaction_rows)
+        self._reset_buffers()
+        self.progress(f"Inserted {self.counts['bookings']} bookings...")
+
+    def save_balances(self):
+        BonusAccount.objects.bulk_update(
+            list(self.accounts.values()), ["balance"], batch_size=self.options["chunk_size"]
+        )
+
+
+def seed(options: dict, progress=None) -> dict:
+    seeder = LoadSeeder(options, progress)
+    counts = seeder.run()
+    seeder.save_balances()
+    return {**counts, "anchor": seeder.anchor}
+
+
+def rebuild_aggregates(anchor: date, days_back: int, days_ahead: int) -> None:
+    """Refresh what bulk_create skipped: daily stats, customer profiles and heatmaps."""
+    date_from = anchor - timedelta(days=days_back)
+    date_to = anchor + timedelta(days=days_ahead)
+    for bathhouse_id in seeded_bathhouses().values_list("id", flat=True):
+        rollups.rebuild(date_from, date_to, bathhouse_id=bathhouse_id)
+        customers.rebuild(bathhouse_id)
+    heatmaps.refresh_heatmaps(full=True)
+
+
+def seeded_bathhouses():
+    return Bathhouse.objects.filter(name__startswith=SEED_PREFIX)
+
+
+def _table(model) -> str:
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def purge() -> int:
+    """
+    Delete previously seeded bathhouses. Their bookings and ledgers are removed
+    with plain SQL DELETEs: going through QuerySet.delete() would load every
+    row and fire the per-booking aggregate signals.
+    """
+    from bookings.models import CustomerProfile, DailyRoomStats, OccupancyHeatmap
+
+    bathhouse_ids = list(seeded_bathhouses().values_list("id", flat=True))
+    in_bathhouses = "bathhouse_id = ANY(%s)"
+    statements = [
+        f"DELETE FROM {_table(BonusTransaction)} WHERE account_id IN "
+        f"(SELECT id FROM {_table(BonusAccount)} WHERE {in_bathhouses})",
+        f"DELETE FROM {_table(ExtraItem)} WHERE booking_id IN "
+        f"(SELECT id FROM {_table(Booking)} WHERE {in_bathhouses})",
+    ] + [
+        f"DELETE FROM {_table(model)} WHERE {in_bathhouses}"
+        for model in (Booking, BonusAccount, CustomerProfile, DailyRoomStats, OccupancyHeatmap)
+    ]
+    with transaction.atomic(), connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql, [bathhouse_ids])
+        Bathhouse.objects.filter(id__in=bathhouse_ids).delete()
+    return len(bathhouse_ids)
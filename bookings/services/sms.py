@@ -0,0 +1,100 @@
+"""
+Pluggable SMS providers.
+
+settings.SMS_PROVIDER is a dotted path to a BaseSMSProvider subclass. The
+console and file providers never leave the machine and are meant for local
+development and tests; outside STAGE=DEV the default is
+UnconfiguredSMSProvider, so a missing setting fails loudly instead of printing
+customers' codes to stdout.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import sys
+from functools import lru_cache
+
+import httpx
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+log = logging.getLogger(__name__)
+
+
+class SMSError(RuntimeError):
+    pass
+
+
+class BaseSMSProvider:
+    def send(self, phone: str, text: str) -> None:
+        raise NotImplementedError
+
+
+class ConsoleSMSProvider(BaseSMSProvider):
+    """Writes messages to stdout."""
+
+    def send(self, phone: str, text: str) -> None:
+        sys.stdout.write(f"SMS to {phone}: {text}\n")
+        sys.stdout.flush()
+
+
+class UnconfiguredSMSProvider(BaseSMSProvider):
+    """Default outside DEV: refuses to be used until SMS_PROVIDER is set."""
+
+    def __init__(self):
+        raise ImproperlyConfigured(
+            "SMS_PROVIDER is not set; use e.g. bookings.services.sms.SMSCProvider"
+        )
+
+
+class FileSMSProvider(BaseSMSProvider):
+    """Appends one JSON line per message to settings.SMS_FILE_PATH."""
+
+    def send(self, phone: str, text: str) -> None:
+        line = json.dumps(
+            {"phone": phone, "text": text, "sent_at": timezone.now().isoformat()},
+            ensure_ascii=False,
+        )
+        with open(settings.SMS_FILE_PATH, "a", encoding="utf-8") as fh:
+            fh.write(line + "\n")
+
+
+class SMSCProvider(BaseSMSProvider):
+    """smsc.kz HTTP API."""
+
+    API_URL = "https://smsc.kz/sys/send.php"
+
+    def send(self, phone: str, text: str) -> None:
+        if not settings.SMSC_LOGIN or not settings.SMSC_PASSWORD:
+            raise SMSError("SMSC_LOGIN / SMSC_PASSWORD not set")
+        params = {
+            "login": settings.SMSC_LOGIN,
+            "psw": settings.SMSC_PASSWORD,
+            "phones": phone,
+            "mes": text,
+            "charset": "utf-8",
+            "fmt": 3,  # JSON response
+        }
+        if settings.SMSC_SENDER:
+            params["sender"] = settings.SMSC_SENDER
+        try:
+            with httpx.Client(timeout=10) as client:
+                r = client.post(self.API_URL, data=params)
+                r.raise_for_status()
+                data = r.json()
+        except httpx.HTTPError as e:
+            log.exception("Failed to send SMS via SMSC")
+            raise SMSError(str(e)) from e
+        if "error" in data:
+            raise SMSError(f"SMSC error {data.get('error_code')}: {data['error']}")
+
+
+@lru_cache(maxsize=None)
+def get_sms_provider() -> BaseSMSProvider:
+    return import_string(settings.SMS_PROVIDER)()
+
+
+def send_sms(phone: str, text: str) -> None:
+    get_sms_provider().send(phone, text)
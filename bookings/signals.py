@@ -0,0 +1,63 @@
+import logging
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Booking, BonusAccount, BonusTransaction
+from .services import customers, rollups
+from .services.reminders import cancel_booking_reminders, schedule_booking_reminders
+
+log = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=Booking)
+def reschedule_reminders_on_save(sender, instance, **kwargs):
+    update_fields = kwargs.get("update_fields")
+    if update_fields and not {"start_time", "confirmed"} & set(update_fields):
+        return
+    transaction.on_commit(lambda: schedule_booking_reminders(instance))
+
+
+@receiver(post_delete, sender=Booking)
+def cancel_reminders_on_delete(sender, instance, **kwargs):
+    booking_id = instance.id
+    transaction.on_commit(lambda: cancel_booking_reminders(booking_id))
+
+
+@receiver(post_save, sender=Booking)
+def update_aggregates_on_booking_save(sender, instance, created, **kwargs):
+    previous = None
+    if not created:
+        previous = rollups.loaded_values(instance)
+        if previous is None:
+            log.warning("Booking %s saved without a snapshot, aggregates not updated", instance.pk)
+            instance._loaded_values = rollups.current_values(instance)
+            return
+    current = rollups.current_values(instance)
+    rollups.booking_changed(previous, current)
+    customers.booking_changed(previous, current)
+    instance._loaded_values = current
+
+
+@receiver(post_delete, sender=Booking)
+def update_aggregates_on_booking_delete(sender, instance, **kwargs):
+    previous = rollups.loaded_values(instance) or rollups.current_values(instance)
+    rollups.booking_changed(previous, None)
+    customers.booking_changed(previous, None)
+
+
+@receiver(post_save, sender=BonusTransaction)
+def update_rollups_on_bonus_transaction(sender, instance, created, **kwargs):
+    if created:
+        rollups.bonus_transaction_changed(instance, 1)
+
+
+@receiver(post_delete, sender=BonusTransaction)
+def revert_rollups_on_bonus_transaction_delete(sender, instance, **kwargs):
+    rollups.bonus_transaction_changed(instance, -1)
+
+
+@receiver(post_save, sender=BonusAccount)
+def update_customer_balance(sender, instance, **kwargs):
+    customers.bonus_account_saved(instance)
@@ -1,9 +1,18 @@
+import logging
 from datetime import timedelta
 from celery import shared_task
 from django.utils import timezone
 
-from bookings.serializers import CONFIRMATION_TIMEOUT_MINUTES
-from .models import Booking, accrue_bonus_for_booking
+from users.services.telegram import TelegramError, send_message
+
+from .models import Booking, BookingSeries, accrue_bonus_for_booking
+from .services import idempotency
+from .services.heatmaps import refresh_heatmaps
+from .services.notifications import new_booking_text, new_group_booking_text, new_series_text
+from .services.reminders import dispatch_due_reminders
+from .services.sms import SMSError, send_sms
+
+log = logging.getLogger(__name__)
 
 
 @shared_task
@@ -11,7 +20,8 @@ def delete_unconfirmed_booking(booking_id):
     try:
         booking = Booking.objects.get(id=booking_id)
         if not booking.confirmed:
-            booking.delete()
+            # Scheduled for the first booking of a group or series, on behalf of all of them
+            Booking.created_together(booking.id).filter(confirmed=False).delete()
     except Booking.DoesNotExist:
         pass
 
@@ -19,8 +29,10 @@ def delete_unconfirmed_booking(booking_id):
 @shared_task
 def clean_expired_bookings():
     threshold_time = timezone.now() - timedelta(minutes=10)
-    Booking.objects.filter(confirmed=False, created_at__lte=threshold_time).delete()
-    print("Deleted unconfirmed bookings older than 10 minutes.")
+    _, deleted = Booking.objects.filter(confirmed=False, created_at__lte=threshold_time).delete()
+    log.info(
+        "Deleted %d unconfirmed bookings older than 10 minutes", deleted.get("bookings.Booking", 0)
+    )
 
 
 @shared_task
@@ -47,3 +59,94 @@ def accrue_finished_booking_bonuses():
         except Exception:
             # Avoid breaking the whole task on a single failure
             continue
+
+
+@shared_task
+def dispatch_booking_reminders():
+    """
+    Send every pre-visit reminder that became due since the last run.
+    Scheduled by beat once a minute; reminders live in Redis, not in the queue.
+    """
+    return dispatch_due_reminders()
+
+
+@shared_task(
+    autoretry_for=(SMSError,),
+    retry_backoff=True,
+    max_retries=3,
+    ignore_result=True,
+)
+def send_sms_task(phone, text):
+    send_sms(phone, text)
+
+
+@shared_task(
+    autoretry_for=(TelegramError,),
+    retry_backoff=True,
+    max_retries=3,
+    ignore_result=True,
+)
+def notify_new_booking(booking_id):
+    """Telegram message to the notification chat; queued when the booking is committed."""
+    booking = (
+        Booking.objects.select_related("bathhouse", "room")
+        .prefetch_related("extra_items")
+        .filter(id=booking_id)
+        .first()
+    )
+    if booking is None:
+        # Deleted (e.g. unconfirmed) before the worker got to it
+        return
+    send_message(chat_type="notification", text=new_booking_text(booking))
+
+
+@shared_task(
+    autoretry_for=(TelegramError,),
+    retry_backoff=True,
+    max_retries=3,
+    ignore_result=True,
+)
+def notify_new_group_booking(group_id):
+    """One Telegram message for all bookings of a group booking."""
+    bookings = list(
+        Booking.objects.select_related("bathhouse", "room")
+        .prefetch_related("extra_items")
+        .filter(group_id=group_id)
+        .order_by("start_time", "room__room_number")
+    )
+    if not bookings:
+        return
+    send_message(chat_type="notification", text=new_group_booking_text(bookings))
+
+
+@shared_task(
+    autoretry_for=(TelegramError,),
+    retry_backoff=True,
+    max_retries=3,
+    ignore_result=True,
+)
+def notify_new_series(series_id):
+    """One Telegram message for a new booking series."""
+    series = BookingSeries.objects.select_related("bathhouse", "room").filter(id=series_id).first()
+    if series is None:
+        return
+    bookings = list(series.bookings.order_by("start_time").only("start_time"))
+    if not bookings:
+        # Unconfirmed and deleted before the worker got to it
+        return
+    send_message(chat_type="notification", text=new_series_text(series, bookings))
+
+
+@shared_task
+def refresh_occupancy_heatmaps(full=False):
+    """
+    Fold bookings created since the last run into the weekday x hour heatmaps,
+    or rebuild them from every confirmed booking with full=True (nightly).
+    """
+    return refresh_heatmaps(full=full)
+
+
+@shared_task
+def purge_idempotency_records():
+    deleted = idempotency.purge_expired()
+    log.info("Deleted %d expired idempotency records", deleted)
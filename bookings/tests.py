@@ -1,3 +1,1485 @@
-from django.test import TestCase
+import threading
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from urllib.parse import urlencode
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from importlib import import_module
+from redis import RedisError
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+
+from sauna.db_router import STICKY_COOKIE, STICKY_HEADER, routing
+from sauna.redis_client import get_redis
+from sauna.testing import AsyncReadParityMixin, QueryBudgetMixin, build_dataset
+from users.models import Bathhouse, BathhouseItem, Room, User
+from . import async_views, serializers
+from .models import (
+    Booking,
+    BookingSeries,
+    BonusAccount,
+    BonusTransaction,
+    CustomerProfile,
+    DailyRoomStats,
+    IdempotencyRecord,
+    OccupancyHeatmap,
+)
+from .serializers import BookingSerializer
+from .services import benchmarks, heatmaps, holds, idempotency, otp, reminders, rollups, seeding, sms
+from .services.notifications import new_group_booking_text
+from .tasks import delete_unconfirmed_booking
+from .utils import normalize_phone
+
+
+class AdminChangelistQueryCountTests(TestCase):
+    """
+    Changelist pages must issue the same number of queries whether they show
+    a handful of rows or a full page, and stay under a small fixed budget.
+    """
+
+    MAX_QUERIES = 12
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser("admin", "admin@example.com", "pass", role="superadmin")
+        cls.bathhouses = [
+            Bathhouse.objects.create(name=f"Bathhouse {i}", address="Almaty", is_24_hours=True)
+            for i in range(3)
+        ]
+        cls.rooms = [
+            Room.objects.create(bathhouse=bathhouse, room_number=str(n))
+            for bathhouse in cls.bathhouses
+            for n in range(3)
+        ]
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def create_rows(self, count):
+        start = timezone.now()
+        offset = Booking.objects.count()
+        bookings = Booking.objects.bulk_create(
+            Booking(
+                bathhouse=room.bathhouse,
+                room=room,
+                name=f"Guest {i}",
+                phone=f"+7700000{i:04d}",
+                start_time=start + timedelta(hours=i),
+                final_price=Decimal("1000.00"),
+            )
+            for i, room in ((i, self.rooms[i % len(self.rooms)]) for i in range(offset, offset + count))
+        )
+        accounts = BonusAccount.objects.bulk_create(
+            BonusAccount(bathhouse=booking.bathhouse, phone=booking.phone) for booking in bookings
+        )
+        BonusTransaction.objects.bulk_create(
+            BonusTransaction(
+                account=account, booking=booking, type=BonusTransaction.ACCRUAL, amount=Decimal("50.00")
+            )
+            for account, booking in zip(accounts, bookings)
+        )
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def assertConstantQueries(self, url):
+        self.create_rows(3)
+        small = self.count_queries(url)
+        self.create_rows(60)
+        large = self.count_queries(url)
+        self.assertEqual(small, large)
+        self.assertLessEqual(large, self.MAX_QUERIES)
+
+    def test_booking_changelist(self):
+        self.assertConstantQueries(reverse("admin:bookings_booking_changelist"))
+
+    def test_booking_changelist_filtered_by_bathhouse(self):
+        url = reverse("admin:bookings_booking_changelist")
+        self.assertConstantQueries(f"{url}?bathhouse__id__exact={self.bathhouses[0].pk}")
+
+    def test_bonus_account_changelist(self):
+        self.assertConstantQueries(reverse("admin:bookings_bonusaccount_changelist"))
+
+    def test_bonus_transaction_changelist(self):
+        self.assertConstantQueries(reverse("admin:bookings_bonustransaction_changelist"))
+
+
+@override_settings(THROTTLING_ENABLED=False)
+class BookingsEndpointQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """
+    Query budgets for the bookings API per role, rerun on 10x and 100x the
+    data by the subclasses below; an N+1 in BookingSerializer fails here.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = build_dataset(cls.SCALE)
+
+    def test_booking_list(self):
+        url = reverse("booking-list")
+        self.assertQueryBudget("anonymous", f"{url}?phone_number={self.data.booking.phone}", 2)
+        self.assertQueryBudget("bath_admin", url, 2)
+        self.assertQueryBudget("bath_admin", f"{url}?bathhouse_id={self.data.bathhouse.pk}", 2)
+        self.assertQueryBudget("superadmin", url, 2)
+
+    def test_booking_detail(self):
+        url = reverse("booking-detail", args=[self.data.booking.pk])
+        self.assertQueryBudget("bath_admin", url, 2)
+        self.assertQueryBudget("superadmin", url, 2)
+        self.assertQueryBudget("anonymous", url, 0, status=401)
+
+    def test_room_bookings(self):
+        url = reverse("booking-get-room-bookings")
+        self.assertQueryBudget("anonymous", f"{url}?room_id={self.data.room.pk}", 2)
+
+    def test_booking_create(self):
+        items = BathhouseItem.objects.filter(bathhouse=self.data.bathhouse)
+        payload = {
+            "bathhouse": self.data.bathhouse.pk,
+            "room": self.data.room.pk,
+            "name": "Guest",
+            "phone": "+77020000000",
+            "start_time": (timezone.now() + timedelta(days=3)).isoformat(),
+            "hours": 2,
+            "extra_items_data": [{"item": item.pk, "quantity": 2} for item in items],
+        }
+        # bathhouse, room, extra items, room lock, availability, two inserts,
+        # extras for the response, and the savepoint around the transaction
+        response = self.assertQueryBudget(
+            "anonymous",
+            reverse("booking-list"),
+            10,
+            method="post",
+            status=201,
+            data=payload,
+            format="json",
+        )
+        self.assertEqual(len(response.data["extra_items"]), items.count())
+
+    def test_bonus(self):
+        query = f"?bathhouse_id={self.data.bathhouse.pk}&phone={self.data.booking.phone}"
+        self.assertQueryBudget("anonymous", reverse("bonus-balance") + query, 1)
+        self.assertQueryBudget("anonymous", reverse("bonus-transactions") + query, 2)
+
+    def test_reports(self):
+        bathhouse = f"bathhouse_id={self.data.bathhouse.pk}"
+        today = timezone.localdate()
+        dates = f"date_from={today}&date_to={today + timedelta(days=30)}"
+        for role in ("bath_admin", "superadmin"):
+            with self.subTest(role=role):
+                self.assertQueryBudget(
+                    role,
+                    f"{reverse('booking-stats')}?{bathhouse}&{dates}",
+                    4,
+                )
+                self.assertQueryBudget(
+                    role, f"{reverse('occupancy-heatmap')}?{bathhouse}&include_rooms=1", 2
+                )
+                self.assertQueryBudget(role, f"{reverse('customer-list')}?{bathhouse}", 3)
+                self.assertQueryBudget(role, f"{reverse('booking-search')}?q=Guest", 1)
+
+    def test_exports(self):
+        for role in ("bath_admin", "superadmin"):
+            with self.subTest(role=role):
+                self.assertQueryBudget(role, reverse("export-bookings", args=["csv"]), 1)
+                self.assertQueryBudget(role, reverse("export-bonus-transactions", args=["csv"]), 1)
+
+
+class BookingsEndpointQueryBudgetTests10x(BookingsEndpointQueryBudgetTests):
+    SCALE = 10
+
+
+class BookingsEndpointQueryBudgetTests100x(BookingsEndpointQueryBudgetTests):
+    SCALE = 100
+
+
+@override_settings(THROTTLING_ENABLED=False, ALLOWED_HOSTS=["testserver"])
+class AsyncReadParityTests(AsyncReadParityMixin, TestCase):
+    """The async handlers served under ASGI answer byte for byte like the DRF views."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = build_dataset()
+
+    def test_room_bookings(self):
+        url = reverse("booking-get-room-bookings")
+        response = self.assertSameAsSync(async_views.room_bookings, url, {"room_id": self.data.room.pk})
+        self.assertNotEqual(response.content, b"[]")
+        self.assertSameAsSync(async_views.room_bookings, url)
+
+    def test_bonus(self):
+        params = {"bathhouse_id": self.data.bathhouse.pk, "phone": self.data.booking.phone}
+        for handler, name in (
+            (async_views.bonus_balance, "bonus-balance"),
+            (async_views.bonus_transaction_list, "bonus-transactions"),
+        ):
+            with self.subTest(name=name):
+                self.assertSameAsSync(handler, reverse(name), params)
+                self.assertSameAsSync(handler, reverse(name), {**params, "phone": "+77000000000"})
+                self.assertSameAsSync(handler, reverse(name), {**params, "bathhouse_id": "x"})
+                self.assertSameAsSync(handler, reverse(name), {"phone": params["phone"]})
+
+
+@skipUnless("replica1" in settings.DATABASES, "needs POSTGRES_REPLICA_HOSTS")
+@override_settings(DATABASE_REPLICAS=["replica1"], THROTTLING_ENABLED=False, ALLOWED_HOSTS=["testserver"])
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    replica1 is a separate database without replication, so which rows come
+    back shows where a request read from: "Primary" exists only on the
+    primary, "Replica" only on the replica. Not a TestCase: its transaction
+    around each test would keep every read on the primary.
+    """
+
+    # Only aliases that exist, or the runner rejects the class even when skipped
+    databases = {"default", "replica1"} & set(settings.DATABASES)
+
+    def setUp(self):
+        self.bathhouse = Bathhouse.objects.create(name="Bathhouse", address="Almaty", is_24_hours=True)
+        self.room = Room.objects.create(bathhouse=self.bathhouse, room_number="1", price_per_hour=Decimal("5000.00"))
+        self.bathhouse.save(using="replica1", force_insert=True)
+        self.room.save(using="replica1", force_insert=True)
+
+        start = timezone.now() + timedelta(days=1)
+        for name, db, hour in (("Primary", "default", 0), ("Replica", "replica1", 6)):
+            Booking(
+                bathhouse=self.bathhouse,
+                room=self.room,
+                name=name,
+                phone="+77010000000",
+                start_time=start + timedelta(hours=hour),
+                hours=2,
+                final_price=Decimal("10000.00"),
+            ).save(using=db)
+        self.url = reverse("booking-get-room-bookings")
+
+    def read_names(self, client=None, **headers):
+        response = (client or self.client).get(self.url, {"room_id": self.room.pk}, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        return [booking["name"] for booking in response.json()]
+
+    def book(self, **overrides):
+        return self.client.post(
+            reverse("booking-list"),
+            {
+                "bathhouse": self.bathhouse.pk,
+                "room": self.room.pk,
+                "name": "Guest",
+                "phone": "+77020000000",
+                "start_time": (timezone.now() + timedelta(days=2)).isoformat(),
+                "hours": 2,
+                **overrides,
+            },
+            content_type="application/json",
+        )
+
+    def test_reads_go_to_the_replica(self):
+        self.assertEqual(self.read_names(), ["Replica"])
+
+    def test_client_reads_its_writes_from_the_primary(self):
+        response = self.book()
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertIn(STICKY_COOKIE, response.cookies)
+        self.assertGreater(float(response[STICKY_HEADER]), time.time())
+
+        self.assertIn("Guest", self.read_names())
+        self.assertEqual(self.read_names(self.client_class()), ["Replica"])
+
+    def test_sticky_header(self):
+        self.assertIn("Primary", self.read_names(**{STICKY_HEADER: str(time.time() + 60)}))
+        self.assertEqual(self.read_names(**{STICKY_HEADER: str(time.time() - 1)}), ["Replica"])
+        self.assertEqual(self.read_names(**{STICKY_HEADER: "soon"}), ["Replica"])
+
+    def test_failed_write_does_not_stick(self):
+        response = self.book(hours=0)
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+        self.assertEqual(self.read_names(), ["Replica"])
+
+    def test_availability_is_checked_on_the_primary(self):
+        # The replica has not seen "Primary" yet; the overlap is still caught
+        start = Booking.objects.using("default").get(name="Primary").start_time
+        with routing("replica1"), self.assertRaises(ValidationError) as ctx:
+            BookingSerializer.check_availability(
+                self.room, start + timedelta(hours=1), 2, "+77020000000"
+            )
+        self.assertEqual(ctx.exception.get_codes(), ["overlap"])
+
+    def test_reads_in_a_transaction_go_to_the_primary(self):
+        with routing("replica1"):
+            self.assertEqual(Booking.objects.get(name="Replica").name, "Replica")
+            with transaction.atomic():
+                self.assertTrue(Booking.objects.filter(name="Primary").exists())
+
+
+class ConcurrentBookingTests(TransactionTestCase):
+    """Simultaneous requests for the same slot: exactly one booking is created."""
+
+    def setUp(self):
+        self.bathhouse = Bathhouse.objects.create(name="Bathhouse", address="Almaty", is_24_hours=True)
+        self.room = Room.objects.create(bathhouse=self.bathhouse, room_number="1", price_per_hour=Decimal("5000.00"))
+
+    def test_same_slot(self):
+        start_time = timezone.now() + timedelta(days=1)
+        barrier = threading.Barrier(4)
+        outcomes = []
+
+        def book(n):
+            serializer = BookingSerializer(
+                data={
+                    "bathhouse": self.bathhouse.pk,
+                    "room": self.room.pk,
+                    "name": f"Guest {n}",
+                    "phone": f"+7702000000{n}",
+                    "start_time": start_time + timedelta(minutes=30 * n),
+                    "hours": 2,
+                }
+            )
+            try:
+                serializer.is_valid(raise_exception=True)
+                barrier.wait()
+                serializer.save()
+                outcomes.append("created")
+            except ValidationError as e:
+                outcomes.extend(e.get_codes())
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=book, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(outcomes), ["created", "overlap", "overlap", "overlap"])
+        self.assertEqual(Booking.objects.count(), 1)
+
+
+@override_settings(THROTTLING_ENABLED=False)
+class SlotHoldTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.bathhouse = Bathhouse.objects.create(name="Bathhouse", address="Almaty", is_24_hours=True)
+        cls.room = Room.objects.create(bathhouse=cls.bathhouse, room_number="1", price_per_hour=Decimal("5000.00"))
+
+    def setUp(self):
+        self.start_time = (timezone.now() + timedelta(days=1)).replace(microsecond=0)
+        self.hold_ids = []
+
+    def tearDown(self):
+        client = get_redis()
+        client.delete(holds.ROOM_KEY.format(room_id=self.room.pk))
+        for hold_id in self.hold_ids:
+            client.delete(holds.HOLD_KEY.format(hold_id=hold_id))
+
+    def hold(self, hours_from_start=0, hours=2, **extra):
+        response = self.client.post(
+            reverse("slot-hold"),
+            {
+                "room": self.room.pk,
+                "start_time": (self.start_time + timedelta(hours=hours_from_start)).isoformat(),
+                "hours": hours,
+                "phone": "+77020000000",
+                **extra,
+            },
+            content_type="application/json",
+        )
+        if response.status_code == 201:
+            self.hold_ids.append(response.data["hold_id"])
+        return response
+
+    def book(self, **extra):
+        return self.client.post(
+            reverse("booking-list"),
+            {
+                "bathhouse": self.bathhouse.pk,
+                "room": self.room.pk,
+                "name": "Guest",
+                "phone": "+77020000000",
+                "start_time": self.start_time.isoformat(),
+                "hours": 2,
+                **extra,
+            },
+            content_type="application/json",
+        )
+
+    def test_overlapping_hold_is_refused(self):
+        self.assertEqual(self.hold().status_code, 201)
+        response = self.hold(hours_from_start=1)
+        self.assertEqual(response.status_code, 409)
+        self.assertGreater(int(response["Retry-After"]), 0)
+        self.assertEqual(self.hold(hours_from_start=2).status_code, 201)
+
+    def test_booking_honors_other_holds(self):
+        hold_id = self.hold().data["hold_id"]
+        response = self.book()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["non_field_errors"][0].code, "held")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.book(hold_id=hold_id)
+        self.assertEqual(response.status_code, 201, response.data)
+        # Released with the booking
+        self.assertFalse(holds.held_by_others(self.room.pk, self.start_time, self.start_time + timedelta(hours=2)))
+
+    def test_release(self):
+        hold_id = self.hold().data["hold_id"]
+        url = reverse("slot-hold-detail", args=[hold_id])
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.delete(url).status_code, 404)
+        self.assertEqual(self.hold().status_code, 201)
+
+    def test_expired_hold_does_not_block(self):
+        with override_settings(SLOT_HOLD_TTL_SECONDS=0):
+            self.assertEqual(self.hold().status_code, 201)
+        self.assertEqual(self.hold().status_code, 201)
+        self.assertEqual(self.hold().status_code, 409)
+
+    def test_slot_must_be_bookable(self):
+        response = self.hold(hours_from_start=24 * 30)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["non_field_errors"][0].code, "too_far_ahead")
+        response = self.hold(phone="")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("phone", response.data)
+
+    def test_holds_are_throttled_per_phone(self):
+        client = get_redis()
+        for key in client.scan_iter("throttle:slot_hold*"):
+            client.delete(key)
+        with override_settings(THROTTLING_ENABLED=True):
+            statuses = [
+                self.hold(hours_from_start=3 * i, REMOTE_ADDR=f"10.0.0.{i}").status_code for i in range(6)
+            ]
+        self.assertEqual(statuses, [201] * 5 + [429])
+
+    def test_booked_slot_cannot_be_held(self):
+        self.assertEqual(self.book().status_code, 201)
+        response = self.hold(hours_from_start=1)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["non_field_errors"][0].code, "overlap")
+
+
+@override_settings(THROTTLING_ENABLED=False)
+class IdempotencyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.bathhouse = Bathhouse.objects.create(name="Bathhouse", address="Almaty", is_24_hours=True)
+        cls.room = Room.objects.create(bathhouse=cls.bathhouse, room_number="1", price_per_hour=Decimal("5000.00"))
+        cls.admin = User.objects.create_superuser("root", "root@example.com", "pass")
+
+    def setUp(self):
+        self.start_time = (timezone.now() + timedelta(days=1)).replace(microsecond=0)
+
+    def tearDown(self):
+        client = get_redis()
+        keys = list(client.scan_iter("idempotency:*"))
+        if keys:
+            client.delete(*keys)
+
+    def book(self, key, ip="127.0.0.1", **extra):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                reverse("booking-list"),
+                {
+                    "bathhouse": self.bathhouse.pk,
+                    "room": self.room.pk,
+                    "name": "Guest",
+                    "phone": "+77020000000",
+                    "start_time": self.start_time.isoformat(),
+                    "hours": 2,
+                    **extra,
+                },
+                content_type="application/json",
+                headers={"Idempotency-Key": key},
+                REMOTE_ADDR=ip,
+            )
+
+    def test_retry_replays_the_first_response(self):
+        first = self.book("retry-1")
+        self.assertEqual(first.status_code, 201, first.data)
+        retry = self.book("retry-1")
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_anonymous_clients_do_not_share_keys(self):
+        first = self.book("shared", ip="10.0.0.1")
+        self.assertEqual(first.status_code, 201, first.data)
+        other = self.book("shared", ip="10.0.0.2")
+        # Runs as its own request, so it is refused as a double booking instead of replayed
+        self.assertNotIn("Idempotent-Replayed", other)
+        self.assertNotEqual(other.status_code, 201)
+        self.assertEqual(Booking.objects.count(), 1)
+        self.assertEqual(self.book("shared", ip="10.0.0.1")["Idempotent-Replayed"], "true")
+
+    def test_key_reused_for_another_request(self):
+        self.assertEqual(self.book("reused").status_code, 201)
+        self.assertEqual(self.book("reused", hours=3).status_code, 422)
+
+    def test_errors_are_not_stored(self):
+        self.assertEqual(self.book("fixed", hours=0).status_code, 400)
+        self.assertEqual(self.book("fixed").status_code, 201)
+
+    def test_in_flight_duplicate_gets_409(self):
+        scope = "booking_create:anon:127.0.0.1"
+        get_redis().set(idempotency.LOCK_KEY.format(scope=scope, key="busy"), "other", px=5000)
+        with override_settings(IDEMPOTENCY_WAIT_SECONDS=0.2):
+            response = self.book("busy")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response["Retry-After"], "1")
+        self.assertFalse(Booking.objects.exists())
+
+    def test_database_fallback(self):
+        with mock.patch.object(idempotency, "get_redis", side_effect=RedisError):
+            first = self.book("fallback")
+            retry = self.book("fallback")
+        self.assertEqual(first.status_code, 201, first.data)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(Booking.objects.count(), 1)
+        self.assertEqual(IdempotencyRecord.objects.get().status_code, 201)
+
+    def test_payment_retry_redeems_once(self):
+        booking = Booking.objects.create(
+            bathhouse=self.bathhouse,
+            room=self.room,
+            name="Guest",
+            phone="+77020000000",
+            start_time=self.start_time,
+            hours=2,
+            confirmed=True,
+        )
+        account = BonusAccount.objects.create(
+            bathhouse=self.bathhouse, phone="+77020000000", phone_normalized="+77020000000", balance=Decimal("3000.00")
+        )
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        url = reverse("booking-process-payment", args=[booking.pk])
+        query = "?" + urlencode({"bathhouse_id": self.bathhouse.pk, "phone": booking.phone})
+        responses = [
+            client.post(url + query, {"amount": 2000}, format="json", headers={"Idempotency-Key": "pay-1"})
+            for _ in range(2)
+        ]
+
+        self.assertEqual([r.status_code for r in responses], [200, 200])
+        self.assertEqual(responses[1].json(), responses[0].json())
+        account.refresh_from_db()
+        self.assertEqual(account.balance, Decimal("1000.00"))
+        self.assertEqual(BonusTransaction.objects.filter(type=BonusTransaction.REDEMPTION).count(), 1)
+
+    def test_paid_booking_is_not_paid_again(self):
+        booking = Booking.objects.create(
+            bathhouse=self.bathhouse,
+            room=self.room,
+            name="Guest",
+            phone="+77020000000",
+            start_time=self.start_time,
+            hours=2,
+            confirmed=True,
+        )
+        account = BonusAccount.objects.create(
+            bathhouse=self.bathhouse, phone="+77020000000", balance=Decimal("3000.00")
+        )
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        url = reverse("booking-process-payment", args=[booking.pk])
+        query = "?" + urlencode({"bathhouse_id": self.bathhouse.pk, "phone": booking.phone})
+        # Different keys, so each request runs
+        responses = [
+            client.post(url + query, {"amount": amount}, format="json", headers={"Idempotency-Key": f"pay-{n}"})
+            for n, amount in enumerate([1000, 1000, 0])
+        ]
+
+        self.assertEqual([r.status_code for r in responses], [200, 409, 409])
+        account.refresh_from_db()
+        self.assertEqual(BonusTransaction.objects.filter(type=BonusTransaction.REDEMPTION).count(), 1)
+        self.assertEqual(account.balance, Decimal("2000.00"))
+
+
+@override_settings(THROTTLING_ENABLED=False)
+class GroupBookingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.bathhouse = Bathhouse.objects.create(name="Bathhouse", address="Almaty", is_24_hours=True)
+        cls.rooms = [
+            Room.objects.create(bathhouse=cls.bathhouse, room_number=str(n), price_per_hour=Decimal("5000.00"))
+            for n in range(1, 4)
+        ]
+        cls.item = BathhouseItem.objects.create(bathhouse=cls.bathhouse, name="Tea", price=Decimal("500.00"))
+
+    def setUp(self):
+        self.start_time = (timezone.now() + timedelta(days=1)).replace(microsecond=0)
+
+    def book_group(self, slots):
+        with mock.patch.object(serializers, "notify_new_group_booking") as notify:
+            with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as ctx:
+                response = self.client.post(
+                    reverse("booking-create-group"),
+                    {
+                        "bathhouse": self.bathhouse.pk,
+                        "name": "Company",
+                        "phone": "+77020000000",
+                        "slots": slots,
+                    },
+                    content_type="application/json",
+                )
+        # Queries of the request itself, without the on_commit rollups
+        self.queries = len(ctx)
+        return response, notify
+
+    def slot(self, room, hours_from_start=0, hours=3, **extra):
+        start_time = self.start_time + timedelta(hours=hours_from_start)
+        return {"room": room.pk, "start_time": start_time.isoformat(), "hours": hours, **extra}
+
+    def test_rooms_are_booked_together(self):
+        slots = [
+            self.slot(room, extra_items_data=[{"item": self.item.pk, "quantity": 2}]) for room in self.rooms
+        ]
+        response, notify = self.book_group(slots)
+
+        self.assertEqual(response.status_code, 201, response.data)
+        bookings = Booking.objects.filter(group_id=response.data["group_id"])
+        self.assertEqual(bookings.count(), 3)
+        self.assertEqual(response.data["final_price"], str(3 * (3 * Decimal("5000.00") + 2 * Decimal("500.00"))))
+        notify.delay.assert_called_once_with(bookings[0].group_id)
+        # bathhouse, rooms, items, the savepoint pair, room locks, availability,
+        # a booking insert per room, extras and extras for the response
+        self.assertEqual(self.queries, 12)
+
+    def test_taken_slot_rejects_the_whole_group(self):
+        Booking.objects.create(
+            bathhouse=self.bathhouse, room=self.rooms[1], name="Other", phone="+77021111111",
+            start_time=self.start_time + timedelta(hours=2), hours=2,
+        )
+        response, notify = self.book_group([self.slot(room) for room in self.rooms])
+
+        self.assertEqual(response.status_code, 400)
+        # Raised under the room locks in create(), after validation
+        self.assertEqual(response.data[0].code, "overlap")
+        self.assertEqual(Booking.objects.count(), 1)
+        notify.delay.assert_not_called()
+
+    def test_overlapping_slots_in_one_request(self):
+        response, _ = self.book_group([self.slot(self.rooms[0]), self.slot(self.rooms[0], hours_from_start=2)])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["non_field_errors"][0].code, "overlap")
+
+        response, _ = self.book_group([self.slot(self.rooms[0]), self.slot(self.rooms[0], hours_from_start=3)])
+        self.assertEqual(response.status_code, 201, response.data)
+
+    def test_rooms_of_another_bathhouse(self):
+        other = Bathhouse.objects.create(name="Other", address="Almaty", is_24_hours=True)
+        room = Room.objects.create(bathhouse=other, room_number="1", price_per_hour=Decimal("5000.00"))
+        response, _ = self.book_group([self.slot(self.rooms[0]), self.slot(room)])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["non_field_errors"][0].code, "invalid_room")
+
+    def test_unconfirmed_group_is_deleted_together(self):
+        response, _ = self.book_group([self.slot(room) for room in self.rooms[:2]])
+        bookings = list(Booking.objects.filter(group_id=response.data["group_id"]).order_by("start_time", "room"))
+        Booking.objects.filter(group_id=response.data["group_id"]).update(confirmed=False)
+
+        self.assertIn("Новая групповая бронь", new_group_booking_text(bookings))
+        delete_unconfirmed_booking(response.data["bookings"][0]["id"])
+        self.assertFalse(Booking.objects.exists())
+
+
+@override_settings(THROTTLING_ENABLED=False)
+class BookingSeriesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.bathhouse = Bathhouse.objects.create(name="Bathhouse", address="Almaty", is_24_hours=True)
+        cls.room = Room.objects.create(bathhouse=cls.bathhouse, room_number="1", price_per_hour=Decimal("5000.00"))
+        cls.admin = User.objects.create_superuser("root", "root@example.com", "pass")
+
+    def setUp(self):
+        self.start_time = (timezone.now() + timedelta(days=2)).replace(minute=0, second=0, microsecond=0)
+
+    def create_series(self, weeks=8, **extra):
+        with mock.patch.object(serializers, "notify_new_series") as notify:
+            with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as ctx:
+                response = self.client.post(
+                    reverse("bookingseries-list"),
+                    {
+                        "bathhouse": self.bathhouse.pk,
+                        "room": self.room.pk,
+                        "name": "Regular",
+                        "phone": "+77020000000",
+                        "start_time": self.start_time.isoformat(),
+                        "hours": 3,
+                        "until": (timezone.localdate(self.start_time) + timedelta(weeks=weeks)).isoformat(),
+                        **extra,
+                    },
+                    content_type="application/json",
+                )
+        self.queries = len(ctx)
+        self.notify = notify
+        return response
+
+    def book(self, week):
+        return Booking.objects.create(
+            bathhouse=self.bathhouse,
+            room=self.room,
+            name="Other",
+            phone="+77021111111",
+            start_time=self.start_time + timedelta(weeks=week, hours=1),
+            hours=1,
+        )
+
+    def test_occurrences_beyond_the_single_booking_horizon(self):
+        response = self.create_series()
+
+        self.assertEqual(response.status_code, 201, response.data)
+        bookings = Booking.objects.filter(series_id=response.data["id"]).order_by("start_time")
+        self.assertEqual(bookings.count(), 9)
+        self.assertEqual(bookings.last().start_time, self.start_time + timedelta(weeks=8))
+        self.assertEqual(bookings.first().final_price, Decimal("15000.00"))
+        self.notify.delay.assert_called_once()
+        # bathhouse, room, the savepoint pair, room lock, conflicts, the series
+        # and one insert for all occurrences, whatever their number
+        self.assertEqual(self.queries, 8)
+        stats = DailyRoomStats.objects.filter(room=self.room).aggregate(Sum("bookings_count"))
+        self.assertEqual(stats["bookings_count__sum"], 9)
+
+    def test_taken_date_fails_the_series(self):
+        self.book(week=3)
+        response = self.create_series()
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["non_field_errors"][0].code, "overlap")
+        taken = [datetime.fromisoformat(value) for value in response.data["taken"]]
+        self.assertEqual(taken, [self.start_time + timedelta(weeks=3)])
+        self.assertFalse(BookingSeries.objects.exists())
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_taken_dates_are_skipped(self):
+        self.book(week=3)
+        self.book(week=5)
+        response = self.create_series(on_conflict="skip")
+
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(len(response.data["bookings"]), 7)
+        self.assertEqual(len(response.data["skipped"]), 2)
+
+    def test_customer_overlap_in_another_room(self):
+        other_room = Room.objects.create(bathhouse=self.bathhouse, room_number="2", price_per_hour=Decimal("5000.00"))
+        Booking.objects.create(
+            bathhouse=self.bathhouse,
+            room=other_room,
+            name="Regular",
+            phone="8 702 000 00 00",
+            start_time=self.start_time + timedelta(weeks=2),
+            hours=1,
+        )
+        response = self.create_series(on_conflict="skip")
+
+        self.assertEqual(response.status_code, 201, response.data)
+        skipped = [datetime.fromisoformat(value) for value in response.data["skipped"]]
+        self.assertEqual(skipped, [self.start_time + timedelta(weeks=2)])
+
+    def test_single_booking_cannot_join_a_series(self):
+        series_id = self.create_series(weeks=1).data["id"]
+        response = self.client.post(
+            reverse("booking-list"),
+            {
+                "bathhouse": self.bathhouse.pk,
+                "room": self.room.pk,
+                "name": "Other",
+                "phone": "+77021111111",
+                "start_time": (self.start_time + timedelta(days=1)).isoformat(),
+                "hours": 1,
+                "series": series_id,
+            },
+            content_type="application/json",
+        )
+
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertIsNone(Booking.objects.get(pk=response.data["id"]).series_id)
+        self.assertEqual(Booking.objects.filter(series_id=series_id).count(), 2)
+
+    def test_horizon(self):
+        response = self.create_series(weeks=30)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["non_field_errors"][0].code, "too_far_ahead")
+
+    def test_reprice_and_cancel(self):
+        series_id = self.create_series().data["id"]
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        Room.objects.filter(pk=self.room.pk).update(price_per_hour=Decimal("6000.00"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(reverse("bookingseries-reprice", args=[series_id]))
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data["repriced"], 9)
+        self.assertEqual({b["final_price"] for b in response.data["bookings"]}, {"18000.00"})
+        revenue = DailyRoomStats.objects.filter(room=self.room).aggregate(Sum("revenue"))
+        self.assertEqual(revenue["revenue__sum"], 9 * Decimal("18000.00"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(reverse("bookingseries-cancel", args=[series_id]))
+        self.assertEqual(response.data["cancelled"], 9)
+        self.assertFalse(Booking.objects.exists())
+        self.assertEqual(client.post(reverse("bookingseries-cancel", args=[series_id])).status_code, 400)
+        self.assertEqual(self.client.post(reverse("bookingseries-cancel", args=[series_id])).status_code, 401)
+
+
+class NormalizePhoneTests(SimpleTestCase):
+    def test_formats(self):
+        for raw in ["+7 (701) 123-45-67", "87011234567", "7011234567", "0077011234567", " +77011234567 "]:
+            with self.subTest(raw=raw):
+                self.assertEqual(normalize_phone(raw), "+77011234567")
+        self.assertEqual(normalize_phone("+49 30 1234567"), "+49301234567")
+
+    def test_no_digits(self):
+        for raw in [None, "", "abc", "+", " - ", "00", "00 ()"]:
+            with self.subTest(raw=raw):
+                self.assertEqual(normalize_phone(raw), "")
+
+    def test_too_many_digits(self):
+        self.assertEqual(normalize_phone("+123456789012345"), "+123456789012345")
+        # 20 characters that would need a leading "+" to normalize
+        for raw in ["+1234567890123456", "12345678901234567890"]:
+            with self.subTest(raw=raw):
+                self.assertEqual(normalize_phone(raw), "")
+
+
+@override_settings(THROTTLING_ENABLED=False)
+class EmptyPhoneTests(TestCase):
+    """A phone without digits normalizes to "", the phone of every row saved before normalization."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.bathhouse = Bathhouse.objects.create(name="Bathhouse", address="Almaty", is_24_hours=True)
+        cls.room = Room.objects.create(bathhouse=cls.bathhouse, room_number="1", price_per_hour=Decimal("5000.00"))
+        cls.admin = User.objects.create_superuser("root", "root@example.com", "pass")
+        cls.booking = Booking.objects.create(
+            bathhouse=cls.bathhouse,
+            room=cls.room,
+            name="Legacy",
+            phone="+77020000000",
+            start_time=timezone.now() + timedelta(days=1),
+            hours=2,
+        )
+        # As left by migration 0011 before the backfill
+        Booking.objects.filter(pk=cls.booking.pk).update(phone_normalized="")
+        BonusAccount.objects.create(bathhouse=cls.bathhouse, phone="+77020000000", balance=Decimal("100.00"))
+        BonusAccount.objects.filter(bathhouse=cls.bathhouse).update(phone_normalized="")
+
+    def test_lookups_reject_it(self):
+        self.assertEqual(self.client.get(reverse("booking-list"), {"phone_number": "abc"}).status_code, 400)
+        params = {"bathhouse_id": self.bathhouse.pk, "phone": "x"}
+        self.assertEqual(self.client.get(reverse("bonus-balance"), params).status_code, 400)
+        self.assertEqual(self.client.get(reverse("bonus-transactions"), params).status_code, 400)
+
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        url = reverse("booking-process-payment", args=[self.booking.pk])
+        response = client.post(url + "?" + urlencode(params), {"amount": 0}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {"error": "Invalid phone number"})
+
+    def test_booking_requires_digits(self):
+        response = self.client.post(
+            reverse("booking-list"),
+            {
+                "bathhouse": self.bathhouse.pk,
+                "room": self.room.pk,
+                "name": "Guest",
+                "phone": "n/a",
+                "start_time": (timezone.now() + timedelta(days=2)).isoformat(),
+                "hours": 2,
+            },
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["phone"][0].code, "invalid_phone")
+
+    def test_overlong_phone_is_rejected_not_a_500(self):
+        for phone in ["12345678901234567890", "00"]:
+            with self.subTest(phone=phone):
+                response = self.client.post(
+                    reverse("booking-list"),
+                    {
+                        "bathhouse": self.bathhouse.pk,
+                        "room": self.room.pk,
+                        "name": "Guest",
+                        "phone": phone,
+                        "start_time": (timezone.now() + timedelta(days=2)).isoformat(),
+                        "hours": 2,
+                    },
+                    content_type="application/json",
+                )
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.data["phone"][0].code, "invalid_phone")
+
+    def test_backfill_skips_overlong_phones(self):
+        migration = import_module("bookings.migrations.0016_backfill_phone_normalized")
+        Booking.objects.filter(pk=self.booking.pk).update(phone="12345678901234567890")
+
+        with self.assertLogs(migration.log, "WARNING") as logs:
+            migration.backfill(global_apps, None)
+
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.phone_normalized, "")
+        self.assertIn(f"bookings [{self.booking.pk}]", logs.output[0])
+        self.assertEqual(BonusAccount.objects.get().phone_normalized, "+77020000000")
+
+    def test_backfill_migration(self):
+        migration = import_module("bookings.migrations.0016_backfill_phone_normalized")
+        BonusAccount.objects.create(bathhouse=self.bathhouse, phone="8 702 000 00 00", balance=Decimal("50.00"))
+        BonusAccount.objects.filter(bathhouse=self.bathhouse).update(phone_normalized="")
+
+        migration.backfill(global_apps, None)
+        import_module("bookings.migrations.0017_customerprofile_booking_start").rebuild(global_apps, None)
+
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.phone_normalized, "+77020000000")
+        account = BonusAccount.objects.get()
+        self.assertEqual((account.phone_normalized, account.balance), ("+77020000000", Decimal("150.00")))
+        self.assertEqual(CustomerProfile.objects.get(bathhouse=self.bathhouse).bookings_count, 1)
+
+
+class OccupancyHeatmapTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.bathhouse = Bathhouse.objects.create(name="Bathhouse", address="Almaty", is_24_hours=True)
+        cls.room = Room.objects.create(bathhouse=cls.bathhouse, room_number="1", price_per_hour=Decimal("5000.00"))
+
+    def book(self, days, confirmed=True):
+        return Booking.objects.create(
+            bathhouse=self.bathhouse,
+            room=self.room,
+            name="Guest",
+            phone=f"+7702000000{days}",
+            start_time=timezone.now() + timedelta(days=days),
+            hours=1,
+            confirmed=confirmed,
+        )
+
+    def refresh(self, hours=0, full=False):
+        # Past REFRESH_LAG, so bookings created before the call are included
+        now = timezone.now() + heatmaps.REFRESH_LAG + timedelta(hours=hours)
+        heatmaps.refresh_heatmaps(full=full, now=now)
+        heatmap = OccupancyHeatmap.objects.get(room=self.room)
+        return heatmap.bookings_count, heatmap.matrix
+
+    def cell(self, matrix, booking):
+        local = timezone.localtime(booking.start_time, heatmaps.LOCAL_TZ)
+        return matrix[local.weekday()][local.hour]
+
+    def test_incremental_runs_add_and_full_rebuild_corrects(self):
+        cancelled = self.book(days=1)
+        late = self.book(days=2, confirmed=False)
+        count, matrix = self.refresh()
+        self.assertEqual((count, self.cell(matrix, cancelled)), (1, 1))
+
+        cancelled.delete()
+        Booking.objects.filter(pk=late.pk).update(confirmed=True)
+        kept = self.book(days=3)
+        count, matrix = self.refresh(hours=1)
+        # Incremental: the deleted booking stays, the late confirmation is missed
+        self.assertEqual(count, 2)
+        self.assertEqual((self.cell(matrix, cancelled), self.cell(matrix, late)), (1, 0))
+
+        count, matrix = self.refresh(hours=1, full=True)
+        self.assertEqual(count, 2)
+        self.assertEqual(
+            [self.cell(matrix, booking) for booking in (cancelled, late, kept)], [0, 1, 1]
+        )
+
+    def test_nightly_rebuild_is_scheduled(self):
+        entry = settings.CELERY_BEAT_SCHEDULE["rebuild-occupancy-heatmaps"]
+        self.assertEqual(entry["task"], "bookings.tasks.refresh_occupancy_heatmaps")
+        self.assertEqual(entry["kwargs"], {"full": True})
+
+
+class OTPTests(TestCase):
+    booking_id = "b1"
+    phone = "+77020000000"
+
+    def setUp(self):
+        client = get_redis()
+        keys = list(client.scan_iter("otp:*"))
+        if keys:
+            client.delete(*keys)
+
+    def issue(self, code="1234", phone=phone):
+        with mock.patch.object(otp, "generate_random_4_digit_number", return_value=int(code)), mock.patch(
+            "bookings.tasks.send_sms_task"
+        ) as task, self.captureOnCommitCallbacks(execute=True):
+            otp.issue_code(otp.PURPOSE_CONFIRM, self.booking_id, phone)
+        return task
+
+    def verify(self, code):
+        return otp.verify_code(otp.PURPOSE_CONFIRM, self.booking_id, code)
+
+    def test_issue_and_verify(self):
+        task = self.issue(phone="8 702 000 00 00")
+        task.delay.assert_called_once_with(self.phone, "Код подтверждения брони: 1234")
+        # Only a hash of the code is stored
+        stored = get_redis().hgetall(otp.CODE_KEY.format(purpose=otp.PURPOSE_CONFIRM, booking_id=self.booking_id))
+        self.assertNotIn("1234", stored.values())
+
+        self.assertEqual(self.verify("0000"), otp.MISMATCH)
+        self.assertEqual(self.verify(" 1234 "), otp.VERIFIED)
+        # Consumed
+        self.assertEqual(self.verify("1234"), otp.MISSING)
+        self.assertEqual(otp.verify_code(otp.PURPOSE_CANCEL, self.booking_id, "1234"), otp.MISSING)
+
+    def test_wrong_attempts_drop_the_code(self):
+        self.issue()
+        for _ in range(settings.OTP_MAX_ATTEMPTS):
+            self.assertEqual(self.verify("0000"), otp.MISMATCH)
+        self.assertEqual(self.verify("1234"), otp.MISSING)
+
+    def test_resend_cooldown(self):
+        self.issue()
+        with self.assertRaises(otp.OTPThrottled) as ctx:
+            self.issue(phone="+7 702 000 0000")
+        self.assertGreater(ctx.exception.retry_after, 0)
+        self.assertLessEqual(ctx.exception.retry_after, settings.OTP_RESEND_COOLDOWN_SECONDS)
+
+    def test_hourly_cap(self):
+        cooldown = otp.COOLDOWN_KEY.format(phone=self.phone)
+        for _ in range(settings.OTP_MAX_SENDS_PER_HOUR):
+            self.issue()
+            get_redis().delete(cooldown)
+        with self.assertRaises(otp.OTPThrottled) as ctx:
+            self.issue()
+        self.assertGreater(ctx.exception.retry_after, settings.OTP_RESEND_COOLDOWN_SECONDS)
+
+    def test_redis_unavailable(self):
+        with mock.patch.object(otp, "get_script", side_effect=RedisError):
+            with self.assertRaises(otp.OTPError):
+                self.issue()
+            with self.assertRaises(otp.OTPError):
+                self.verify("1234")
+
+
+class SMSProviderTests(SimpleTestCase):
+    def tearDown(self):
+        sms.get_sms_provider.cache_clear()
+
+    @override_settings(SMS_PROVIDER="bookings.services.sms.UnconfiguredSMSProvider")
+    def test_unconfigured_provider_fails(self):
+        sms.get_sms_provider.cache_clear()
+        with self.assertRaises(ImproperlyConfigured):
+            sms.send_sms("+77020000000", "text")
+
+
+class BookingExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.bathhouse = Bathhouse.objects.create(name="Bathhouse", address="Almaty", is_24_hours=True)
+        cls.room = Room.objects.create(bathhouse=cls.bathhouse, room_number="1", price_per_hour=Decimal("5000.00"))
+        cls.admin = User.objects.create_superuser("root", "root@example.com", "pass", role="superadmin")
+        Booking.objects.create(
+            bathhouse=cls.bathhouse,
+            room=cls.room,
+            name='=HYPERLINK("http://example.com","x")',
+            phone="+77020000000",
+            start_time=timezone.now() + timedelta(days=1),
+            hours=2,
+        )
+
+    def export(self, file_format):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.get(reverse("export-bookings", args=[file_format]))
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content)
+
+    def test_csv_escapes_formulas(self):
+        content = self.export("csv").decode("utf-8-sig")
+        self.assertIn("'=HYPERLINK", content)
+        self.assertIn("'+77020000000", content)
+        self.assertNotIn(',=HYPERLINK', content)
+        self.assertNotIn('"=HYPERLINK', content)
+
+
+class BookingSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user("owner", "owner@example.com", "pass", role="bath_admin")
+        cls.bathhouse = Bathhouse.objects.create(
+            name="Bathhouse", address="Almaty", is_24_hours=True, owner=cls.owner
+        )
+        cls.other = Bathhouse.objects.create(name="Other", address="Almaty", is_24_hours=True)
+        cls.room = Room.objects.create(bathhouse=cls.bathhouse, room_number="1", price_per_hour=Decimal("5000.00"))
+        other_room = Room.objects.create(bathhouse=cls.other, room_number="1", price_per_hour=Decimal("5000.00"))
+        cls.admin = User.objects.create_superuser("root", "root@example.com", "pass", role="superadmin")
+        now = timezone.now()
+        for days, name, phone in [
+            (1, "Aidana", "+77011234567"),
+            (2, "Aidana", "+77011234567"),
+            (3, "Dana Aidarova", "+77057701000"),
+            (4, "Bolat", "+77050000000"),
+        ]:
+            Booking.objects.create(
+                bathhouse=cls.bathhouse,
+                room=cls.room,
+                name=name,
+                phone=phone,
+                start_time=now + timedelta(days=days),
+                hours=1,
+            )
+        Booking.objects.create(
+            bathhouse=cls.other,
+            room=other_room,
+            name="Aidana",
+            phone="+77011234567",
+            start_time=now + timedelta(days=5),
+            hours=1,
+        )
+
+    def search(self, user=None, **params):
+        client = APIClient()
+        client.force_authenticate(user or self.admin)
+        response = client.get(reverse("booking-search"), params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data["results"]
+
+    def test_prefix_matches_rank_first(self):
+        names = [row["name"] for row in self.search(q="Aida", bathhouse_id=self.bathhouse.pk)]
+        self.assertEqual(names, ["Aidana", "Aidana", "Dana Aidarova"])
+
+        phones = [row["phone"] for row in self.search(q="+7701", bathhouse_id=self.bathhouse.pk)]
+        # "+77011..." starts with the digits, "+77057701..." only contains them
+        self.assertEqual(phones, ["+77011234567", "+77011234567", "+77057701000"])
+
+    def test_partial_national_number(self):
+        for q in ["8701", "8 (701)", "+7 701"]:
+            with self.subTest(q=q):
+                rows = self.search(q=q, bathhouse_id=self.bathhouse.pk)
+                self.assertEqual([row["phone"] for row in rows][:2], ["+77011234567", "+77011234567"])
+        rows = self.search(q="8 (701) 12", bathhouse_id=self.bathhouse.pk)
+        self.assertEqual({row["phone"] for row in rows}, {"+77011234567"})
+
+    def test_staff_see_only_their_bathhouses(self):
+        rows = self.search(user=self.owner, q="Aidana")
+        self.assertEqual({row["bathhouse_id"] for row in rows}, {self.bathhouse.pk})
+        self.assertEqual(len(self.search(q="Aidana")), 3)
+
+        client = APIClient()
+        client.force_authenticate(self.owner)
+        response = client.get(reverse("booking-search"), {"q": "Aidana", "bathhouse_id": self.other.pk})
+        self.assertEqual(response.status_code, 404)
+
+    def test_suggest_returns_distinct_customers(self):
+        rows = self.search(q="Aida", bathhouse_id=self.bathhouse.pk, suggest="true")
+        self.assertEqual(
+            [(row["name"], row["phone"], row["bookings"]) for row in rows],
+            [("Aidana", "+77011234567", 2), ("Dana Aidarova", "+77057701000", 1)],
+        )
+
+
+class BenchmarkReportTests(SimpleTestCase):
+    def test_percentile(self):
+        values = list(range(100, 0, -1))
+        self.assertEqual(benchmarks.percentile(values, 50), 50)
+        self.assertEqual(benchmarks.percentile(values, 95), 95)
+        self.assertEqual(benchmarks.percentile(values, 100), 100)
+        self.assertEqual(benchmarks.percentile(values, 0), 1)
+        self.assertEqual(benchmarks.percentile([7], 99), 7)
+        self.assertIsNone(benchmarks.percentile([], 50))
+
+    def test_compare(self):
+        before = {"p50_ms": 10, "p95_ms": 20, "p99_ms": 40, "throughput_rps": 100, "queries_mean": 3, "errors": 0}
+        after = {"p50_ms": 10.5, "p95_ms": 30, "p99_ms": 30, "throughput_rps": 80, "queries_mean": 4, "errors": 1}
+        baseline = {"catalog_browse": before, "dropped": {"p50_ms": 10}}
+        current = {"catalog_browse": after, "new_scenario": {"p50_ms": 99}}
+        regressions = benchmarks.compare(baseline, current, tolerance=0.1)
+        self.assertEqual(
+            [(name, metric) for name, metric, *_ in regressions],
+            [
+                ("catalog_browse", "p95_ms"),
+                ("catalog_browse", "throughput_rps"),
+                ("catalog_browse", "queries_mean"),
+                ("catalog_browse", "errors"),
+            ],
+        )
+        self.assertAlmostEqual(regressions[0][4], 0.5)
+        self.assertEqual(benchmarks.compare(baseline, current, tolerance=1, query_tolerance=1)[-1][1], "errors")
+
+    def test_run_without_progress(self):
+        with mock.patch.dict(benchmarks.SCENARIOS, {"noop": (lambda rng, count: [], None)}), mock.patch.object(
+            benchmarks, "replay", return_value=([(5.0, 200, 2)], 1.0)
+        ):
+            report = benchmarks.run("http://testserver", ["noop"], 1, 1, seed=1)
+        self.assertEqual(report["noop"]["requests"], 1)
+
+
+class SeedPurgeTests(TestCase):
+    def test_purge_leaves_other_bathhouses(self):
+        bathhouse = Bathhouse.objects.create(name="Bathhouse", address="Almaty", is_24_hours=True)
+        room = Room.objects.create(bathhouse=bathhouse, room_number="1", price_per_hour=Decimal("5000.00"))
+        kept = Booking.objects.create(
+            bathhouse=bathhouse,
+            room=room,
+            name="Guest",
+            phone="+77020000000",
+            start_time=timezone.now() + timedelta(days=1),
+            hours=2,
+        )
+        counts = seeding.seed(
+            {
+                "bathhouses": 2,
+                "rooms_per_bathhouse": 2,
+                "customers_per_bathhouse": 5,
+                "bookings": 60,
+                "days_back": 5,
+                "days_ahead": 5,
+                "extras_rate": 0.5,
+            }
+        )
+        seeding.rebuild_aggregates(counts["anchor"], 5, 5)
+        self.assertGreater(counts["extra_items"], 0)
+        self.assertGreater(counts["bonus_transactions"], 0)
+
+        self.assertEqual(seeding.purge(), 2)
+
+        self.assertEqual(list(Booking.objects.values_list("pk", flat=True)), [kept.pk])
+        self.assertFalse(BonusTransaction.objects.exists())
+        self.assertFalse(seeding.seeded_bathhouses().exists())
+        self.assertFalse(DailyRoomStats.objects.exclude(bathhouse=bathhouse).exists())
+        self.assertFalse(CustomerProfile.objects.exclude(bathhouse=bathhouse).exists())
+
+
+class BookingReminderTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.bathhouse = Bathhouse.objects.create(name="Bathhouse", address="Almaty", is_24_hours=True)
+        cls.room = Room.objects.create(bathhouse=cls.bathhouse, room_number="1", price_per_hour=Decimal("5000.00"))
+
+    def setUp(self):
+        client = get_redis()
+        keys = list(client.scan_iter("reminders:*"))
+        if keys:
+            client.delete(*keys)
+        self.start_time = timezone.now() + timedelta(hours=3)
+
+    def book(self, confirmed=True):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Booking.objects.create(
+                bathhouse=self.bathhouse,
+                room=self.room,
+                name="Guest",
+                phone="+77020000000",
+                start_time=self.start_time,
+                hours=2,
+                confirmed=confirmed,
+            )
+
+    def dispatch(self, minutes_before_start):
+        with mock.patch.object(reminders, "send_message") as send:
+            sent = reminders.dispatch_due_reminders(self.start_time - timedelta(minutes=minutes_before_start))
+        return sent, [call.kwargs["text"] for call in send.call_args_list]
+
+    def test_due_reminders_are_sent_once(self):
+        booking = self.book()
+        self.assertEqual(
+            set(get_redis().hgetall(reminders.BOOKING_KEY.format(booking_id=booking.id))), {"120", "30"}
+        )
+
+        self.assertEqual(self.dispatch(121), (0, []))
+        sent, texts = self.dispatch(119)
+        self.assertEqual(sent, 1)
+        self.assertIn("через 2 ч", texts[0])
+        self.assertIn("Guest", texts[0])
+        self.assertEqual(self.dispatch(119), (0, []))
+        self.assertEqual(self.dispatch(29)[0], 1)
+
+    def test_rescheduled_and_deleted_bookings(self):
+        booking = self.book()
+        booking.start_time += timedelta(days=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.save(update_fields=["start_time"])
+        client = get_redis()
+        self.assertEqual(
+            client.hget(reminders.BOOKING_KEY.format(booking_id=booking.id), "30"),
+            str(reminders._minute(booking.start_time - timedelta(minutes=30))),
+        )
+        self.assertEqual(self.dispatch(29), (0, []))
+        self.assertEqual(client.zcard(reminders.BUCKETS_KEY), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.delete()
+        self.assertFalse(get_redis().exists(reminders.BOOKING_KEY.format(booking_id=booking.id)))
+
+    def test_unconfirmed_bookings_are_skipped(self):
+        self.book(confirmed=False)
+        self.assertEqual(self.dispatch(29), (0, []))
+
+    def test_failed_send_is_retried(self):
+        booking = self.book()
+        now = self.start_time - timedelta(minutes=29)
+        with mock.patch.object(reminders, "send_message", side_effect=RuntimeError):
+            self.assertEqual(reminders.dispatch_due_reminders(now), 0)
+        self.assertEqual(
+            get_redis().hget(reminders.BOOKING_KEY.format(booking_id=booking.id), "30"),
+            str(reminders._minute(self.start_time - timedelta(minutes=30))),
+        )
+
+        sent, texts = self.dispatch(28)
+        self.assertEqual(sent, 2)
+        self.assertEqual(len(texts), 2)
+        self.assertEqual(self.dispatch(27), (0, []))
+
+    def test_due_entries_are_popped_once(self):
+        booking = self.book()
+        now = self.start_time - timedelta(minutes=29)
+        self.assertEqual(
+            sorted(reminders.pop_due_reminders(now)),
+            [
+                (booking.id, 30, reminders._minute(self.start_time - timedelta(minutes=30))),
+                (booking.id, 120, reminders._minute(self.start_time - timedelta(minutes=120))),
+            ],
+        )
+        self.assertEqual(reminders.pop_due_reminders(now), [])
+        self.assertFalse(get_redis().exists(reminders.BUCKETS_KEY))
+
+
+class DailyRoomStatsTests(TestCase):
+    """DailyRoomStats follow bookings through save, move and delete, and agree with a rebuild."""
+
+    FIELDS = ("bookings_count", "booked_hours", "revenue", "paid_bookings_count", "paid_revenue")
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.bathhouse = Bathhouse.objects.create(name="Bathhouse", address="Almaty", is_24_hours=True)
+        cls.room = Room.objects.create(bathhouse=cls.bathhouse, room_number="1", price_per_hour=Decimal("5000.00"))
+
+    def setUp(self):
+        self.start_time = (timezone.now() + timedelta(days=1)).replace(minute=0, second=0, microsecond=0)
+
+    def stats(self, start_time):
+        row = DailyRoomStats.objects.filter(room=self.room, date=rollups.local_date(start_time)).first()
+        return {field: getattr(row, field) for field in self.FIELDS} if row else None
+
+    def test_save_move_delete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            booking = Booking.objects.create(
+                bathhouse=self.bathhouse,
+                room=self.room,
+                name="Guest",
+                phone="+77020000000",
+                start_time=self.start_time,
+                hours=2,
+                final_price=Decimal("10000.00"),
+            )
+        price = booking.final_price
+        self.assertEqual(
+            self.stats(self.start_time),
+            {"bookings_count": 1, "booked_hours": 2, "revenue": price, "paid_bookings_count": 0, "paid_revenue": 0},
+        )
+
+        booking.is_paid = True
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.save(update_fields=["is_paid"])
+        self.assertEqual(self.stats(self.start_time)["paid_revenue"], price)
+
+        # Reloaded instances carry their own snapshot
+        booking = Booking.objects.get(pk=booking.pk)
+        booking.start_time += timedelta(days=2)
+        booking.hours = 3
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.save()
+        self.assertEqual(set(self.stats(self.start_time).values()), {0})
+        moved = self.stats(booking.start_time)
+        self.assertEqual((moved["bookings_count"], moved["booked_hours"], moved["paid_bookings_count"]), (1, 3, 1))
+
+        incremental = list(DailyRoomStats.objects.order_by("date").values("date", *self.FIELDS))
+        rollups.rebuild(rollups.local_date(self.start_time), rollups.local_date(booking.start_time))
+        rebuilt = list(DailyRoomStats.objects.order_by("date").values("date", *self.FIELDS))
+        self.assertEqual([row for row in incremental if row["bookings_count"]], rebuilt)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.delete()
+        self.assertEqual(set(self.stats(booking.start_time).values()), {0})
+
+
+class CustomerProfileTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.bathhouse = Bathhouse.objects.create(name="Bathhouse", address="Almaty", is_24_hours=True)
+        cls.room = Room.objects.create(bathhouse=cls.bathhouse, room_number="1", price_per_hour=Decimal("5000.00"))
+
+    def book(self, name, phone, days):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Booking.objects.create(
+                bathhouse=self.bathhouse,
+                room=self.room,
+                name=name,
+                phone=phone,
+                start_time=timezone.now() + timedelta(days=days),
+                hours=2,
+                final_price=Decimal("10000.00"),
+            )
+
+    def profile(self, phone="+77020000000"):
+        return CustomerProfile.objects.get(bathhouse=self.bathhouse, phone=phone)
+
+    def test_profile_follows_bookings(self):
+        first = self.book("Aigerim", "8 702 000 00 00", days=1)
+        latest = self.book("Aigerim K.", "+77020000000", days=5)
+        profile = self.profile()
+        self.assertEqual((profile.bookings_count, profile.booked_hours, profile.name), (2, 4, "Aigerim K."))
+        self.assertEqual(
+            (profile.first_booking_start, profile.last_booking_start), (first.start_time, latest.start_time)
+        )
+
+        first.is_paid = True
+        with self.captureOnCommitCallbacks(execute=True):
+            first.save(update_fields=["is_paid"])
+        self.assertEqual(self.profile().total_spent, first.final_price)
+
+        # The latest booking moves to another customer: counters and visits follow
+        latest.phone = "+77021111111"
+        with self.captureOnCommitCallbacks(execute=True):
+            latest.save()
+        profile = self.profile()
+        self.assertEqual((profile.bookings_count, profile.name), (1, "Aigerim"))
+        self.assertEqual(profile.last_booking_start, first.start_time)
+        self.assertEqual(self.profile("+77021111111").bookings_count, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        profile = self.profile()
+        self.assertEqual((profile.bookings_count, profile.paid_bookings_count, profile.total_spent), (0, 0, 0))
+        self.assertIsNone(profile.last_booking_start)
+
+    def test_bonus_balance_is_copied(self):
+        self.book("Aigerim", "+77020000000", days=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            BonusAccount.objects.create(bathhouse=self.bathhouse, phone="8 702 000 00 00", balance=Decimal("750.00"))
+        self.assertEqual(self.profile().bonus_balance, Decimal("750.00"))
+
+    def test_upcoming_booking_is_not_lapsed(self):
+        self.book("Aigerim", "+77020000000", days=-40)
+        self.book("Aigerim", "+77020000000", days=3)
+        self.book("Dana", "+77021111111", days=-40)
+        admin = User.objects.create_superuser("root", "root@example.com", "pass")
+        client = APIClient()
+        client.force_authenticate(admin)
+
+        response = client.get(
+            reverse("customer-list"),
+            {"bathhouse_id": self.bathhouse.pk, "lapsed_days": 30, "ordering": "-last_booking_start"},
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual([row["phone"] for row in response.data["results"]], ["+77021111111"])
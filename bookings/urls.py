@@ -1,12 +1,45 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import BookingViewSet, BonusBalanceView, BonusTransactionsView
+from .views import (
+    BookingViewSet,
+    BookingSeriesViewSet,
+    BonusBalanceView,
+    BonusTransactionsView,
+    BookingStatsView,
+    OccupancyHeatmapView,
+    BookingExportView,
+    BonusTransactionExportView,
+    BookingSearchView,
+    CustomerListView,
+    SlotHoldView,
+    SlotHoldDetailView,
+)
 
 router = DefaultRouter()
 router.register(r'bookings', BookingViewSet)
+router.register(r'series', BookingSeriesViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('holds/', SlotHoldView.as_view(), name='slot-hold'),
+    path('holds/<str:hold_id>/', SlotHoldDetailView.as_view(), name='slot-hold-detail'),
     path('bonus/balance/', BonusBalanceView.as_view(), name='bonus-balance'),
     path('bonus/transactions/', BonusTransactionsView.as_view(), name='bonus-transactions'),
+    path('stats/', BookingStatsView.as_view(), name='booking-stats'),
+    path('customers/', CustomerListView.as_view(), name='customer-list'),
+    path('search/', BookingSearchView.as_view(), name='booking-search'),
+    path('heatmap/', OccupancyHeatmapView.as_view(), name='occupancy-heatmap'),
+    path('exports/bookings.<str:file_format>', BookingExportView.as_view(), name='export-bookings'),
+    path(
+        'exports/bonus-transactions.<str:file_format>',
+        BonusTransactionExportView.as_view(),
+        name='export-bonus-transactions',
+    ),
 ]
+
+if settings.ASYNC_READ_VIEWS:
+    from sauna import async_views
+    from .async_views import HANDLERS
+
+    async_views.install(urlpatterns, HANDLERS)
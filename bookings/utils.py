@@ -1,5 +1,41 @@
-import random
+import re
+import secrets
+
+# E.164 allows at most 15 digits, so a normalized phone is at most 16 characters
+MAX_PHONE_DIGITS = 15
+
+from django.db.models import Func, Value
+
 
 def generate_random_4_digit_number():
-    """Generates a random 4-digit number."""
-    return random.randint(1000, 9999)
\ No newline at end of file
+    """Generates a random 4-digit number suitable for SMS codes."""
+    return secrets.randbelow(9000) + 1000
+
+
+def normalize_phone(phone) -> str:
+    """
+    E.164 form of a phone number, e.g. "+7 (701) 123-45-67" and "87011234567"
+    both become "+77011234567". National numbers are assumed to be Kazakh /
+    Russian (+7). Returns "" when there are no digits or more than E.164 allows.
+    """
+    raw = str(phone or "").strip()
+    digits = re.sub(r"\D", "", raw)
+    if raw.startswith("00"):
+        digits = digits[2:]
+    elif not raw.startswith("+"):
+        if len(digits) == 11 and digits[0] == "8":
+            digits = "7" + digits[1:]
+        elif len(digits) == 10:
+            digits = "7" + digits
+    if not digits or len(digits) > MAX_PHONE_DIGITS:
+        return ""
+    return "+" + digits
+
+
+class DigitsOnly(Func):
+    """REGEXP_REPLACE(expr, '\\D', '', 'g'): a phone number with formatting stripped."""
+
+    function = "REGEXP_REPLACE"
+
+    def __init__(self, expression, **extra):
+        super().__init__(expression, Value(r"\D"), Value(""), Value("g"), **extra)
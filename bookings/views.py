@@ -1,19 +1,43 @@
 from django.utils import timezone
-from rest_framework import viewsets, permissions, status
+from rest_framework import mixins, viewsets, permissions, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from users.models import Bathhouse, Room
 from django.db import transaction as db_transaction
-from .models import Booking, BonusAccount, BonusTransaction, accrue_bonus_for_booking
-from .serializers import BookingSerializer
-from .utils import generate_random_4_digit_number
+from django.db.models import Sum
+from .models import (
+    Booking,
+    BookingSeries,
+    BonusAccount,
+    BonusTransaction,
+    CustomerProfile,
+    DailyRoomStats,
+    OccupancyHeatmap,
+    accrue_bonus_for_booking,
+)
+from .serializers import (
+    BookingSerializer,
+    BookingSeriesSerializer,
+    CustomerProfileSerializer,
+    GroupBookingSerializer,
+    SlotHoldSerializer,
+)
+from .utils import normalize_phone
+from .services import holds, otp
+from .services.idempotency import idempotent
+from .services import exports, search
+from .services.heatmaps import WEEKDAYS
+from .services import rollups
+from .services.rollups import open_hours_per_day
 from users.permissions import IsBathAdminOrSuperAdmin
-from users.services.telegram import send_message
-from datetime import datetime
-from zoneinfo import ZoneInfo
-import html
+from sauna import metrics
+from sauna.throttling import IPRateThrottle, PhoneRateThrottle
+from datetime import date, timedelta
+import uuid
 from decimal import Decimal, ROUND_HALF_UP
 
 
@@ -33,11 +57,27 @@ class BookingViewSet(viewsets.ModelViewSet):
             return [IsBathAdminOrSuperAdmin()]
         return [permissions.AllowAny()]
 
+    def get_throttles(self):
+        if self.action in ["create", "create_group"]:
+            return [IPRateThrottle("booking_create"), PhoneRateThrottle("booking_create_phone")]
+        elif self.action == "list":
+            return [IPRateThrottle("booking_lookup"), PhoneRateThrottle("booking_lookup_phone")]
+        elif self.action == "get_room_bookings":
+            return [IPRateThrottle("room_bookings")]
+        elif self.action in [
+            "confirm_booking_sms",
+            "request_cancel_booking_sms",
+            "cancel_booking_sms",
+        ]:
+            return [IPRateThrottle("booking_sms")]
+        return []
+
     def get_queryset(self):
         user = self.request.user
+        bookings = BookingSerializer.setup_eager_loading(Booking.objects.all())
 
         if user.is_authenticated and user.role == "superadmin":
-            return Booking.objects.all()
+            return bookings
 
         elif user.is_authenticated and user.role == "bath_admin":
             bathhouse_id = self.request.query_params.get("bathhouse_id")
@@ -45,15 +85,15 @@ class BookingViewSet(viewsets.ModelViewSet):
             if bathhouse_id:
                 if bathhouse_id.isdigit():
                     bathhouse_id = int(bathhouse_id)
-                    return Booking.objects.filter(
+                    return bookings.filter(
                         bathhouse_id=bathhouse_id, bathhouse__owner_id=user.pk
                     )
                 else:
-                    return Booking.objects.none()
+                    return bookings.none()
 
-            return Booking.objects.filter(bathhouse__owner_id=user.pk)
+            return bookings.filter(bathhouse__owner_id=user.pk)
 
-        return Booking.objects.all()
+        return bookings
 
     def list(self, request, *args, **kwargs):
         user = self.request.user
@@ -66,8 +106,15 @@ class BookingViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
-            print(phone_number)
-            bookings = Booking.objects.filter(phone=phone_number)
+            phone_normalized = normalize_phone(phone_number)
+            if not phone_normalized:
+                # "" is also the phone of every booking saved before normalization
+                return Response(
+                    {"error": "Invalid phone number"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+            bookings = self.get_queryset().filter(phone_normalized=phone_normalized)
             serializer = self.get_serializer(bookings, many=True)
             return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -94,6 +141,7 @@ class BookingViewSet(viewsets.ModelViewSet):
         permission_classes=[IsBathAdminOrSuperAdmin],
         url_path="process-payment",
     )
+    @idempotent("process_payment")
     def process_payment(self, request, pk=None):
         """
         Confirm booking payment and optionally redeem bonus balance.
@@ -111,6 +159,8 @@ class BookingViewSet(viewsets.ModelViewSet):
                 {"error": "bathhouse_id and phone are required"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
+        if not normalize_phone(phone):
+            return Response({"error": "Invalid phone number"}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
             bathhouse_id_int = int(bathhouse_id)
@@ -123,7 +173,7 @@ class BookingViewSet(viewsets.ModelViewSet):
         # Basic checks
         if booking.bathhouse_id != bathhouse_id_int:
             return Response({"error": "Booking bathhouse mismatch"}, status=status.HTTP_400_BAD_REQUEST)
-        if booking.phone != phone:
+        if normalize_phone(booking.phone) != normalize_phone(phone):
             return Response({"error": "Phone mismatch with booking"}, status=status.HTTP_400_BAD_REQUEST)
         if not booking.confirmed:
             return Response({"error": "Booking must be confirmed"}, status=status.HTTP_400_BAD_REQUEST)
@@ -141,12 +191,17 @@ class BookingViewSet(viewsets.ModelViewSet):
         # amount == 0: no bonus usage, just mark as paid
         if amount_dec == 0:
             with db_transaction.atomic():
+                booking = self._lock_unpaid(booking)
+                if booking is None:
+                    return self._already_paid()
                 booking.is_paid = True
                 booking.save(update_fields=["is_paid"])
                 accrual_tx = accrue_bonus_for_booking(booking)
 
             existing_account = (
-                BonusAccount.objects.filter(bathhouse_id=bathhouse_id_int, phone=phone)
+                BonusAccount.objects.filter(
+                    bathhouse_id=bathhouse_id_int, phone_normalized=normalize_phone(phone)
+                )
                 .only("balance")
                 .first()
             )
@@ -166,7 +221,9 @@ class BookingViewSet(viewsets.ModelViewSet):
 
         # amount > 0: redeem from bonus account
         account, _ = BonusAccount.objects.get_or_create(
-            bathhouse_id=bathhouse_id_int, phone=phone
+            bathhouse_id=bathhouse_id_int,
+            phone_normalized=normalize_phone(phone),
+            defaults={"phone": phone},
         )
 
         if amount_dec > account.balance:
@@ -175,6 +232,15 @@ class BookingViewSet(viewsets.ModelViewSet):
             return Response({"error": "Amount cannot exceed booking price"}, status=status.HTTP_400_BAD_REQUEST)
 
         with db_transaction.atomic():
+            # Re-read under row locks (booking first, as in the amount == 0
+            # branch): a concurrent request may have paid the booking or
+            # spent the balance
+            booking = self._lock_unpaid(booking)
+            if booking is None:
+                return self._already_paid()
+            account = BonusAccount.objects.select_for_update().get(pk=account.pk)
+            if amount_dec > account.balance:
+                return Response({"error": "Insufficient bonus balance"}, status=status.HTTP_400_BAD_REQUEST)
             new_balance = (account.balance - amount_dec).quantize(Decimal("0.01"))
             account.balance = new_balance
             account.save(update_fields=["balance", "updated_at"])
@@ -204,70 +270,46 @@ class BookingViewSet(viewsets.ModelViewSet):
             status=status.HTTP_200_OK,
         )
 
-    def create(self, request, *args, **kwargs):
-        response = super().create(request, *args, **kwargs)
-        print(request.data)
-        booking_data = request.data
-
-        # Get related objects (raise 404 if not found — optional)
-        bathhouse = Bathhouse.objects.get(id=booking_data.get("bathhouse"))
-        room = Room.objects.get(id=booking_data.get("room"))
-
-        # ---- Time handling (to Asia/Almaty) ----
-        start_time_raw = booking_data.get("start_time", "")
-        formatted_start_time = ""
-        if start_time_raw:
-            s = start_time_raw.strip()
-            # Allow both "Z" and "+00:00" style; if naive, assume UTC
-            if s.endswith("Z"):
-                s = s[:-1] + "+00:00"
-            try:
-                dt = datetime.fromisoformat(s)
-            except ValueError:
-                dt = None
-            if dt is not None:
-                if dt.tzinfo is None:
-                    # assume the backend sent UTC if naive
-                    dt = dt.replace(tzinfo=ZoneInfo("UTC"))
-                dt_almaty = dt.astimezone(ZoneInfo("Asia/Almaty"))
-                formatted_start_time = dt_almaty.strftime("%d.%m.%y %H:%M")
-
-        # ---- Extras formatting ----
-        extra_items = booking_data.get("extra_items_data") or []
-        extras_lines = (
-            "\n".join(
-                [
-                    f"• ID: <code>{html.escape(str(x.get('item', '')))}</code> — Кол-во: <b>{html.escape(str(x.get('quantity', '')))}</b>"
-                    for x in extra_items
-                ]
-            )
-            or "—"
-        )
+    @staticmethod
+    def _lock_unpaid(booking):
+        """The booking re-read under a row lock, or None if it has been paid meanwhile."""
+        booking = Booking.objects.select_for_update().get(pk=booking.pk)
+        return None if booking.is_paid else booking
 
-        # ---- Escape user-supplied fields ----
-        name = html.escape(booking_data.get("name", ""))
-        phone = html.escape(booking_data.get("phone", ""))
-        hours = html.escape(str(booking_data.get("hours", "")))
-        bath_name = html.escape(str(bathhouse.name))
-        room_type = "Сауна" if room.is_sauna else "Баня"
-
-        # ---- Nicely formatted “card” ----
-        text = (
-            f"🧖 <b>Новая бронь</b>\n"
-            f"<b>ID: </b> <code>{response.data.get('id')}</code> \n"
-            "——————————————\n"
-            f"👤 <b>Имя:</b> {name}\n"
-            f"📞 <b>Телефон:</b> {phone}\n"
-            f"🏛️ <b>Баня:</b> ID <code>{bathhouse.id}</code> — {bath_name}\n"
-            f"🚪 <b>Комната:</b> ID <code>{room.id}</code> — {room_type}, № {html.escape(str(room.room_number))}\n"
-            f"🕒 <b>Начало:</b> {formatted_start_time}\n"
-            f"⏳ <b>Часы:</b> {hours}\n"
-            f"🧺 <b>Доп. услуги:</b>\n{extras_lines}"
-        )
+    @staticmethod
+    def _already_paid():
+        return Response({"error": "Booking is already paid"}, status=status.HTTP_409_CONFLICT)
 
-        send_message(chat_type="notification", text=text)
+    @idempotent("booking_create")
+    def create(self, request, *args, **kwargs):
+        try:
+            response = super().create(request, *args, **kwargs)
+        except ValidationError as e:
+            metrics.record_booking_validation_error(e.get_codes())
+            raise
+        metrics.BOOKING_CREATE_OUTCOMES.labels("created").inc()
         return response
 
+    @action(
+        detail=False,
+        methods=["post"],
+        permission_classes=[permissions.AllowAny],
+        serializer_class=GroupBookingSerializer,
+        url_path="group",
+    )
+    @idempotent("booking_group")
+    def create_group(self, request):
+        """Book several rooms of one bathhouse at once; every slot is booked or none is."""
+        serializer = self.get_serializer(data=request.data)
+        try:
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+        except ValidationError as e:
+            metrics.record_booking_validation_error(e.get_codes())
+            raise
+        metrics.BOOKING_CREATE_OUTCOMES.labels("created").inc(len(serializer.instance))
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
     @action(
         detail=False,
         methods=["get"],
@@ -283,7 +325,7 @@ class BookingViewSet(viewsets.ModelViewSet):
             )
 
         today = timezone.now().date()
-        bookings = Booking.objects.filter(room_id=room_id, start_time__gte=today)
+        bookings = self.get_queryset().filter(room_id=room_id, start_time__gte=today)
         serializer = self.get_serializer(bookings, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -306,7 +348,6 @@ class BookingViewSet(viewsets.ModelViewSet):
         url_path="confirm-booking-sms",
     )
     def confirm_booking_sms(self, request, pk=None):
-        booking = self.get_object()
         sms_code = request.query_params.get("sms_code")
         if not sms_code:
             return Response(
@@ -314,16 +355,20 @@ class BookingViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        if sms_code == booking.sms_code:
-            booking.confirmed = True
-            booking.save()
-            return Response(
-                {"message": "Booking confirmed successfully"}, status=status.HTTP_200_OK
-            )
-        else:
-            return Response(
-                {"error": "Sms code is incorrect"}, status=status.HTTP_400_BAD_REQUEST
-            )
+        booking_id = _parse_booking_id(pk)
+        if booking_id is None:
+            return Response({"error": "Booking not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        error = _check_sms_code(otp.PURPOSE_CONFIRM, booking_id, sms_code)
+        if error is not None:
+            return error
+
+        # The code of a group booking or series is issued for its first booking and confirms all of them
+        if not Booking.created_together(booking_id).update(confirmed=True):
+            return Response({"error": "Booking not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(
+            {"message": "Booking confirmed successfully"}, status=status.HTTP_200_OK
+        )
 
     @action(
         detail=True,
@@ -332,18 +377,34 @@ class BookingViewSet(viewsets.ModelViewSet):
         url_path="request-cancel-booking-sms",
     )
     def request_cancel_booking_sms(self, request, pk=None):
-        booking = self.get_object()
+        booking_id = _parse_booking_id(pk)
+        booking = (
+            Booking.objects.filter(pk=booking_id).only("id", "phone", "confirmed").first()
+            if booking_id
+            else None
+        )
+        if booking is None:
+            return Response({"error": "Booking not found"}, status=status.HTTP_404_NOT_FOUND)
         if not booking.confirmed:
             return Response(
                 {"error": "Booking is not confirmed, cannot cancel"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        sms_code = generate_random_4_digit_number()
-        booking.sms_code = sms_code
-        booking.save()
+        try:
+            otp.issue_code(otp.PURPOSE_CANCEL, booking.id, booking.phone)
+        except otp.OTPThrottled as e:
+            return Response(
+                {"error": "Too many SMS requests, try again later"},
+                status=status.HTTP_429_TOO_MANY_REQUESTS,
+                headers={"Retry-After": str(e.retry_after)},
+            )
+        except otp.OTPError:
+            return Response(
+                {"error": "SMS service is temporarily unavailable"},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
 
-        print(sms_code)
         return Response(
             {"message": "Cancellation SMS sent successfully"}, status=status.HTTP_200_OK
         )
@@ -355,7 +416,6 @@ class BookingViewSet(viewsets.ModelViewSet):
         url_path="cancel-booking-sms",
     )
     def cancel_booking_sms(self, request, pk=None):
-        booking = self.get_object()
         sms_code = request.query_params.get("sms_code")
         if not sms_code:
             return Response(
@@ -363,94 +423,634 @@ class BookingViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        if sms_code == booking.sms_code:
-            booking.delete()
+        booking_id = _parse_booking_id(pk)
+        if booking_id is None:
+            return Response({"error": "Booking not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        error = _check_sms_code(otp.PURPOSE_CANCEL, booking_id, sms_code)
+        if error is not None:
+            return error
+
+        deleted, _ = Booking.objects.filter(pk=booking_id).delete()
+        if not deleted:
+            return Response({"error": "Booking not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(
+            {"message": "Booking cancelled successfully"}, status=status.HTTP_200_OK
+        )
+
+
+def _parse_booking_id(pk):
+    try:
+        return uuid.UUID(str(pk))
+    except ValueError:
+        return None
+
+
+def _check_sms_code(purpose, booking_id, sms_code):
+    """Return an error Response if the code does not verify, otherwise None."""
+    try:
+        result = otp.verify_code(purpose, booking_id, sms_code)
+    except otp.OTPError:
+        return Response(
+            {"error": "SMS service is temporarily unavailable"},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+    if result == otp.MISSING:
+        return Response(
+            {"error": "Sms code expired, request a new one"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if result != otp.VERIFIED:
+        return Response(
+            {"error": "Sms code is incorrect"}, status=status.HTTP_400_BAD_REQUEST
+        )
+    return None
+
+
+class BookingSeriesViewSet(
+    mixins.CreateModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet
+):
+    queryset = BookingSeries.objects.all()
+    serializer_class = BookingSeriesSerializer
+
+    def get_permissions(self):
+        if self.action == "create":
+            return [permissions.AllowAny()]
+        return [IsBathAdminOrSuperAdmin()]
+
+    def get_throttles(self):
+        if self.action == "create":
+            return [IPRateThrottle("booking_create"), PhoneRateThrottle("booking_create_phone")]
+        return []
+
+    def get_queryset(self):
+        user = self.request.user
+        series = BookingSeries.objects.select_related("bathhouse", "room")
+        if user.is_authenticated and user.role == "superadmin":
+            return series
+        if user.is_authenticated and user.role == "bath_admin":
+            return series.filter(bathhouse__owner_id=user.pk)
+        return series.none()
+
+    @idempotent("series_create")
+    def create(self, request, *args, **kwargs):
+        try:
+            response = super().create(request, *args, **kwargs)
+        except ValidationError as e:
+            metrics.record_booking_validation_error(e.get_codes())
+            raise
+        metrics.BOOKING_CREATE_OUTCOMES.labels("created").inc(len(response.data["bookings"]))
+        return response
+
+    @action(detail=True, methods=["post"])
+    def cancel(self, request, pk=None):
+        """Delete every occurrence that has not started yet."""
+        series = self.get_object()
+        if series.cancelled_at:
+            return Response({"error": "Series is already cancelled"}, status=status.HTTP_400_BAD_REQUEST)
+
+        now = timezone.now()
+        with db_transaction.atomic():
+            _, deleted = Booking.objects.filter(series=series, start_time__gt=now).delete()
+            series.cancelled_at = now
+            series.save(update_fields=["cancelled_at"])
+        return Response(
+            {"cancelled": deleted.get("bookings.Booking", 0)}, status=status.HTTP_200_OK
+        )
+
+    @action(detail=True, methods=["post"])
+    def reprice(self, request, pk=None):
+        """Price the unpaid future occurrences again with the current prices and promotions."""
+        series = self.get_object()
+        bookings = BookingSerializer.setup_eager_loading(
+            series.bookings.filter(start_time__gt=timezone.now(), is_paid=False)
+        )
+        changed = []
+        for booking in bookings:
+            price = booking.calculate_final_price()
+            if price != booking.final_price or booking._promotions_applied != booking.promotions_applied:
+                booking.final_price = price
+                booking.promotions_applied = booking._promotions_applied
+                changed.append(booking)
+
+        with db_transaction.atomic():
+            Booking.objects.bulk_update(changed, ["final_price", "promotions_applied"])
+            # Customer profiles only count paid bookings' prices, so only the daily rollups move
+            rollups.bookings_updated(changed)
+        data = self.get_serializer(series).data
+        return Response({**data, "repriced": len(changed)}, status=status.HTTP_200_OK)
+
+
+def bonus_lookup(params):
+    """(bathhouse_id, phone) from the query string of the bonus endpoints, or raise ValueError."""
+    bathhouse_id = params.get("bathhouse_id")
+    phone = params.get("phone")
+    if not bathhouse_id or not phone:
+        raise ValueError("bathhouse_id and phone are required")
+    if not normalize_phone(phone):
+        # Would match every account saved before normalization
+        raise ValueError("Invalid phone number")
+    try:
+        return int(bathhouse_id), phone
+    except (TypeError, ValueError):
+        raise ValueError("bathhouse_id must be an integer")
+
+
+def bonus_account(bathhouse_id, phone):
+    return BonusAccount.objects.filter(
+        bathhouse_id=bathhouse_id, phone_normalized=normalize_phone(phone)
+    )
+
+
+def bonus_transactions(account_id):
+    return (
+        BonusTransaction.objects.filter(account_id=account_id)
+        .order_by("-id")
+        .values("type", "amount", "booking_id", "created_at")
+    )
+
+
+def bonus_transaction_row(tx):
+    return {
+        "type": tx["type"],
+        "amount": str(tx["amount"]),
+        "booking": tx["booking_id"],
+        "created_at": tx["created_at"],
+    }
+
+
+class BonusBalanceView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    def get_throttles(self):
+        return [IPRateThrottle("bonus"), PhoneRateThrottle("bonus_phone")]
+
+    def get(self, request):
+        try:
+            bathhouse_id, phone = bonus_lookup(request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        account = bonus_account(bathhouse_id, phone).only("id", "balance").first()
+
+        balance = str(account.balance) if account else "0.00"
+        return Response({"bathhouse_id": bathhouse_id, "phone": phone, "balance": balance})
+
+
+class BonusTransactionsView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    def get_throttles(self):
+        return [IPRateThrottle("bonus"), PhoneRateThrottle("bonus_phone")]
+
+    def get(self, request):
+        try:
+            bathhouse_id, phone = bonus_lookup(request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        account = bonus_account(bathhouse_id, phone).only("id").first()
+
+        if not account:
+            return Response({"bathhouse_id": bathhouse_id, "phone": phone, "transactions": []})
+
+        data = [bonus_transaction_row(tx) for tx in bonus_transactions(account.id)]
+
+        return Response({"bathhouse_id": bathhouse_id, "phone": phone, "transactions": data})
+
+    # Booking-related actions do not belong in this APIView.
+
+
+class SlotHoldView(APIView):
+    """Hold a room slot during checkout, see services/holds.py."""
+
+    permission_classes = [permissions.AllowAny]
+
+    def get_throttles(self):
+        return [IPRateThrottle("slot_hold"), PhoneRateThrottle("slot_hold_phone")]
+
+    def post(self, request):
+        serializer = SlotHoldSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        room = serializer.validated_data["room"]
+        start_time = serializer.validated_data["start_time"]
+        end_time = start_time + timedelta(hours=serializer.validated_data["hours"])
+        try:
+            hold_id, expires_at = holds.acquire(room.id, start_time, end_time)
+        except holds.SlotHeld as e:
             return Response(
-                {"message": "Booking cancelled successfully"}, status=status.HTTP_200_OK
+                {"error": "Slot is held by another customer", "retry_after": e.retry_after},
+                status=status.HTTP_409_CONFLICT,
+                headers={"Retry-After": str(e.retry_after)},
             )
-        else:
+        except holds.HoldError:
             return Response(
-                {"error": "Sms code is incorrect"}, status=status.HTTP_400_BAD_REQUEST
+                {"error": "Slot holds are unavailable"}, status=status.HTTP_503_SERVICE_UNAVAILABLE
             )
+        return Response(
+            {
+                "hold_id": hold_id,
+                "room": room.id,
+                "start_time": start_time,
+                "end_time": end_time,
+                "expires_at": expires_at,
+            },
+            status=status.HTTP_201_CREATED,
+        )
 
 
-class BonusBalanceView(APIView):
+class SlotHoldDetailView(APIView):
     permission_classes = [permissions.AllowAny]
 
-    def get(self, request):
-        bathhouse_id = request.query_params.get("bathhouse_id")
-        phone = request.query_params.get("phone")
+    def get_throttles(self):
+        return [IPRateThrottle("slot_hold")]
 
-        if not bathhouse_id or not phone:
+    def delete(self, request, hold_id):
+        try:
+            released = holds.release(hold_id)
+        except holds.HoldError:
             return Response(
-                {"error": "bathhouse_id and phone are required"},
-                status=status.HTTP_400_BAD_REQUEST,
+                {"error": "Slot holds are unavailable"}, status=status.HTTP_503_SERVICE_UNAVAILABLE
             )
+        if not released:
+            return Response({"error": "Hold not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+STATS_COUNTERS = (
+    "bookings_count",
+    "booked_hours",
+    "revenue",
+    "paid_bookings_count",
+    "paid_revenue",
+    "happy_hours_count",
+    "birthday_count",
+    "bonus_hour_count",
+    "bonus_accrued",
+    "bonus_redeemed",
+)
+STATS_MAX_DAYS = 366
+
+
+def _stats_row(row, capacity_hours):
+    occupancy = (
+        Decimal(row["booked_hours"] or 0) * 100 / capacity_hours if capacity_hours else Decimal("0")
+    )
+    return {
+        "bookings": row["bookings_count"] or 0,
+        "booked_hours": row["booked_hours"] or 0,
+        "occupancy_percentage": str(occupancy.quantize(Decimal("0.01"))),
+        "revenue": str(row["revenue"] or Decimal("0.00")),
+        "paid_bookings": row["paid_bookings_count"] or 0,
+        "paid_revenue": str(row["paid_revenue"] or Decimal("0.00")),
+        "promotions": {
+            "happy_hours": row["happy_hours_count"] or 0,
+            "birthday": row["birthday_count"] or 0,
+            "bonus_hour": row["bonus_hour_count"] or 0,
+        },
+        "bonus_accrued": str(row["bonus_accrued"] or Decimal("0.00")),
+        "bonus_redeemed": str(row["bonus_redeemed"] or Decimal("0.00")),
+    }
+
+
+class BookingStatsView(APIView):
+    """
+    Revenue / occupancy aggregates for a bathhouse, served from DailyRoomStats.
+
+    Query params: bathhouse_id (int), date_from, date_to (YYYY-MM-DD, inclusive,
+    Asia/Almaty days), room_id (optional int)
+    """
+
+    permission_classes = [IsBathAdminOrSuperAdmin]
 
+    def get(self, request):
+        bathhouse_id = request.query_params.get("bathhouse_id")
+        room_id = request.query_params.get("room_id")
         try:
             bathhouse_id_int = int(bathhouse_id)
+            room_id_int = int(room_id) if room_id else None
         except (TypeError, ValueError):
             return Response(
-                {"error": "bathhouse_id must be an integer"},
+                {"error": "bathhouse_id (and room_id, if given) must be integers"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
+        try:
+            date_from = date.fromisoformat(request.query_params.get("date_from", ""))
+            date_to = date.fromisoformat(request.query_params.get("date_to", ""))
+        except ValueError:
+            return Response(
+                {"error": "date_from and date_to must be YYYY-MM-DD"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        days = (date_to - date_from).days + 1
+        if days <= 0 or days > STATS_MAX_DAYS:
+            return Response(
+                {"error": f"Date range must cover 1 to {STATS_MAX_DAYS} days"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        bathhouses = Bathhouse.objects.filter(id=bathhouse_id_int)
+        if request.user.role != "superadmin":
+            bathhouses = bathhouses.filter(owner_id=request.user.pk)
+        bathhouse = bathhouses.only("id", "is_24_hours", "start_of_work", "end_of_work").first()
+        if bathhouse is None:
+            return Response({"error": "Bathhouse not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        account = (
-            BonusAccount.objects.filter(bathhouse_id=bathhouse_id_int, phone=phone)
-            .only("id", "balance")
-            .first()
+        rooms = Room.objects.filter(bathhouse_id=bathhouse.id)
+        stats = DailyRoomStats.objects.filter(
+            bathhouse_id=bathhouse.id, date__gte=date_from, date__lte=date_to
         )
+        if room_id_int is not None:
+            rooms = rooms.filter(id=room_id_int)
+            stats = stats.filter(room_id=room_id_int)
+        rooms = list(rooms.only("id", "room_number").order_by("id"))
 
-        balance = str(account.balance) if account else "0.00"
-        return Response({"bathhouse_id": bathhouse_id_int, "phone": phone, "balance": balance})
+        sums = {field: Sum(field) for field in STATS_COUNTERS}
+        by_day = list(stats.values("date").annotate(**sums).order_by("date"))
+        by_room = {row["room_id"]: row for row in stats.values("room_id").annotate(**sums)}
 
+        open_hours = open_hours_per_day(bathhouse)
+        totals = {
+            field: sum((row[field] or 0) for row in by_day) for field in STATS_COUNTERS
+        }
+        empty = dict.fromkeys(STATS_COUNTERS, 0)
+
+        return Response(
+            {
+                "bathhouse_id": bathhouse.id,
+                "date_from": date_from,
+                "date_to": date_to,
+                "open_hours_per_day": open_hours,
+                "totals": _stats_row(totals, len(rooms) * open_hours * days),
+                "days": [
+                    {"date": row["date"], **_stats_row(row, len(rooms) * open_hours)}
+                    for row in by_day
+                ],
+                "rooms": [
+                    {
+                        "room_id": room.id,
+                        "room_number": room.room_number,
+                        **_stats_row(by_room.get(room.id, empty), open_hours * days),
+                    }
+                    for room in rooms
+                ],
+            }
+        )
 
-class BonusTransactionsView(APIView):
-    permission_classes = [permissions.AllowAny]
+
+class OccupancyHeatmapView(APIView):
+    """
+    Precomputed weekday x hour booked-hours matrix (rows MONDAY..SUNDAY,
+    columns local hours 0..23).
+
+    Query params: bathhouse_id (int), room_id (optional int), include_rooms (bool)
+    """
+
+    permission_classes = [IsBathAdminOrSuperAdmin]
 
     def get(self, request):
         bathhouse_id = request.query_params.get("bathhouse_id")
-        phone = request.query_params.get("phone")
-
-        if not bathhouse_id or not phone:
+        room_id = request.query_params.get("room_id")
+        try:
+            bathhouse_id_int = int(bathhouse_id)
+            room_id_int = int(room_id) if room_id else None
+        except (TypeError, ValueError):
             return Response(
-                {"error": "bathhouse_id and phone are required"},
+                {"error": "bathhouse_id (and room_id, if given) must be integers"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
+        include_rooms = request.query_params.get("include_rooms", "").lower() in ["true", "1", "yes"]
+
+        if request.user.role != "superadmin" and not Bathhouse.objects.filter(
+            id=bathhouse_id_int, owner_id=request.user.pk
+        ).exists():
+            return Response({"error": "Bathhouse not found"}, status=status.HTTP_404_NOT_FOUND)
 
+        heatmaps = OccupancyHeatmap.objects.filter(bathhouse_id=bathhouse_id_int).only(
+            "room_id", "matrix", "bookings_count", "refreshed_until"
+        )
+        if room_id_int is not None:
+            heatmaps = heatmaps.filter(room_id=room_id_int)
+        elif not include_rooms:
+            heatmaps = heatmaps.filter(room__isnull=True)
+
+        main = None
+        rooms = []
+        for heatmap in heatmaps:
+            data = {
+                "room_id": heatmap.room_id,
+                "matrix": heatmap.matrix,
+                "max": max(max(row) for row in heatmap.matrix),
+                "bookings": heatmap.bookings_count,
+                "refreshed_until": heatmap.refreshed_until,
+            }
+            if heatmap.room_id == room_id_int:
+                main = data
+            else:
+                rooms.append(data)
+        rooms.sort(key=lambda data: data["room_id"])
+
+        response = {"bathhouse_id": bathhouse_id_int, "weekdays": WEEKDAYS, "heatmap": main}
+        if include_rooms and room_id_int is None:
+            response["rooms"] = rooms
+        return Response(response)
+
+
+def _caller_bathhouses(request):
+    """
+    Bathhouses the caller may read (all for superadmin, own for bath_admin),
+    narrowed to ?bathhouse_id= when given. Returns (queryset, error_response).
+    """
+    bathhouses = Bathhouse.objects.all()
+    if request.user.role != "superadmin":
+        bathhouses = bathhouses.filter(owner_id=request.user.pk)
+    bathhouse_id = request.query_params.get("bathhouse_id")
+    if bathhouse_id:
         try:
-            bathhouse_id_int = int(bathhouse_id)
-        except (TypeError, ValueError):
-            return Response(
+            bathhouses = bathhouses.filter(id=int(bathhouse_id))
+        except ValueError:
+            return None, Response(
                 {"error": "bathhouse_id must be an integer"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
+        if not bathhouses.exists():
+            return None, Response({"error": "Bathhouse not found"}, status=status.HTTP_404_NOT_FOUND)
+    return bathhouses, None
 
-        account = (
-            BonusAccount.objects.filter(bathhouse_id=bathhouse_id_int, phone=phone)
-            .only("id")
-            .first()
-        )
 
-        if not account:
-            return Response({"bathhouse_id": bathhouse_id_int, "phone": phone, "transactions": []})
+class BaseExportView(APIView):
+    """
+    Streams a CSV (or XLSX) export for the caller's bathhouses.
 
-        txs = (
-            BonusTransaction.objects.filter(account=account)
-            .order_by("-id")
-            .values("type", "amount", "booking_id", "created_at")
-        )
+    Query params: bathhouse_id (optional int), date_from, date_to (optional
+    YYYY-MM-DD, inclusive, Asia/Almaty days)
+    """
 
-        data = [
-            {
-                "type": tx["type"],
-                "amount": str(tx["amount"]),
-                "booking": tx["booking_id"],
-                "created_at": tx["created_at"],
-            }
-            for tx in txs
-        ]
+    permission_classes = [IsBathAdminOrSuperAdmin]
+    columns = None
+    filename = None
 
-        return Response({"bathhouse_id": bathhouse_id_int, "phone": phone, "transactions": data})
+    def get_queryset(self, bathhouse_ids, date_from, date_to):
+        raise NotImplementedError
 
-    # Booking-related actions do not belong in this APIView.
+    def get(self, request, file_format):
+        if file_format not in exports.FORMATS:
+            return Response({"error": "Unsupported export format"}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            date_from = request.query_params.get("date_from")
+            date_to = request.query_params.get("date_to")
+            date_from = date.fromisoformat(date_from) if date_from else None
+            date_to = date.fromisoformat(date_to) if date_to else None
+        except ValueError:
+            return Response(
+                {"error": "date_from and date_to must be YYYY-MM-DD"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        bathhouses, error = _caller_bathhouses(request)
+        if error:
+            return error
+        queryset = self.get_queryset(bathhouses.values("id"), date_from, date_to)
+        return exports.export_response(queryset, self.columns, file_format, self.filename)
+
+
+class BookingExportView(BaseExportView):
+    columns = exports.BOOKING_COLUMNS
+    filename = "bookings"
+
+    def get_queryset(self, bathhouse_ids, date_from, date_to):
+        return exports.bookings_queryset(bathhouse_ids, date_from, date_to)
+
+
+class BonusTransactionExportView(BaseExportView):
+    columns = exports.BONUS_TRANSACTION_COLUMNS
+    filename = "bonus-transactions"
+
+    def get_queryset(self, bathhouse_ids, date_from, date_to):
+        return exports.bonus_transactions_queryset(bathhouse_ids, date_from, date_to)
+
+
+class BookingSearchView(APIView):
+    """
+    Ranked search over bookings by customer name or (partial) phone.
+
+    Query params: q (at least 2 characters), bathhouse_id (optional int),
+    limit (optional, up to 50), suggest (bool: distinct name/phone pairs for
+    as-you-type autocomplete instead of bookings)
+    """
+
+    permission_classes = [IsBathAdminOrSuperAdmin]
+
+    def get(self, request):
+        query = search.clean_query(request.query_params.get("q"))
+        if len(query) < search.MIN_QUERY_LENGTH:
+            return Response(
+                {"error": f"q must be at least {search.MIN_QUERY_LENGTH} characters"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            limit = int(request.query_params.get("limit", search.DEFAULT_LIMIT))
+        except ValueError:
+            return Response({"error": "limit must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, search.MAX_LIMIT))
+        suggest = request.query_params.get("suggest", "").lower() in ["true", "1", "yes"]
+
+        bathhouses, error = _caller_bathhouses(request)
+        if error:
+            return error
+        bathhouse_ids = bathhouses.values("id")
+
+        if suggest:
+            results = [
+                {
+                    "name": row["name"],
+                    "phone": row["phone_normalized"],
+                    "last_visit": row["last_visit"],
+                    "bookings": row["bookings"],
+                }
+                for row in search.suggest_customers(bathhouse_ids, query, limit)
+            ]
+        else:
+            results = [
+                {
+                    "id": row["id"],
+                    "name": row["name"],
+                    "phone": row["phone"],
+                    "start_time": row["start_time"],
+                    "hours": row["hours"],
+                    "bathhouse_id": row["bathhouse_id"],
+                    "room_id": row["room_id"],
+                    "room_number": row["room__room_number"],
+                    "confirmed": row["confirmed"],
+                    "is_paid": row["is_paid"],
+                }
+                for row in search.search_bookings(bathhouse_ids, query, limit)
+            ]
+        return Response({"query": query, "results": results})
+
+
+class CustomerPagination(PageNumberPagination):
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
+
+
+CUSTOMER_ORDERINGS = (
+    "total_spent",
+    "bookings_count",
+    "booked_hours",
+    "last_booking_start",
+    "first_booking_start",
+    "bonus_balance",
+)
+
+
+class CustomerListView(APIView):
+    """
+    Customers of a bathhouse from the CustomerProfile table.
+
+    Query params: bathhouse_id (int), ordering (one of CUSTOMER_ORDERINGS,
+    "-" prefix for descending, default -total_spent), lapsed_days (only
+    customers whose latest booking started more than this many days ago, so
+    one with an upcoming booking is never lapsed), min_bookings, page,
+    page_size
+    """
+
+    permission_classes = [IsBathAdminOrSuperAdmin]
+
+    def get(self, request):
+        if not request.query_params.get("bathhouse_id"):
+            return Response({"error": "bathhouse_id is required"}, status=status.HTTP_400_BAD_REQUEST)
+        bathhouses, error = _caller_bathhouses(request)
+        if error:
+            return error
+
+        ordering = request.query_params.get("ordering", "-total_spent")
+        if ordering.lstrip("-") not in CUSTOMER_ORDERINGS:
+            return Response(
+                {"error": f"ordering must be one of {', '.join(CUSTOMER_ORDERINGS)}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            lapsed_days = request.query_params.get("lapsed_days")
+            lapsed_days = int(lapsed_days) if lapsed_days else None
+            min_bookings = int(request.query_params.get("min_bookings", 0))
+        except ValueError:
+            return Response(
+                {"error": "lapsed_days and min_bookings must be integers"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        profiles = CustomerProfile.objects.filter(bathhouse_id__in=bathhouses.values("id"))
+        if lapsed_days is not None:
+            profiles = profiles.filter(last_booking_start__lt=timezone.now() - timedelta(days=lapsed_days))
+        if min_bookings:
+            profiles = profiles.filter(bookings_count__gte=min_bookings)
+        if ordering.lstrip("-") in ("last_booking_start", "first_booking_start"):
+            # Customers with only a bonus account have no bookings
+            profiles = profiles.filter(**{f"{ordering.lstrip('-')}__isnull": False})
+        profiles = profiles.order_by(ordering, "-id" if ordering.startswith("-") else "id")
+
+        paginator = CustomerPagination()
+        page = paginator.paginate_queryset(profiles, request, view=self)
+        return paginator.get_paginated_response(CustomerProfileSerializer(page, many=True).data)
@@ -0,0 +1,41 @@
+# Gunicorn settings; run with `gunicorn -c gunicorn.conf.py`.
+# Prometheus needs PROMETHEUS_MULTIPROC_DIR (see sauna/metrics.py).
+#
+# GUNICORN_MODE=wsgi (default): sync workers running sauna.wsgi.
+# GUNICORN_MODE=asgi: uvicorn workers running sauna.asgi, with the async
+# read views (see sauna/asgi.py). Same GUNICORN_WORKERS in both modes.
+#
+# Each worker has its own database connection pool (see sauna/db_pool.py).
+# A sync worker serves one request at a time and needs one connection per
+# database; uvicorn workers keep DB_POOL_MAX_SIZE unless
+# GUNICORN_DB_POOL_MAX_SIZE is set.
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("GUNICORN_WORKERS", "3"))
+
+if os.getenv("GUNICORN_MODE", "wsgi") == "asgi":
+    wsgi_app = "sauna.asgi:application"
+    worker_class = "uvicorn_worker.UvicornWorker"
+    db_pool_max_size = os.getenv("GUNICORN_DB_POOL_MAX_SIZE")
+else:
+    wsgi_app = "sauna.wsgi:application"
+    db_pool_max_size = os.getenv("GUNICORN_DB_POOL_MAX_SIZE", "1")
+
+
+def on_starting(server):
+    from sauna import metrics
+
+    metrics.reset_multiproc_dir()
+
+
+def post_worker_init(worker):
+    from sauna import db_pool
+
+    db_pool.configure(db_pool_max_size)
+
+
+def child_exit(server, worker):
+    from sauna import metrics
+
+    metrics.mark_process_dead(worker.pid)
@@ -3,6 +3,13 @@ ASGI config for sauna project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Deployment: `GUNICORN_MODE=asgi gunicorn -c gunicorn.conf.py` runs this
+application in uvicorn workers (`make gunicorn-asgi`). Under ASGI the hot
+public reads (room bookings, bonus balance and transactions, catalog lists)
+are served by async views, see sauna/async_views.py; everything else runs
+the regular DRF views in a thread. The request profiler (?__profile=1)
+needs the default WSGI mode.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
@@ -12,5 +19,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sauna.settings')
+os.environ.setdefault('ASYNC_READ_VIEWS', '1')
 
 application = get_asgi_application()
@@ -0,0 +1,111 @@
+"""
+Async read path for the hot public endpoints.
+
+Under ASGI (sauna/asgi.py sets ASYNC_READ_VIEWS=1) the routes listed in each
+app's async_views.HANDLERS are served by async handlers for anonymous GETs:
+queries go through the async ORM, the token buckets through redis.asyncio,
+and the worker's event loop keeps serving other requests while they wait.
+Everything else on those routes (requests with credentials, writes, format
+suffixes) still goes to the DRF view through sync_to_async.
+
+Handlers reuse the DRF view class for the queryset, serializer, permissions
+and throttles, so both paths return the same data. A handler can raise
+Fallback to let the DRF view answer instead.
+
+Under WSGI the routes are left alone: every async view would need its own
+event loop per request there.
+"""
+from __future__ import annotations
+
+import functools
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.urls import URLPattern, URLResolver
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from sauna.throttling import athrottle
+
+
+class Fallback(Exception):
+    """Let the sync DRF view handle the request."""
+
+
+def async_read_view(handler, fallback):
+    fallback = sync_to_async(fallback)
+
+    @functools.wraps(fallback.func)
+    async def view(request, *args, **kwargs):
+        if (
+            request.method == "GET"
+            and not args
+            and not kwargs
+            and "HTTP_AUTHORIZATION" not in request.META
+        ):
+            try:
+                return await handler(request)
+            except Fallback:
+                pass
+        return await fallback(request, *args, **kwargs)
+
+    return view
+
+
+def install(patterns, handlers) -> None:
+    """Wrap the routes named in `handlers` ({url name: handler}) in place, including included lists."""
+    for i, pattern in enumerate(patterns):
+        if isinstance(pattern, URLResolver):
+            if isinstance(pattern.urlconf_name, list):
+                install(pattern.urlconf_name, handlers)
+        elif pattern.name in handlers:
+            patterns[i] = URLPattern(
+                pattern.pattern,
+                async_read_view(handlers[pattern.name], pattern.callback),
+                pattern.default_args,
+                pattern.name,
+            )
+
+
+async def anonymous_view(view_class, request, action=None):
+    """
+    A DRF view instance set up as as_view() would for an anonymous request,
+    after DRF's permission and throttle checks. Returns (view, None) or
+    (None, the 429 response).
+    """
+    view = view_class()
+    if action is not None:
+        view.action = action
+    view.request = Request(request)
+    view.args, view.kwargs = (), {}
+    view.format_kwarg = None
+    view.headers = {}
+    for permission in view.get_permissions():
+        if not permission.has_permission(view.request, view):
+            raise Fallback
+    throttled = await athrottle(view.request, view.get_throttles())
+    if throttled is not None:
+        return None, throttled
+    return view, None
+
+
+def list_handler(view_class):
+    """Async ModelViewSet.list() for anonymous requests."""
+
+    async def handler(request):
+        view, throttled = await anonymous_view(view_class, request, "list")
+        if throttled is not None:
+            return throttled
+        if view.paginator is not None:
+            raise Fallback
+        objects = [obj async for obj in view.filter_queryset(view.get_queryset())]
+        return json_response(view.get_serializer(objects, many=True).data)
+
+    return handler
+
+
+def json_response(data, status=200):
+    """The body DRF's JSONRenderer would produce."""
+    return HttpResponse(
+        JSONRenderer().render(data), content_type="application/json", status=status
+    )
@@ -1,6 +1,15 @@
 import os
+import time
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import (
+    before_task_publish,
+    task_postrun,
+    task_prerun,
+    worker_init,
+    worker_process_init,
+    worker_process_shutdown,
+)
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "sauna.settings")
 
@@ -16,3 +25,118 @@ app.autodiscover_tasks()
 #     },
 # }
 # app.conf.beat_schedule = CELERY_BEAT_SCHEDULE
+
+
+# ---- Prometheus: task run time and queue lag (see sauna/metrics.py) ----
+
+_task_started = {}
+
+
+@before_task_publish.connect
+def stamp_published_at(headers=None, **kwargs):
+    if headers is not None:
+        headers["published_at"] = time.time()
+
+
+@task_prerun.connect
+def observe_queue_lag(task_id=None, task=None, **kwargs):
+    from sauna import metrics
+
+    _task_started[task_id] = time.perf_counter()
+    published_at = getattr(task.request, "published_at", None)
+    if published_at is None:
+        return
+    due = float(published_at)
+    eta = task.request.eta
+    if eta:
+        # a countdown/ETA task is not late before it is due
+        eta = eta if not isinstance(eta, str) else _parse_eta(eta)
+        if eta is not None:
+            due = max(due, eta.timestamp())
+    metrics.CELERY_TASK_QUEUE_LAG.labels(task.name).observe(max(0.0, time.time() - due))
+
+
+@task_postrun.connect
+def observe_runtime(task_id=None, task=None, state=None, **kwargs):
+    from sauna import metrics
+
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        metrics.CELERY_TASK_RUNTIME.labels(task.name, state or "UNKNOWN").observe(
+            time.perf_counter() - started
+        )
+
+
+@worker_init.connect
+def start_metrics_server(**kwargs):
+    from django.conf import settings
+    from prometheus_client import start_http_server
+    from sauna import metrics
+
+    metrics.reset_multiproc_dir()
+    start_http_server(settings.CELERY_METRICS_PORT, registry=metrics.registry())
+
+
+@worker_process_shutdown.connect
+def mark_worker_dead(pid=None, **kwargs):
+    from sauna import metrics
+
+    metrics.mark_process_dead(pid or os.getpid())
+
+
+def _parse_eta(value):
+    from datetime import datetime
+
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+# ---- Logging: tasks log with the id of the request that queued them ----
+
+_request_id_tokens = {}
+
+
+@before_task_publish.connect
+def stamp_request_id(headers=None, **kwargs):
+    from sauna.logs import current_request_id
+
+    request_id = current_request_id()
+    if headers is not None and request_id:
+        headers["request_id"] = request_id
+
+
+@task_prerun.connect
+def bind_request_id(task_id=None, task=None, **kwargs):
+    from sauna.logs import request_id_var
+
+    request_id = getattr(task.request, "request_id", None) or task_id
+    _request_id_tokens[task_id] = request_id_var.set(request_id)
+
+
+@task_postrun.connect
+def unbind_request_id(task_id=None, **kwargs):
+    from sauna.logs import request_id_var
+
+    token = _request_id_tokens.pop(task_id, None)
+    if token is not None:
+        request_id_var.reset(token)
+
+
+# ---- Database: one pool per worker process (see sauna/db_pool.py) ----
+
+
+@worker_process_init.connect
+def configure_db_pool(**kwargs):
+    from sauna import db_pool
+
+    # A prefork child runs one task at a time
+    db_pool.configure(os.getenv("CELERY_DB_POOL_MAX_SIZE", "1"))
+
+
+@task_postrun.connect
+def observe_db_pool(**kwargs):
+    from sauna import db_pool
+
+    db_pool.observe()
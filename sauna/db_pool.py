@@ -0,0 +1,86 @@
+"""
+Postgres connection reuse, chosen with DB_CONN_MODE:
+
+pool        (default) every process keeps a psycopg 3 pool per database
+            alias (Django's OPTIONS["pool"]). A request borrows a connection
+            and gives it back when it finishes, so requests no longer pay
+            for a connection and a backend fork each. Connections are checked
+            before they are handed out (CONN_HEALTH_CHECKS): one the server
+            closed is replaced instead of failing the request. Waiting longer
+            than DB_POOL_TIMEOUT for a free connection fails the request.
+persistent  one connection per thread, kept for DB_CONN_MAX_AGE seconds and
+            checked at the start of each request. Sync (WSGI) workers only:
+            under ASGI every request runs in a new thread and would leave
+            its connection open.
+none        a new connection per request.
+
+Pools are per process and sized by DB_POOL_MIN_SIZE / DB_POOL_MAX_SIZE.
+Gunicorn and Celery worker processes override the maximum with
+GUNICORN_DB_POOL_MAX_SIZE / CELERY_DB_POOL_MAX_SIZE through configure(): a
+sync gunicorn worker or a prefork Celery child handles one request or task
+at a time, a uvicorn worker handles many.
+
+observe() copies the pool counters to Prometheus after every request and
+task: checkouts, checkouts that had to wait and for how long, connections
+opened, errors (checkout timeouts, failed connects, broken connections
+found by the health check or returned by a request) and the current
+pool size, idle connections and waiting requests.
+"""
+from __future__ import annotations
+
+from django.db import connections
+from django.db.backends.postgresql.base import DatabaseWrapper
+
+from sauna import metrics
+
+# pop_stats() key -> sauna_db_pool_errors_total{kind}
+ERROR_KINDS = {
+    "requests_errors": "timeout",
+    "connections_errors": "connect",
+    "connections_lost": "lost",
+    "returns_bad": "bad_return",
+}
+
+
+def _pools():
+    # Django keeps the pools per alias on the backend class, shared by all threads
+    return list(DatabaseWrapper._connection_pools.items())
+
+
+def configure(max_size=None, min_size=None) -> None:
+    """
+    Size this process's pools; call in a newly forked worker before it uses
+    the database. Pools inherited from the parent are dropped without being
+    closed: their connections belong to the parent.
+    """
+    DatabaseWrapper._connection_pools.clear()
+    if max_size is None and min_size is None:
+        return
+    for alias in connections:
+        settings_dict = connections.settings[alias]
+        pool = settings_dict["OPTIONS"].get("pool")
+        if not pool:
+            continue
+        pool = {} if pool is True else dict(pool)
+        if max_size is not None:
+            pool["max_size"] = int(max_size)
+        if min_size is not None:
+            pool["min_size"] = int(min_size)
+        if "max_size" in pool:
+            pool["min_size"] = min(pool.get("min_size", 4), pool["max_size"])
+        settings_dict["OPTIONS"] = {**settings_dict["OPTIONS"], "pool": pool}
+
+
+def observe() -> None:
+    for alias, pool in _pools():
+        stats = pool.pop_stats()
+        metrics.DB_POOL_CHECKOUTS.labels(alias).inc(stats.get("requests_num", 0))
+        metrics.DB_POOL_WAITS.labels(alias).inc(stats.get("requests_queued", 0))
+        metrics.DB_POOL_WAIT_SECONDS.labels(alias).inc(stats.get("requests_wait_ms", 0) / 1000)
+        metrics.DB_POOL_CONNECTIONS_OPENED.labels(alias).inc(stats.get("connections_num", 0))
+        for key, kind in ERROR_KINDS.items():
+            if stats.get(key):
+                metrics.DB_POOL_ERRORS.labels(alias, kind).inc(stats[key])
+        metrics.DB_POOL_CONNECTIONS.labels(alias, "open").set(stats.get("pool_size", 0))
+        metrics.DB_POOL_CONNECTIONS.labels(alias, "idle").set(stats.get("pool_available", 0))
+        metrics.DB_POOL_WAITING.labels(alias).set(stats.get("requests_waiting", 0))
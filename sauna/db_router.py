@@ -0,0 +1,126 @@
+"""
+Read replicas with read-your-writes stickiness.
+
+ReplicaRoutingMiddleware picks a replica from DATABASE_REPLICAS for each
+GET/HEAD/OPTIONS request (lists, details, reports, exports); ReplicaRouter
+then sends that request's reads there. Reads go to the primary instead when
+
+- the request is not a safe method, or the client wrote recently: a request
+  that wrote gets a cookie (and the X-DB-Primary-Until header, for clients
+  without cookies to send back) that keeps the client's reads on the primary
+  for REPLICA_STICKY_SECONDS, longer than the replication lag we expect;
+- the request already wrote, or the read runs inside a transaction on the
+  primary;
+- there is no request at all (Celery tasks, management commands).
+
+Writes always go to the primary. Availability checks that must see the
+latest data query the primary explicitly (see BookingSerializer.validate).
+"""
+from __future__ import annotations
+
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from sauna.middleware import HybridMiddleware
+
+STICKY_COOKIE = "db_primary_until"
+STICKY_HEADER = "X-DB-Primary-Until"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class RoutingState:
+    __slots__ = ("replica", "wrote")
+
+    def __init__(self, replica=None):
+        self.replica = replica
+        self.wrote = False
+
+
+# Set per request; a mutable object so writes made in sync_to_async threads are seen
+_state: ContextVar[RoutingState | None] = ContextVar("db_routing", default=None)
+
+
+@contextmanager
+def routing(replica):
+    """Route reads like a request that reads from `replica` (None: the primary)."""
+    state = RoutingState(replica)
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        state = _state.get()
+        if state is None or state.replica is None or state.wrote:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
+
+
+def _sticky_until(request) -> float:
+    value = request.COOKIES.get(STICKY_COOKIE) or request.headers.get(STICKY_HEADER)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def choose_replica(request):
+    """The alias this request reads from, or None for the primary."""
+    if not settings.DATABASE_REPLICAS or request.method not in SAFE_METHODS:
+        return None
+    if _sticky_until(request) > time.time():
+        return None
+    return random.choice(settings.DATABASE_REPLICAS)
+
+
+class ReplicaRoutingMiddleware(HybridMiddleware):
+    def handle(self, request):
+        with routing(choose_replica(request)) as state:
+            response = self.get_response(request)
+        return self.stick(response, state)
+
+    async def __acall__(self, request):
+        with routing(choose_replica(request)) as state:
+            response = await self.get_response(request)
+        return self.stick(response, state)
+
+    @staticmethod
+    def stick(response, state):
+        if not settings.DATABASE_REPLICAS or not state.wrote:
+            return response
+        until = f"{time.time() + settings.REPLICA_STICKY_SECONDS:.3f}"
+        response.set_cookie(
+            STICKY_COOKIE,
+            until,
+            max_age=settings.REPLICA_STICKY_SECONDS,
+            httponly=True,
+            samesite="Lax",
+        )
+        response[STICKY_HEADER] = until
+        return response
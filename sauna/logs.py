@@ -0,0 +1,185 @@
+"""
+Structured logging.
+
+Every record goes through a QueueHandler: the request thread only puts the
+record on an in-memory queue and a QueueListener thread formats it and
+writes it to stderr, so a slow pipe or log shipper never blocks a request.
+Records are formatted as one JSON object per line (LOG_FORMAT=json) or as
+plain text for local development (LOG_FORMAT=text).
+
+RequestIdMiddleware gives each request an id (the incoming X-Request-ID or a
+new one) that is attached to every record logged while the request is
+handled, echoed back in the response and forwarded to Celery tasks queued
+by the request.
+
+Pricing traces: Booking.calculate_final_price() logs how the price was
+reached only for a sampled share of requests (PRICING_TRACE_SAMPLE_RATE) or
+when a staff user (any JWT-authenticated user) sends "X-Pricing-Trace: 1";
+with DEBUG on the header works for anyone. For the rest it does not even
+build the trace.
+"""
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from django.conf import settings
+
+from sauna.middleware import HybridMiddleware, jwt_user
+
+request_id_var: ContextVar[str | None] = ContextVar("request_id", default=None)
+pricing_trace_var: ContextVar[bool] = ContextVar("pricing_trace", default=False)
+
+REQUEST_ID_HEADER = "X-Request-ID"
+PRICING_TRACE_HEADER = "X-Pricing-Trace"
+QUEUE_SIZE = 10000
+
+_VALID_REQUEST_ID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+# attributes every LogRecord has; anything else came in through `extra`
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message",
+    "asctime",
+    "request_id",
+}
+
+
+def current_request_id() -> str | None:
+    return request_id_var.get()
+
+
+def pricing_trace_enabled() -> bool:
+    return pricing_trace_var.get()
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            payload["exc_info"] = record.exc_text
+        if record.stack_info:
+            payload["stack_info"] = self.formatStack(record.stack_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s")
+
+
+class NonBlockingHandler(QueueHandler):
+    """
+    Queues records for a background QueueListener that writes them to stderr.
+
+    The listener thread is started lazily and again after a fork (gunicorn
+    and Celery prefork workers), since threads do not survive fork. When the
+    queue is full the record is dropped rather than blocking the caller.
+    """
+
+    def __init__(self, fmt: str = "json"):
+        super().__init__(queue.Queue(QUEUE_SIZE))
+        stream = logging.StreamHandler(sys.stderr)
+        stream.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+        self.target = stream
+        self.listener = None
+        self.pid = None
+        self.dropped = 0
+        atexit.register(self.stop)
+
+    def prepare(self, record):
+        # Keep `args` so the message is only formatted in the listener
+        # thread; only exception text must be rendered here, while the
+        # traceback still exists.
+        if getattr(record, "request_id", None) is None:
+            # django.request logs the response after the middleware is done
+            record.request_id = request_id_var.get() or getattr(
+                getattr(record, "request", None), "request_id", None
+            )
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.target.formatter.formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def emit(self, record):
+        if self.pid != os.getpid():
+            self._start()
+        super().emit(record)
+
+    def _start(self):
+        self.pid = os.getpid()
+        self.queue = queue.Queue(QUEUE_SIZE)
+        self.listener = QueueListener(self.queue, self.target, respect_handler_level=False)
+        self.listener.start()
+
+    def stop(self):
+        if self.listener is not None and self.pid == os.getpid():
+            self.listener.stop()
+            self.listener = None
+            self.pid = None
+
+
+class RequestIdMiddleware(HybridMiddleware):
+    """Sets the request id and the pricing-trace sampling decision for the request."""
+
+    def handle(self, request):
+        request_id, tokens = self.bind(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            self.unbind(tokens)
+        response[REQUEST_ID_HEADER] = request_id
+        return response
+
+    async def __acall__(self, request):
+        # The async views only serve anonymous requests, so there is no user to check
+        request_id, tokens = self.bind(request, authenticate=False)
+        try:
+            response = await self.get_response(request)
+        finally:
+            self.unbind(tokens)
+        response[REQUEST_ID_HEADER] = request_id
+        return response
+
+    @staticmethod
+    def bind(request, authenticate=True):
+        incoming = request.headers.get(REQUEST_ID_HEADER, "")
+        request_id = incoming if _VALID_REQUEST_ID.match(incoming) else uuid.uuid4().hex
+        request.request_id = request_id
+        trace = random.random() < settings.PRICING_TRACE_SAMPLE_RATE or (
+            request.headers.get(PRICING_TRACE_HEADER) == "1"
+            and (settings.DEBUG or (authenticate and jwt_user(request) is not None))
+        )
+        return request_id, (request_id_var.set(request_id), pricing_trace_var.set(trace))
+
+    @staticmethod
+    def unbind(tokens):
+        request_token, trace_token = tokens
+        request_id_var.reset(request_token)
+        pricing_trace_var.reset(trace_token)
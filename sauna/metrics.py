@@ -0,0 +1,173 @@
+"""
+Prometheus metrics.
+
+Gunicorn and the Celery prefork pool run several processes, so each one
+writing to its own in-memory registry would make /metrics answer for a
+random worker. When PROMETHEUS_MULTIPROC_DIR is set, prometheus_client
+keeps every metric in per-process files in that directory and the
+exposition merges them with MultiProcessCollector. The directory must be
+emptied before the server starts and dead workers must be marked (see
+gunicorn.conf.py and the worker signals in sauna/celery.py).
+
+Without PROMETHEUS_MULTIPROC_DIR (runserver, tests) the default in-process
+registry is used.
+"""
+from __future__ import annotations
+
+import os
+import shutil
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+TASK_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 15, 30, 60, 120, 300, 600)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "sauna_http_request_duration_seconds",
+    "Time spent handling a request, per view and action",
+    ["view", "action", "method", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+
+BOOKING_CREATE_OUTCOMES = Counter(
+    "sauna_booking_create_total",
+    "Booking creation attempts by outcome (created or the validation error code)",
+    ["outcome"],
+)
+
+CELERY_TASK_RUNTIME = Histogram(
+    "sauna_celery_task_runtime_seconds",
+    "Celery task run time",
+    ["task", "state"],
+    buckets=TASK_BUCKETS,
+)
+CELERY_TASK_QUEUE_LAG = Histogram(
+    "sauna_celery_task_queue_lag_seconds",
+    "Time between a task becoming due (published or its ETA) and a worker starting it",
+    ["task"],
+    buckets=TASK_BUCKETS,
+)
+
+IDEMPOTENCY_REQUESTS = Counter(
+    "sauna_idempotency_requests_total",
+    "Requests with an Idempotency-Key by outcome: executed, replayed, in_progress or mismatch",
+    ["scope", "outcome"],
+)
+
+TELEGRAM_SEND_DURATION = Histogram(
+    "sauna_telegram_send_duration_seconds",
+    "Telegram sendMessage latency",
+    ["chat_type"],
+    buckets=LATENCY_BUCKETS,
+)
+TELEGRAM_ERRORS = Counter(
+    "sauna_telegram_errors_total",
+    "Failed Telegram sendMessage calls",
+    ["chat_type", "reason"],
+)
+
+# Connection pools, see sauna/db_pool.py
+DB_POOL_CHECKOUTS = Counter(
+    "sauna_db_pool_checkouts_total",
+    "Connections handed out by the pool",
+    ["alias"],
+)
+DB_POOL_WAITS = Counter(
+    "sauna_db_pool_waits_total",
+    "Checkouts that had to wait for a free connection",
+    ["alias"],
+)
+DB_POOL_WAIT_SECONDS = Counter(
+    "sauna_db_pool_wait_seconds_total",
+    "Time spent waiting for a free connection",
+    ["alias"],
+)
+DB_POOL_CONNECTIONS_OPENED = Counter(
+    "sauna_db_pool_connections_opened_total",
+    "Connections the pool opened to the server",
+    ["alias"],
+)
+DB_POOL_ERRORS = Counter(
+    "sauna_db_pool_errors_total",
+    "Pool errors: checkout timeout, failed connect, connection lost or returned broken",
+    ["alias", "kind"],
+)
+DB_POOL_CONNECTIONS = Gauge(
+    "sauna_db_pool_connections",
+    "Connections held by the pools (open) and not checked out (idle), "
+    "at the end of the last request or task",
+    ["alias", "state"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_WAITING = Gauge(
+    "sauna_db_pool_waiting_requests",
+    "Requests waiting for a connection",
+    ["alias"],
+    multiprocess_mode="livesum",
+)
+
+
+def registry():
+    if not MULTIPROC_DIR:
+        return REGISTRY
+    collector_registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(collector_registry)
+    return collector_registry
+
+
+def exposition() -> tuple[bytes, str]:
+    return generate_latest(registry()), CONTENT_TYPE_LATEST
+
+
+def reset_multiproc_dir() -> None:
+    """Remove files left by a previous run; call once before workers start."""
+    if not MULTIPROC_DIR:
+        return
+    shutil.rmtree(MULTIPROC_DIR, ignore_errors=True)
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+
+def mark_process_dead(pid: int) -> None:
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
+
+
+def record_booking_validation_error(codes) -> None:
+    """
+    Count each distinct reason of a failed booking creation. `codes` is
+    ValidationError.get_codes(): validate() errors carry their own code
+    (overlap, active_booking, ...), field errors count as invalid_<field>.
+    """
+    reasons = set()
+    if isinstance(codes, dict):
+        for field, field_codes in codes.items():
+            if field == "non_field_errors":
+                reasons.update(_flatten(field_codes))
+            else:
+                reasons.add(f"invalid_{field}")
+    else:
+        reasons.update(_flatten(codes))
+    for reason in reasons or {"invalid"}:
+        BOOKING_CREATE_OUTCOMES.labels(reason).inc()
+
+
+def _flatten(codes):
+    if isinstance(codes, (list, tuple)):
+        for code in codes:
+            yield from _flatten(code)
+    elif isinstance(codes, dict):
+        for code in codes.values():
+            yield from _flatten(code)
+    else:
+        yield str(codes)
@@ -0,0 +1,280 @@
+"""
+Per-request SQL instrumentation.
+
+Every query of the request goes through a connection.execute_wrapper, which
+keeps the count, the total DB time and the slowest statement. The numbers are
+returned in a Server-Timing header, requests over SLOW_REQUEST_MS or
+SLOW_REQUEST_QUERIES are logged, and a QUERY_STATS_SAMPLE_RATE share of
+requests is added to the fingerprint aggregate in sauna/query_stats.py.
+
+Queries run while a StreamingHttpResponse is consumed happen after the
+middleware has returned and are not counted.
+
+ProfilerMiddleware (superadmin-only cProfile runs) and PrometheusMiddleware
+live here as well. All of them are HybridMiddleware, so under ASGI (see
+sauna/asgi.py) they run on the event loop instead of in a worker thread.
+"""
+from __future__ import annotations
+
+import logging
+import random
+import time
+import uuid
+from contextlib import ExitStack
+
+import redis
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.http import JsonResponse
+
+from sauna import db_pool, metrics, query_stats
+
+log = logging.getLogger(__name__)
+
+
+class HybridMiddleware:
+    """
+    Base for middleware that works in both stacks: subclasses implement
+    handle() for WSGI and __acall__() for ASGI. Django otherwise runs a
+    sync-only middleware in a thread under ASGI.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.handle(request)
+
+    def handle(self, request):
+        raise NotImplementedError
+
+    async def __acall__(self, request):
+        raise NotImplementedError
+
+
+class QueryCollector:
+    def __init__(self, keep_queries: bool):
+        self.count = 0
+        self.total_ms = 0.0
+        self.slowest = (0.0, None)
+        self.queries = [] if keep_queries else None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = (time.perf_counter() - started) * 1000
+            self.count += 1
+            self.total_ms += duration
+            if duration > self.slowest[0]:
+                self.slowest = (duration, sql)
+            if self.queries is not None:
+                self.queries.append((sql, duration))
+
+
+def view_name(request) -> str:
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return request.path
+    return match.view_name or match._func_path
+
+
+class QueryInstrumentationMiddleware(HybridMiddleware):
+    def handle(self, request):
+        if not settings.QUERY_INSTRUMENTATION_ENABLED:
+            return self.get_response(request)
+
+        collector = QueryCollector(keep_queries=random.random() < settings.QUERY_STATS_SAMPLE_RATE)
+        started = time.perf_counter()
+        with self.attach(collector):
+            response = self.get_response(request)
+        name = self.finish(request, response, collector, started)
+        if collector.queries:
+            query_stats.record(collector.queries, name)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.QUERY_INSTRUMENTATION_ENABLED:
+            return await self.get_response(request)
+
+        collector = QueryCollector(keep_queries=random.random() < settings.QUERY_STATS_SAMPLE_RATE)
+        started = time.perf_counter()
+        # Connections are per thread: the async ORM of this request runs in
+        # the request's thread-sensitive executor, so the wrappers go there
+        stack = await sync_to_async(self.attach)(collector)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        name = self.finish(request, response, collector, started)
+        if collector.queries:
+            await sync_to_async(query_stats.record, thread_sensitive=False)(collector.queries, name)
+        return response
+
+    @staticmethod
+    def attach(collector) -> ExitStack:
+        """Install `collector` on every connection of the current thread until the stack is closed."""
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(collector))
+        return stack
+
+    @staticmethod
+    def finish(request, response, collector, started) -> str:
+        """Set Server-Timing and log slow requests; returns the view name."""
+        total_ms = (time.perf_counter() - started) * 1000
+        timing = (
+            f'db;dur={collector.total_ms:.1f};desc="{collector.count} queries", '
+            f"app;dur={total_ms:.1f}"
+        )
+        if response.has_header("Server-Timing"):
+            timing = f'{response["Server-Timing"]}, {timing}'
+        response["Server-Timing"] = timing
+
+        name = view_name(request)
+        if (
+            total_ms >= settings.SLOW_REQUEST_MS
+            or collector.count >= settings.SLOW_REQUEST_QUERIES
+        ):
+            slowest_ms, slowest_sql = collector.slowest
+            log.warning(
+                "Slow request %s %s (%s) -> %s: %.1f ms, %d queries, %.1f ms in DB; "
+                "slowest %.1f ms: %s",
+                request.method,
+                request.path,
+                name,
+                response.status_code,
+                total_ms,
+                collector.count,
+                collector.total_ms,
+                slowest_ms,
+                (slowest_sql or "")[:500],
+            )
+        return name
+
+
+def view_labels(request):
+    """(view, action) for metrics: the DRF view class and viewset action if any."""
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unmatched", ""
+    cls = getattr(match.func, "cls", None)
+    view = cls.__name__ if cls is not None else (match.view_name or match._func_path)
+    actions = getattr(match.func, "actions", None) or {}
+    return view, actions.get(request.method.lower(), "")
+
+
+class PrometheusMiddleware(HybridMiddleware):
+    """Observes sauna_http_request_duration_seconds for every request."""
+
+    def handle(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self.observe(request, response, started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self.observe(request, response, started)
+        return response
+
+    @staticmethod
+    def observe(request, response, started):
+        view, action = view_labels(request)
+        metrics.HTTP_REQUEST_DURATION.labels(
+            view, action, request.method, str(response.status_code)
+        ).observe(time.perf_counter() - started)
+        db_pool.observe()
+
+
+def _wants_profile(request):
+    # Cheap checks first: requests without the flag pay two dict lookups
+    if "__profile" in request.META.get("QUERY_STRING", ""):
+        return request.GET.get("__profile")
+    return request.META.get("HTTP_X_PROFILE")
+
+
+def jwt_user(request):
+    """The user of the request's JWT, or None. Middleware runs before DRF authenticates."""
+    from rest_framework.exceptions import AuthenticationFailed
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from rest_framework_simplejwt.exceptions import InvalidToken
+
+    try:
+        result = JWTAuthentication().authenticate(request)
+    except (AuthenticationFailed, InvalidToken):
+        return None
+    return result[0] if result is not None else None
+
+
+def _is_superadmin(request) -> bool:
+    user = jwt_user(request)
+    return user is not None and user.role == "superadmin"
+
+
+class ProfilerMiddleware(HybridMiddleware):
+    """
+    Profiles requests flagged with ?__profile=1|inline or "X-Profile: 1|inline"
+    when sent by a superadmin; see sauna/profiling.py.
+
+    cProfile follows a single thread, while under ASGI a request hops between
+    the event loop and executor threads, so profiling needs the WSGI
+    deployment; under ASGI flagged requests get "X-Profile-Status: unsupported".
+    """
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if _wants_profile(request) in ("1", "inline"):
+            response["X-Profile-Status"] = "unsupported"
+        return response
+
+    def handle(self, request):
+        mode = _wants_profile(request)
+        if mode not in ("1", "inline") or not _is_superadmin(request):
+            return self.get_response(request)
+
+        from sauna import profiling
+        from sauna.logs import current_request_id
+
+        collector = QueryCollector(keep_queries=True)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(collector))
+                with profiling.Profiler() as profiler:
+                    response = self.get_response(request)
+        except profiling.Busy:
+            response = self.get_response(request)
+            response["X-Profile-Status"] = "busy"
+            return response
+
+        profile_id = uuid.uuid4().hex
+        report = {
+            "request_id": current_request_id(),
+            "method": request.method,
+            "path": request.get_full_path(),
+            "view": view_name(request),
+            "status": response.status_code,
+            **profiler.report(collector.queries),
+        }
+        if mode == "inline":
+            return JsonResponse({"id": profile_id, **report})
+        try:
+            profiling.store(profile_id, report)
+        except redis.RedisError:
+            log.warning("Failed to store profile of %s %s", request.method, request.path, exc_info=True)
+            response["X-Profile-Status"] = "unavailable"
+            return response
+        response["X-Profile-ID"] = profile_id
+        return response
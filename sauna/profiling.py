@@ -0,0 +1,165 @@
+"""
+On-demand request profiling for superadmins.
+
+A request sent with ?__profile=1 (or "X-Profile: 1") by a superadmin runs
+under cProfile with every SQL statement captured. The report is stored in
+Redis for PROFILE_TTL_SECONDS under the request id and can be fetched from
+/api/ops/profiles/<id>/; the response carries the id in X-Profile-ID.
+With ?__profile=inline the report replaces the response body instead.
+
+The report splits the request time into:
+    serializer_ms  BaseSerializer.data / is_valid / save
+    render_ms      Response.rendered_content (JSON rendering)
+    view_ms        everything else (view, middleware, permissions, ...)
+and lists the functions with the most cumulative time, all queries with
+their timings and the statements that ran more than once (N+1 candidates).
+
+Only one request per process is profiled at a time; a concurrent one is
+served normally with "X-Profile-Status: busy".
+"""
+from __future__ import annotations
+
+import cProfile
+import json
+import pstats
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework.response import Response
+from rest_framework.serializers import BaseSerializer
+
+from sauna.query_stats import normalize_sql
+from sauna.redis_client import get_redis
+
+PROFILE_KEY = "profile:{id}"
+RECENT_KEY = "profile:recent"  # LIST of recent profile ids, newest first
+MAX_RECENT = 100
+MAX_QUERIES = 500
+MAX_SQL_LENGTH = 2000
+
+_lock = threading.Lock()
+
+
+def _code_key(func):
+    code = func.__code__
+    return (code.co_filename, code.co_firstlineno, code.co_name)
+
+
+SERIALIZER_FUNCTIONS = {
+    _code_key(BaseSerializer.data.fget),
+    _code_key(BaseSerializer.is_valid),
+    _code_key(BaseSerializer.save),
+}
+RENDER_FUNCTIONS = {_code_key(Response.rendered_content.fget)}
+
+
+class Busy(Exception):
+    pass
+
+
+class Profiler:
+    """Context manager: cProfile for the current thread; raises Busy if another profile runs."""
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        self.started = None
+        self.total_ms = None
+
+    def __enter__(self):
+        if not _lock.acquire(blocking=False):
+            raise Busy
+        self.started = time.perf_counter()
+        self.profile.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profile.disable()
+        self.total_ms = (time.perf_counter() - self.started) * 1000
+        _lock.release()
+        return False
+
+    def report(self, queries) -> dict:
+        """`queries` are the [(sql, ms), ...] captured while profiling."""
+        stats = pstats.Stats(self.profile).stats
+
+        def cumulative_ms(keys):
+            return sum(stats[key][3] for key in keys if key in stats) * 1000
+
+        serializer_ms = cumulative_ms(SERIALIZER_FUNCTIONS)
+        render_ms = cumulative_ms(RENDER_FUNCTIONS)
+
+        functions = sorted(stats.items(), key=lambda entry: entry[1][3], reverse=True)
+        top = [
+            {
+                "function": pstats.func_std_string(key),
+                "calls": calls,
+                "own_ms": round(own * 1000, 3),
+                "cumulative_ms": round(cumulative * 1000, 3),
+            }
+            for key, (_, calls, own, cumulative, _) in functions[: settings.PROFILE_TOP_FUNCTIONS]
+        ]
+
+        grouped = {}
+        for sql, duration in queries:
+            entry = grouped.setdefault(normalize_sql(sql), [0, 0.0])
+            entry[0] += 1
+            entry[1] += duration
+        duplicates = sorted(
+            (
+                {"sql": sql[:MAX_SQL_LENGTH], "count": count, "total_ms": round(total, 3)}
+                for sql, (count, total) in grouped.items()
+                if count > 1
+            ),
+            key=lambda entry: entry["count"],
+            reverse=True,
+        )
+
+        return {
+            "total_ms": round(self.total_ms, 3),
+            "view_ms": round(max(0.0, self.total_ms - serializer_ms - render_ms), 3),
+            "serializer_ms": round(serializer_ms, 3),
+            "render_ms": round(render_ms, 3),
+            "sql_ms": round(sum(duration for _, duration in queries), 3),
+            "query_count": len(queries),
+            "functions": top,
+            "queries": [
+                {"sql": sql[:MAX_SQL_LENGTH], "ms": round(duration, 3)}
+                for sql, duration in queries[:MAX_QUERIES]
+            ],
+            "duplicate_queries": duplicates,
+        }
+
+
+def store(profile_id: str, report: dict) -> None:
+    report = {"id": profile_id, "created_at": timezone.now().isoformat(), **report}
+    pipe = get_redis().pipeline(transaction=False)
+    pipe.set(PROFILE_KEY.format(id=profile_id), json.dumps(report), ex=settings.PROFILE_TTL_SECONDS)
+    pipe.lpush(RECENT_KEY, profile_id)
+    pipe.ltrim(RECENT_KEY, 0, MAX_RECENT - 1)
+    pipe.execute()
+
+
+def fetch(profile_id: str) -> dict | None:
+    raw = get_redis().get(PROFILE_KEY.format(id=profile_id))
+    return json.loads(raw) if raw else None
+
+
+def recent() -> list[dict]:
+    """Summaries of the stored profiles that have not expired, newest first."""
+    client = get_redis()
+    ids = client.lrange(RECENT_KEY, 0, -1)
+    if not ids:
+        return []
+    result = []
+    for raw in client.mget([PROFILE_KEY.format(id=profile_id) for profile_id in ids]):
+        if raw:
+            report = json.loads(raw)
+            result.append(
+                {
+                    key: report.get(key)
+                    for key in ("id", "created_at", "method", "path", "status", "total_ms", "query_count")
+                }
+            )
+    return result
@@ -0,0 +1,123 @@
+"""
+Sampled, fingerprinted SQL statistics in Redis.
+
+A fingerprint is the statement with parameters, numbers, string literals and
+IN-lists collapsed, so "WHERE id IN (%s, %s, %s)" and "WHERE id IN (%s)"
+count as one query. For each fingerprint we keep the number of executions,
+the total time, the normalized SQL, the last views that ran it and a capped
+list of recent durations for the p95.
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import math
+import re
+
+import redis
+
+from sauna.redis_client import get_redis
+
+log = logging.getLogger(__name__)
+
+COUNTS_KEY = "querystats:count"  # ZSET fingerprint -> executions
+TIME_KEY = "querystats:time"  # ZSET fingerprint -> total ms
+SQL_KEY = "querystats:sql"  # HASH fingerprint -> normalized SQL
+VIEWS_KEY = "querystats:views"  # HASH fingerprint -> last view name
+DURATIONS_KEY = "querystats:durations:{fingerprint}"  # LIST of recent ms
+MAX_DURATIONS = 500
+MAX_SQL_LENGTH = 2000
+
+_IN_LIST = re.compile(r"\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_SPACE = re.compile(r"\s+")
+
+
+def normalize_sql(sql: str) -> str:
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = sql.replace("%s", "?")
+    sql = _IN_LIST.sub("(...)", sql)
+    return _SPACE.sub(" ", sql).strip()
+
+
+def fingerprint(normalized: str) -> str:
+    return hashlib.sha1(normalized.encode()).hexdigest()[:16]
+
+
+def record(queries, view_name: str) -> None:
+    """Add a request's [(sql, ms), ...] to the aggregate; failures are only logged."""
+    grouped = {}
+    for sql, duration in queries:
+        normalized = normalize_sql(sql)
+        key = fingerprint(normalized)
+        if key not in grouped:
+            grouped[key] = (normalized, [])
+        grouped[key][1].append(duration)
+
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for key, (normalized, durations) in grouped.items():
+            pipe.zincrby(COUNTS_KEY, len(durations), key)
+            pipe.zincrby(TIME_KEY, sum(durations), key)
+            pipe.hsetnx(SQL_KEY, key, normalized[:MAX_SQL_LENGTH])
+            pipe.hset(VIEWS_KEY, key, view_name)
+            durations_key = DURATIONS_KEY.format(fingerprint=key)
+            pipe.lpush(durations_key, *(round(d, 3) for d in durations))
+            pipe.ltrim(durations_key, 0, MAX_DURATIONS - 1)
+        pipe.execute()
+    except redis.RedisError:
+        log.warning("Failed to record query stats", exc_info=True)
+
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, math.ceil(pct / 100 * len(values)) - 1))]
+
+
+def top(order_by: str = "time", limit: int = 50):
+    """Fingerprints with the most total time (or executions), heaviest first."""
+    client = get_redis()
+    ranking = client.zrevrange(TIME_KEY if order_by == "time" else COUNTS_KEY, 0, limit - 1)
+    if not ranking:
+        return []
+    pipe = client.pipeline(transaction=False)
+    for key in ranking:
+        pipe.zscore(COUNTS_KEY, key)
+        pipe.zscore(TIME_KEY, key)
+        pipe.hget(SQL_KEY, key)
+        pipe.hget(VIEWS_KEY, key)
+        pipe.lrange(DURATIONS_KEY.format(fingerprint=key), 0, -1)
+    values = pipe.execute()
+
+    result = []
+    for i, key in enumerate(ranking):
+        count, total, sql, view, durations = values[i * 5:(i + 1) * 5]
+        durations = [float(d) for d in durations]
+        count = int(count or 0)
+        result.append(
+            {
+                "fingerprint": key,
+                "sql": sql,
+                "last_view": view,
+                "count": count,
+                "total_ms": round(total or 0, 2),
+                "mean_ms": round((total or 0) / count, 3) if count else None,
+                "p95_ms": _percentile(durations, 95),
+                "samples": len(durations),
+            }
+        )
+    return result
+
+
+def reset() -> None:
+    client = get_redis()
+    keys = client.zrange(COUNTS_KEY, 0, -1)
+    pipe = client.pipeline(transaction=False)
+    for key in keys:
+        pipe.delete(DURATIONS_KEY.format(fingerprint=key))
+    pipe.delete(COUNTS_KEY, TIME_KEY, SQL_KEY, VIEWS_KEY)
+    pipe.execute()
@@ -0,0 +1,69 @@
+import asyncio
+import weakref
+
+import redis
+import redis.asyncio
+from django.conf import settings
+
+_client = None
+
+
+def get_redis():
+    """
+    Process-wide Redis client for application data (reminders, OTP codes, ...).
+
+    Celery keeps using its own broker connection; this one is for our keys only.
+    """
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(
+            settings.REDIS_URL,
+            decode_responses=True,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        )
+    return _client
+
+
+_scripts = {}
+
+
+def get_script(source: str):
+    """Register a Lua script once per process; calls then go out as EVALSHA."""
+    script = _scripts.get(source)
+    if script is None:
+        script = _scripts[source] = get_redis().register_script(source)
+    return script
+
+
+_async_clients = weakref.WeakKeyDictionary()  # event loop -> client
+_async_scripts = weakref.WeakKeyDictionary()  # event loop -> {source: script}
+
+
+def get_async_redis():
+    """
+    redis.asyncio client for the async views (see sauna/async_views.py).
+
+    Async connections belong to the event loop that opened them, so there is
+    one client per running loop: one per uvicorn worker, or one per request
+    when an async view runs under WSGI.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = redis.asyncio.Redis.from_url(
+            settings.REDIS_URL,
+            decode_responses=True,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        )
+    return client
+
+
+def get_async_script(source: str):
+    """get_script() for the async client of the running loop."""
+    scripts = _async_scripts.setdefault(asyncio.get_running_loop(), {})
+    script = scripts.get(source)
+    if script is None:
+        script = scripts[source] = get_async_redis().register_script(source)
+    return script
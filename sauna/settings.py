@@ -14,6 +14,7 @@ import os
 from pathlib import Path
 from dotenv import load_dotenv
 from celery.schedules import crontab
+from corsheaders.defaults import default_headers
 
 load_dotenv()
 
@@ -38,10 +39,6 @@ TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
 TELEGRAM_NOTIFICATION_CHAT_ID = os.getenv("TELEGRAM_NOTIFICATION_CHAT_ID")
 
-print(TELEGRAM_BOT_TOKEN)
-print(TELEGRAM_CHAT_ID)
-print(TELEGRAM_NOTIFICATION_CHAT_ID)
-
 
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
@@ -55,6 +52,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "rest_framework",
     "corsheaders",
     "users",
@@ -62,7 +60,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "sauna.logs.RequestIdMiddleware",
+    "sauna.middleware.ProfilerMiddleware",
+    "sauna.middleware.PrometheusMiddleware",
+    "sauna.db_router.ReplicaRoutingMiddleware",
+    "sauna.middleware.QueryInstrumentationMiddleware",
     "corsheaders.middleware.CorsMiddleware",
+    "sauna.throttling.RateLimitHeadersMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -75,9 +79,29 @@ MIDDLEWARE = [
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
         "rest_framework_simplejwt.authentication.JWTAuthentication",
-    )
+    ),
+    # Token buckets for anonymous traffic, see sauna/throttling.py
+    "DEFAULT_THROTTLE_RATES": {
+        "room_bookings": "120/min",
+        "booking_lookup": "30/min",
+        "booking_lookup_phone": "10/min",
+        "booking_create": "10/min",
+        "booking_create_phone": "3/min",
+        "booking_sms": "20/min",
+        "bonus": "60/min",
+        "bonus_phone": "20/min",
+        "slot_hold": "20/min",
+        "slot_hold_phone": "5/min",
+    },
+    # Reverse proxies in front of gunicorn. IP buckets key on the address the
+    # last of them saw; with 0 they use REMOTE_ADDR and ignore X-Forwarded-For,
+    # which clients can set to anything.
+    "NUM_PROXIES": int(os.getenv("NUM_PROXIES", "0")),
 }
 
+# Turn the token buckets off for load tests (see bookings/services/benchmarks.py)
+THROTTLING_ENABLED = os.getenv("THROTTLING_ENABLED", "1") == "1"
+
 ROOT_URLCONF = "sauna.urls"
 
 TEMPLATES = [
@@ -113,6 +137,45 @@ DATABASES = {
     }
 }
 
+# Connection reuse, see sauna/db_pool.py: "pool", "persistent" or "none"
+DB_CONN_MODE = os.getenv("DB_CONN_MODE", "pool")
+if DB_CONN_MODE == "pool":
+    DATABASES["default"]["OPTIONS"] = {
+        "pool": {
+            "min_size": int(os.getenv("DB_POOL_MIN_SIZE", "1")),
+            "max_size": int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+            # Seconds a request waits for a free connection before failing
+            "timeout": float(os.getenv("DB_POOL_TIMEOUT", "5")),
+        }
+    }
+elif DB_CONN_MODE == "persistent":
+    DATABASES["default"]["CONN_MAX_AGE"] = int(os.getenv("DB_CONN_MAX_AGE", "60"))
+DATABASES["default"]["CONN_HEALTH_CHECKS"] = DB_CONN_MODE != "none"
+
+# Read replicas, see sauna/db_router.py. POSTGRES_REPLICA_HOSTS="host1,host2:5433"
+# adds the aliases replica1, replica2, ... with the default's credentials.
+# Each gets its own test database, so the router tests run against two
+# local databases; READ_REPLICAS_ENABLED=0 keeps the aliases but reads
+# everything from the primary (the rest of the test suite needs that).
+for _number, _host in enumerate(
+    filter(None, os.getenv("POSTGRES_REPLICA_HOSTS", "").split(",")), start=1
+):
+    _host, _, _port = _host.strip().partition(":")
+    DATABASES[f"replica{_number}"] = {
+        **DATABASES["default"],
+        "HOST": _host,
+        "PORT": _port or DATABASES["default"]["PORT"],
+        "TEST": {"NAME": f"test_{DATABASES['default']['NAME']}_replica{_number}"},
+    }
+DATABASE_ROUTERS = ["sauna.db_router.ReplicaRouter"]
+DATABASE_REPLICAS = (
+    [alias for alias in DATABASES if alias != "default"]
+    if os.getenv("READ_REPLICAS_ENABLED", "1") == "1"
+    else []
+)
+# How long a client that wrote keeps reading from the primary
+REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", "10"))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -157,6 +220,9 @@ STATIC_ROOT = os.path.join(BASE_DIR, "static")
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 CORS_ALLOW_ALL_ORIGINS = True
+# Clients without cookies echo the read-your-writes marker back as a header
+CORS_ALLOW_HEADERS = (*default_headers, "x-db-primary-until", "idempotency-key")
+CORS_EXPOSE_HEADERS = ["X-DB-Primary-Until", "Idempotent-Replayed"]
 # TIME_ZONE = 'Asia/Almaty'  # Example for UTC+5
 AUTH_USER_MODEL = "users.User"
 # USE_TZ = True
@@ -168,6 +234,84 @@ CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 # CELERY_TIMEZONE = TIME_ZONE
+# Workers log through LOGGING instead of replacing the root handlers
+CELERY_WORKER_HIJACK_ROOT_LOGGER = False
+
+# Redis used by the application itself (reminder buckets etc.)
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/2")
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "0.5"))
+
+# SMS / one-time codes
+# Codes only reach customers through a real provider (e.g. SMSCProvider), so
+# outside DEV sending fails until one is configured
+SMS_PROVIDER = os.getenv(
+    "SMS_PROVIDER",
+    "bookings.services.sms."
+    + ("ConsoleSMSProvider" if STAGE == "DEV" else "UnconfiguredSMSProvider"),
+)
+SMS_FILE_PATH = os.getenv("SMS_FILE_PATH", os.path.join(BASE_DIR, "sms_outbox.log"))
+SMSC_LOGIN = os.getenv("SMSC_LOGIN")
+SMSC_PASSWORD = os.getenv("SMSC_PASSWORD")
+SMSC_SENDER = os.getenv("SMSC_SENDER")
+OTP_CODE_TTL_SECONDS = 600
+OTP_MAX_ATTEMPTS = 5
+OTP_RESEND_COOLDOWN_SECONDS = 60
+OTP_MAX_SENDS_PER_HOUR = 5
+
+# Checkout slot holds, see bookings/services/holds.py
+SLOT_HOLD_TTL_SECONDS = int(os.getenv("SLOT_HOLD_TTL_SECONDS", "300"))
+
+# Idempotency-Key handling, see bookings/services/idempotency.py
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 60 * 60)))
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "30"))
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "2"))
+
+# Per-request SQL instrumentation, see sauna/middleware.py
+QUERY_INSTRUMENTATION_ENABLED = os.getenv("QUERY_INSTRUMENTATION_ENABLED", "1") == "1"
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "500"))
+SLOW_REQUEST_QUERIES = int(os.getenv("SLOW_REQUEST_QUERIES", "30"))
+QUERY_STATS_SAMPLE_RATE = float(os.getenv("QUERY_STATS_SAMPLE_RATE", "0.05"))
+
+# Superadmin request profiles (?__profile=1), see sauna/profiling.py
+PROFILE_TTL_SECONDS = int(os.getenv("PROFILE_TTL_SECONDS", "3600"))
+PROFILE_TOP_FUNCTIONS = 40
+
+# Logging: JSON lines (or text) to stderr through a non-blocking queue
+# handler, see sauna/logs.py
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# Share of requests whose booking price calculations are logged; staff
+# requests (or any, with DEBUG) can opt in with the "X-Pricing-Trace: 1" header
+PRICING_TRACE_SAMPLE_RATE = float(os.getenv("PRICING_TRACE_SAMPLE_RATE", "0.01"))
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "queue": {
+            "class": "sauna.logs.NonBlockingHandler",
+            "fmt": LOG_FORMAT,
+        },
+    },
+    "root": {"handlers": ["queue"], "level": LOG_LEVEL},
+    "loggers": {
+        # replaces Django's default console handler
+        "django": {"handlers": ["queue"], "level": LOG_LEVEL, "propagate": False},
+    },
+}
+
+# Serve the hot public reads with async views; sauna/asgi.py turns this on
+# (see sauna/async_views.py)
+ASYNC_READ_VIEWS = os.getenv("ASYNC_READ_VIEWS", "0") == "1"
+
+# Prometheus: /metrics (see sauna/metrics.py), which outside DEV answers 404
+# until METRICS_AUTH_TOKEN is set; the Celery worker serves its own metrics on
+# CELERY_METRICS_PORT
+METRICS_AUTH_TOKEN = os.getenv("METRICS_AUTH_TOKEN")
+CELERY_METRICS_PORT = int(os.getenv("CELERY_METRICS_PORT", "9808"))
+
+# Pre-visit reminders: minutes before Booking.start_time
+BOOKING_REMINDER_OFFSETS_MINUTES = (120, 30)
 
 # Run periodic tasks
 CELERY_BEAT_SCHEDULE = {
@@ -176,4 +320,25 @@ CELERY_BEAT_SCHEDULE = {
         "task": "bookings.tasks.accrue_finished_booking_bonuses",
         "schedule": 300.0,  # every 5 minutes
     },
+    # Pop due pre-visit reminder buckets once a minute
+    "dispatch-booking-reminders": {
+        "task": "bookings.tasks.dispatch_booking_reminders",
+        "schedule": 60.0,
+    },
+    "refresh-occupancy-heatmaps": {
+        "task": "bookings.tasks.refresh_occupancy_heatmaps",
+        "schedule": 900.0,  # every 15 minutes
+    },
+    # The 15-minute runs only add bookings; rebuild nightly to drop cancelled,
+    # moved and deleted ones and pick up late confirmations
+    "rebuild-occupancy-heatmaps": {
+        "task": "bookings.tasks.refresh_occupancy_heatmaps",
+        "schedule": crontab(hour=4, minute=0),
+        "kwargs": {"full": True},
+    },
+    # Drop Idempotency-Key responses stored in the database fallback
+    "purge-idempotency-records": {
+        "task": "bookings.tasks.purge_idempotency_records",
+        "schedule": 3600.0,
+    },
 }
@@ -0,0 +1,192 @@
+"""
+Helpers shared by the query-count tests in users/tests.py and bookings/tests.py.
+
+build_dataset(scale) creates a small but complete tree (owners, bathhouses,
+rooms with photos, menus, bookings with extras, bonus ledgers, customer
+profiles) whose row counts grow linearly with `scale`. QueryBudgetMixin
+requests an endpoint as a given role and checks it stays within a fixed
+number of queries, so running the same test at 1x, 10x and 100x catches
+N+1 queries.
+"""
+from __future__ import annotations
+
+from datetime import timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
+from asgiref.sync import async_to_sync
+from django.db import connection
+from django.test import AsyncRequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+BOOKINGS_PER_ROOM = 3
+ROOMS_PER_BATHHOUSE = 2
+BATHHOUSES_PER_OWNER = 1
+ITEMS_PER_BATHHOUSE = 2
+
+
+def build_dataset(scale: int = 1) -> SimpleNamespace:
+    from bookings.models import Booking, BonusAccount, BonusTransaction, CustomerProfile
+    from users.models import (
+        Bathhouse,
+        BathhouseItem,
+        ExtraItem,
+        MenuCategory,
+        Room,
+        RoomPhoto,
+        User,
+    )
+
+    superadmin = User.objects.create_superuser("root", "root@example.com", "pass")
+    owners = [
+        User.objects.create_user(f"owner{i}", f"owner{i}@example.com", "pass", role="bath_admin")
+        for i in range(2)
+    ]
+
+    bathhouses = Bathhouse.objects.bulk_create(
+        Bathhouse(
+            name=f"Bathhouse {owner.username}-{n}",
+            address="Almaty",
+            owner=owner,
+            is_24_hours=True,
+        )
+        for owner in owners
+        for n in range(BATHHOUSES_PER_OWNER * scale)
+    )
+    rooms = Room.objects.bulk_create(
+        Room(bathhouse=bathhouse, room_number=str(n), price_per_hour=Decimal("5000.00"))
+        for bathhouse in bathhouses
+        for n in range(ROOMS_PER_BATHHOUSE)
+    )
+    RoomPhoto.objects.bulk_create(
+        RoomPhoto(room=room, image=f"room_photos/{room.pk}-{n}.jpg", is_primary=n == 0)
+        for room in rooms
+        for n in range(2)
+    )
+    categories = MenuCategory.objects.bulk_create(
+        MenuCategory(bathhouse=bathhouse, name="Напитки") for bathhouse in bathhouses
+    )
+    items = BathhouseItem.objects.bulk_create(
+        BathhouseItem(
+            bathhouse=category.bathhouse,
+            category=category,
+            name=f"Item {n}",
+            price=Decimal("1000.00"),
+        )
+        for category in categories
+        for n in range(ITEMS_PER_BATHHOUSE)
+    )
+    items_by_bathhouse = {}
+    for item in items:
+        items_by_bathhouse.setdefault(item.bathhouse_id, []).append(item)
+
+    now = timezone.now()
+    bookings = Booking.objects.bulk_create(
+        Booking(
+            bathhouse_id=room.bathhouse_id,
+            room=room,
+            name=f"Guest {i}",
+            phone=f"+7701{i:07d}",
+            phone_normalized=f"+7701{i:07d}",
+            start_time=now + timedelta(days=1, hours=3 * n),
+            hours=2,
+            # Left empty on some so get_final_price() falls back to calculating
+            final_price=Decimal("10000.00") if n else None,
+        )
+        for i, (room, n) in enumerate(
+            (room, n) for room in rooms for n in range(BOOKINGS_PER_ROOM)
+        )
+    )
+    ExtraItem.objects.bulk_create(
+        ExtraItem(booking=booking, item=items_by_bathhouse[booking.bathhouse_id][0], quantity=2)
+        for booking in bookings
+    )
+    accounts = BonusAccount.objects.bulk_create(
+        BonusAccount(
+            bathhouse_id=booking.bathhouse_id,
+            phone=booking.phone,
+            phone_normalized=booking.phone_normalized,
+            balance=Decimal("500.00"),
+        )
+        for booking in bookings
+    )
+    BonusTransaction.objects.bulk_create(
+        BonusTransaction(
+            account=account, booking=booking, type=BonusTransaction.ACCRUAL, amount=Decimal("500.00")
+        )
+        for account, booking in zip(accounts, bookings)
+    )
+    CustomerProfile.objects.bulk_create(
+        CustomerProfile(
+            bathhouse_id=booking.bathhouse_id,
+            phone=booking.phone_normalized,
+            name=booking.name,
+            bookings_count=1,
+            last_booking_start=booking.start_time,
+        )
+        for booking in bookings
+    )
+    return SimpleNamespace(
+        superadmin=superadmin,
+        owner=owners[0],
+        bathhouse=bathhouses[0],
+        room=rooms[0],
+        booking=bookings[0],
+        account=accounts[0],
+    )
+
+
+class QueryBudgetMixin:
+    """
+    For TestCase subclasses that set SCALE and build `self.data` with
+    build_dataset(SCALE) in setUpTestData.
+    """
+
+    SCALE = 1
+
+    def request_as(self, role, method, url, **kwargs):
+        client = APIClient(SERVER_NAME="localhost")
+        if role == "superadmin":
+            client.force_authenticate(self.data.superadmin)
+        elif role == "bath_admin":
+            client.force_authenticate(self.data.owner)
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(client, method)(url, **kwargs)
+            if response.streaming:
+                b"".join(response.streaming_content)
+        return response, ctx
+
+    def assertQueryBudget(self, role, url, budget, method="get", status=200, **kwargs):
+        response, ctx = self.request_as(role, method, url, **kwargs)
+        self.assertEqual(
+            response.status_code,
+            status,
+            f"{method.upper()} {url} as {role}: {getattr(response, 'data', '')}",
+        )
+        queries = len(ctx.captured_queries)
+        self.assertLessEqual(
+            queries,
+            budget,
+            f"{method.upper()} {url} as {role} at {self.SCALE}x ran {queries} queries "
+            f"(budget {budget}):\n"
+            + "\n".join(query["sql"] for query in ctx.captured_queries),
+        )
+        return response
+
+
+class AsyncReadParityMixin:
+    """
+    Checks an async read handler (sauna/async_views.py) against the DRF view
+    of the same URL. Both requests go to "testserver", so the test case needs
+    override_settings(ALLOWED_HOSTS=["testserver"]).
+    """
+
+    def assertSameAsSync(self, handler, url, params=None):
+        expected = APIClient().get(url, params)
+        request = AsyncRequestFactory().get(url, params)
+        response = async_to_sync(handler)(request)
+        self.assertEqual(response.status_code, expected.status_code, response.content)
+        self.assertEqual(response.content, expected.content)
+        return response
@@ -0,0 +1,312 @@
+import io
+import json
+import logging
+import os
+import queue
+from unittest import mock
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import resolve, reverse
+from redis import RedisError
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from sauna import logs, profiling, query_stats
+from sauna.redis_client import get_redis
+from sauna.throttling import IPRateThrottle, PhoneRateThrottle
+from users.models import Bathhouse, Room, User
+
+THROTTLE_RATES = {**settings.REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"], "test": "2/min", "booking_lookup": "2/min"}
+
+
+def clear_redis(pattern):
+    client = get_redis()
+    keys = list(client.scan_iter(pattern))
+    if keys:
+        client.delete(*keys)
+
+
+@override_settings(
+    THROTTLING_ENABLED=True,
+    REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": THROTTLE_RATES},
+)
+class TokenBucketThrottleTests(SimpleTestCase):
+    def setUp(self):
+        clear_redis("throttle:*")
+        self.factory = RequestFactory()
+
+    def allow(self, throttle, **extra):
+        return throttle.allow_request(self.factory.get("/", **extra), None)
+
+    def test_bucket_empties_and_refills(self):
+        throttle = IPRateThrottle("test")
+        now = 1_000_000.0
+        with mock.patch("sauna.throttling.time.time", side_effect=lambda: now):
+            self.assertEqual([self.allow(throttle) for _ in range(3)], [True, True, False])
+            # 2/min refills a token every 30 seconds
+            self.assertAlmostEqual(throttle.wait(), 30, delta=0.01)
+            now += 15
+            self.assertFalse(self.allow(throttle))
+            now += 15
+            self.assertTrue(self.allow(throttle))
+            self.assertFalse(self.allow(throttle))
+
+    def test_rate_limit_headers(self):
+        request = self.factory.get("/")
+        self.assertTrue(IPRateThrottle("test").allow_request(request, None))
+        self.assertEqual(request.rate_limit, {"limit": 2, "remaining": 1, "reset": 30})
+
+    def test_spoofed_forwarded_for_shares_the_bucket(self):
+        throttle = IPRateThrottle("test")
+        results = [
+            self.allow(throttle, REMOTE_ADDR="10.0.0.1", HTTP_X_FORWARDED_FOR=f"203.0.113.{i}")
+            for i in range(3)
+        ]
+        self.assertEqual(results, [True, True, False])
+
+    def test_forwarded_for_behind_proxy(self):
+        rest_framework = {**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": THROTTLE_RATES, "NUM_PROXIES": 1}
+        with override_settings(REST_FRAMEWORK=rest_framework):
+            throttle = IPRateThrottle("test")
+            # The proxy appends the address it saw; anything before it is client-supplied
+            results = [
+                self.allow(throttle, REMOTE_ADDR="10.0.0.1", HTTP_X_FORWARDED_FOR=f"203.0.113.{i}, 198.51.100.7")
+                for i in range(3)
+            ]
+            self.assertEqual(results, [True, True, False])
+            self.assertTrue(self.allow(throttle, REMOTE_ADDR="10.0.0.1", HTTP_X_FORWARDED_FOR="198.51.100.8"))
+
+    def test_phone_bucket(self):
+        throttle = PhoneRateThrottle("test")
+        phones = ["+7 701 123 45 67", "87011234567", "+77011234567"]
+        self.assertEqual([self.allow(throttle, data={"phone": phone}) for phone in phones], [True, True, False])
+        # No phone, no bucket
+        self.assertTrue(self.allow(throttle, data={"phone": "abc"}))
+
+    def test_redis_unavailable(self):
+        with mock.patch("sauna.throttling.get_script", side_effect=RedisError):
+            self.assertTrue(all(self.allow(IPRateThrottle("test")) for _ in range(3)))
+
+    @override_settings(THROTTLING_ENABLED=False)
+    def test_disabled(self):
+        self.assertTrue(all(self.allow(IPRateThrottle("test")) for _ in range(3)))
+
+
+@override_settings(
+    THROTTLING_ENABLED=True,
+    REST_FRAMEWORK={**settings.REST_FRAMEWORK, "DEFAULT_THROTTLE_RATES": THROTTLE_RATES},
+)
+class ThrottledEndpointTests(TestCase):
+    def setUp(self):
+        clear_redis("throttle:*")
+
+    def test_spoofed_forwarded_for_gets_429(self):
+        url = reverse("booking-list")
+        statuses = [
+            self.client.get(
+                url, {"phone_number": f"+7701000000{i}"}, HTTP_X_FORWARDED_FOR=f"203.0.113.{i}"
+            ).status_code
+            for i in range(3)
+        ]
+        self.assertEqual(statuses, [200, 200, 429])
+
+
+class MetricsViewTests(SimpleTestCase):
+    @override_settings(STAGE="PROD", METRICS_AUTH_TOKEN=None)
+    def test_hidden_without_token_outside_dev(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 404)
+
+    @override_settings(STAGE="PROD", METRICS_AUTH_TOKEN="secret")
+    def test_token(self):
+        url = reverse("metrics")
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION="Bearer wrong").status_code, 401)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION="Bearer secret").status_code, 200)
+
+    @override_settings(STAGE="DEV", METRICS_AUTH_TOKEN=None)
+    def test_open_in_dev(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 200)
+
+
+class QueryStatsTests(TestCase):
+    def setUp(self):
+        query_stats.reset()
+
+    def test_normalize_sql(self):
+        normalized = query_stats.normalize_sql(
+            "SELECT *  FROM t WHERE id IN (%s, %s, %s) AND name = 'it''s' LIMIT 21"
+        )
+        self.assertEqual(normalized, "SELECT * FROM t WHERE id IN (...) AND name = ? LIMIT ?")
+        self.assertEqual(
+            query_stats.normalize_sql("SELECT * FROM t WHERE id IN (%s)"), "SELECT * FROM t WHERE id IN (...)"
+        )
+
+    def test_record_and_top(self):
+        query_stats.record(
+            [
+                ("SELECT * FROM a WHERE id IN (%s)", 1.0),
+                ("SELECT * FROM a WHERE id IN (%s, %s)", 3.0),
+                ("SELECT * FROM b", 10.0),
+            ],
+            "view",
+        )
+        by_time = query_stats.top("time")
+        self.assertEqual([q["sql"] for q in by_time], ["SELECT * FROM b", "SELECT * FROM a WHERE id IN (...)"])
+        heaviest = query_stats.top("count", limit=1)
+        self.assertEqual(len(heaviest), 1)
+        self.assertEqual(
+            {k: heaviest[0][k] for k in ("count", "total_ms", "mean_ms", "p95_ms", "last_view")},
+            {"count": 2, "total_ms": 4.0, "mean_ms": 2.0, "p95_ms": 3.0, "last_view": "view"},
+        )
+
+        query_stats.reset()
+        self.assertEqual(query_stats.top(), [])
+
+    @override_settings(QUERY_INSTRUMENTATION_ENABLED=True, QUERY_STATS_SAMPLE_RATE=1.0, THROTTLING_ENABLED=False)
+    def test_sampled_requests_are_listed(self):
+        bathhouse = Bathhouse.objects.create(name="Bathhouse", address="Almaty", is_24_hours=True)
+        room = Room.objects.create(bathhouse=bathhouse, room_number="1")
+        url = reverse("booking-get-room-bookings")
+        self.assertEqual(self.client.get(url, {"room_id": room.pk}).status_code, 200)
+
+        client = APIClient()
+        client.force_authenticate(User.objects.create_superuser("root", "root@example.com", "pass", role="superadmin"))
+        response = client.get(reverse("query-stats"), {"order_by": "count"})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(resolve(url).view_name, {q["last_view"] for q in response.data["queries"]})
+        self.assertEqual(self.client.get(reverse("query-stats")).status_code, 401)
+
+
+class NonBlockingHandlerTests(SimpleTestCase):
+    def setUp(self):
+        self.handler = logs.NonBlockingHandler("json")
+        self.output = io.StringIO()
+        self.handler.target.setStream(self.output)
+        self.logger = logging.getLogger("sauna.tests.logs")
+        self.logger.propagate = False
+        self.logger.addHandler(self.handler)
+        self.addCleanup(self.logger.removeHandler, self.handler)
+        self.addCleanup(self.handler.stop)
+
+    def lines(self):
+        # stop() drains the queue before the listener thread exits
+        self.handler.stop()
+        return [json.loads(line) for line in self.output.getvalue().splitlines()]
+
+    def test_records_are_written_by_the_listener(self):
+        token = logs.request_id_var.set("req-1")
+        try:
+            self.logger.warning("booking %s failed", "b1", extra={"room_id": 7})
+            try:
+                raise ValueError("boom")
+            except ValueError:
+                self.logger.exception("with traceback")
+        finally:
+            logs.request_id_var.reset(token)
+        self.logger.info("outside a request")
+
+        first, second, third = self.lines()
+        self.assertEqual(
+            {k: first[k] for k in ("level", "logger", "message", "request_id", "room_id")},
+            {
+                "level": "WARNING",
+                "logger": "sauna.tests.logs",
+                "message": "booking b1 failed",
+                "request_id": "req-1",
+                "room_id": 7,
+            },
+        )
+        self.assertIn("ValueError: boom", second["exc_info"])
+        self.assertIsNone(third["request_id"])
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        # As if the listener had started but fallen behind
+        self.handler.pid = os.getpid()
+        self.handler.queue = queue.Queue(1)
+        self.logger.warning("kept")
+        self.logger.warning("dropped")
+        self.assertEqual(self.handler.dropped, 1)
+
+
+@override_settings(STAGE="DEV", METRICS_AUTH_TOKEN=None)
+class RequestIdMiddlewareTests(SimpleTestCase):
+    def test_request_id_is_echoed_or_generated(self):
+        url = reverse("metrics")
+        response = self.client.get(url, HTTP_X_REQUEST_ID="abc-123")
+        self.assertEqual(response[logs.REQUEST_ID_HEADER], "abc-123")
+        response = self.client.get(url, HTTP_X_REQUEST_ID="not valid!")
+        self.assertRegex(response[logs.REQUEST_ID_HEADER], r"^[0-9a-f]{32}$")
+
+
+@override_settings(PRICING_TRACE_SAMPLE_RATE=0)
+class PricingTraceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("owner", "owner@example.com", "pass", role="bath_admin")
+
+    def traced(self, **headers):
+        middleware = logs.RequestIdMiddleware(lambda request: HttpResponse(str(logs.pricing_trace_enabled())))
+        request = RequestFactory().get("/", headers=headers)
+        return middleware(request).content == b"True"
+
+    def test_header_is_honored_for_staff_only(self):
+        self.assertFalse(self.traced())
+        self.assertFalse(self.traced(**{logs.PRICING_TRACE_HEADER: "1"}))
+        self.assertFalse(self.traced(**{logs.PRICING_TRACE_HEADER: "1", "Authorization": "Bearer forged"}))
+        auth = {"Authorization": f"Bearer {AccessToken.for_user(self.user)}"}
+        self.assertTrue(self.traced(**{logs.PRICING_TRACE_HEADER: "1"}, **auth))
+
+    @override_settings(DEBUG=True)
+    def test_header_is_honored_for_anyone_with_debug(self):
+        self.assertTrue(self.traced(**{logs.PRICING_TRACE_HEADER: "1"}))
+
+
+@override_settings(THROTTLING_ENABLED=False)
+class ProfilerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.superadmin = User.objects.create_superuser("root", "root@example.com", "pass", role="superadmin")
+        bathhouse = Bathhouse.objects.create(name="Bathhouse", address="Almaty", is_24_hours=True)
+        cls.room = Room.objects.create(bathhouse=bathhouse, room_number="1")
+
+    def setUp(self):
+        clear_redis("profile:*")
+        self.url = reverse("booking-get-room-bookings")
+        self.auth = {"HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(self.superadmin)}"}
+
+    def get(self, **extra):
+        return self.client.get(self.url, {"room_id": self.room.pk, "__profile": "1"}, **extra)
+
+    def test_profile_is_stored_and_listed(self):
+        response = self.get(**self.auth)
+        self.assertEqual(response.status_code, 200)
+        profile_id = response["X-Profile-ID"]
+
+        report = profiling.fetch(profile_id)
+        self.assertEqual((report["method"], report["status"]), ("GET", 200))
+        self.assertGreater(report["query_count"], 0)
+        self.assertEqual(report["query_count"], len(report["queries"]))
+        self.assertGreaterEqual(report["total_ms"], report["serializer_ms"] + report["render_ms"])
+        self.assertEqual([p["id"] for p in profiling.recent()], [profile_id])
+
+        detail = self.client.get(reverse("profile-detail", args=[profile_id]), **self.auth)
+        self.assertEqual(detail.json()["id"], profile_id)
+        missing = self.client.get(reverse("profile-detail", args=["missing"]), **self.auth)
+        self.assertEqual(missing.status_code, 404)
+
+    def test_only_superadmins_are_profiled(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("X-Profile-ID", response)
+        self.assertEqual(profiling.recent(), [])
+
+    def test_one_profile_at_a_time(self):
+        self.assertTrue(profiling._lock.acquire(blocking=False))
+        try:
+            response = self.get(**self.auth)
+        finally:
+            profiling._lock.release()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Profile-Status"], "busy")
@@ -0,0 +1,198 @@
+"""
+Token-bucket throttles backed by Redis.
+
+Each check is a single EVALSHA: the script refills the bucket from the time
+elapsed since the last request, takes a token if there is one and returns the
+state needed for the X-RateLimit-* headers. Rates come from
+REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"] ("<tokens>/<period>"); views pick a
+scope per action in get_throttles(), the same way they pick permissions.
+
+Only anonymous traffic is throttled. If Redis is unavailable requests are let
+through rather than failing the endpoint. THROTTLING_ENABLED=0 switches the
+buckets off, e.g. for load tests.
+"""
+from __future__ import annotations
+
+import logging
+import math
+import time
+
+import redis
+from django.conf import settings
+from django.http import JsonResponse
+from rest_framework.exceptions import Throttled
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from bookings.utils import normalize_phone
+from sauna.middleware import HybridMiddleware
+from sauna.redis_client import get_async_script, get_script
+
+log = logging.getLogger(__name__)
+
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local refill_per_ms = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+if tokens == nil then
+    tokens = capacity
+    ts = now
+end
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * refill_per_ms)
+
+local allowed = 0
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    retry_after = math.ceil((1 - tokens) / refill_per_ms)
+end
+
+local reset = math.ceil((capacity - tokens) / refill_per_ms)
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.max(reset, 1))
+return {allowed, math.floor(tokens), retry_after, reset}
+"""
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+class TokenBucketThrottle(BaseThrottle):
+    kind = None
+
+    def __init__(self, scope: str):
+        self.scope = scope
+        self.capacity, self.period = self.parse_rate(api_settings.DEFAULT_THROTTLE_RATES[scope])
+        self.wait_seconds = None
+
+    @staticmethod
+    def parse_rate(rate: str):
+        num, period = rate.split("/")
+        return int(num), PERIODS[period[0]]
+
+    def get_ident_key(self, request):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        bucket = self._bucket(request)
+        if bucket is None:
+            return True
+        key, args = bucket
+        try:
+            result = get_script(TOKEN_BUCKET_SCRIPT)(keys=[key], args=args)
+        except redis.RedisError:
+            log.warning("Rate limiter unavailable, letting request through", exc_info=True)
+            return True
+        return self._take(request, result)
+
+    async def aallow_request(self, request):
+        """allow_request() for the async views, through redis.asyncio."""
+        bucket = self._bucket(request)
+        if bucket is None:
+            return True
+        key, args = bucket
+        try:
+            result = await get_async_script(TOKEN_BUCKET_SCRIPT)(keys=[key], args=args)
+        except redis.RedisError:
+            log.warning("Rate limiter unavailable, letting request through", exc_info=True)
+            return True
+        return self._take(request, result)
+
+    def _bucket(self, request):
+        """(key, script args), or None when the request is not throttled."""
+        if not settings.THROTTLING_ENABLED:
+            return None
+        # The async views only serve requests without credentials (and must
+        # not touch the lazy session user); DRF requests carry the JWT user
+        if hasattr(request, "_request") and request.user and request.user.is_authenticated:
+            return None
+        ident = self.get_ident_key(request)
+        if not ident:
+            return None
+        key = f"throttle:{self.scope}:{self.kind}:{ident}"
+        refill_per_ms = self.capacity / (self.period * 1000)
+        return key, [self.capacity, refill_per_ms, int(time.time() * 1000)]
+
+    def _take(self, request, result):
+        allowed, remaining, retry_after_ms, reset_ms = result
+        self._record(request, remaining, reset_ms)
+        if not allowed:
+            self.wait_seconds = retry_after_ms / 1000
+            return False
+        return True
+
+    def _record(self, request, remaining, reset_ms):
+        """Keep the most restrictive bucket for RateLimitHeadersMiddleware."""
+        # DRF Request in the sync views, HttpRequest in the async ones
+        http_request = getattr(request, "_request", request)
+        current = getattr(http_request, "rate_limit", None)
+        if current is None or remaining / self.capacity < current["remaining"] / current["limit"]:
+            http_request.rate_limit = {
+                "limit": self.capacity,
+                "remaining": remaining,
+                "reset": -(-reset_ms // 1000),
+            }
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class IPRateThrottle(TokenBucketThrottle):
+    kind = "ip"
+
+    def get_ident_key(self, request):
+        return self.get_ident(request)
+
+
+class PhoneRateThrottle(TokenBucketThrottle):
+    """Keys on the normalized phone from the query string (phone / phone_number) or body."""
+
+    kind = "phone"
+
+    def get_ident_key(self, request):
+        params = getattr(request, "query_params", request.GET)
+        phone = params.get("phone") or params.get("phone_number")
+        if not phone and request.method == "POST":
+            data = request.data
+            phone = data.get("phone") if hasattr(data, "get") else None
+        return normalize_phone(phone) or None
+
+
+async def athrottle(request, throttles):
+    """
+    DRF's check_throttles() for the async views: None if every bucket allows
+    the request, otherwise the same 429 response DRF would send.
+    """
+    waits = [throttle.wait() for throttle in throttles if not await throttle.aallow_request(request)]
+    if not waits:
+        return None
+    wait = max(waits)
+    return JsonResponse(
+        {"detail": str(Throttled(wait).detail)},
+        status=429,
+        headers={"Retry-After": "%d" % math.ceil(wait)},
+    )
+
+
+class RateLimitHeadersMiddleware(HybridMiddleware):
+    """Adds X-RateLimit-* headers for requests that went through a throttle."""
+
+    def handle(self, request):
+        return self.add_headers(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.add_headers(request, await self.get_response(request))
+
+    @staticmethod
+    def add_headers(request, response):
+        rate_limit = getattr(request, "rate_limit", None)
+        if rate_limit is not None:
+            response["X-RateLimit-Limit"] = rate_limit["limit"]
+            response["X-RateLimit-Remaining"] = rate_limit["remaining"]
+            response["X-RateLimit-Reset"] = rate_limit["reset"]
+        return response
@@ -20,8 +20,14 @@ from django.conf import settings
 from django.urls import include, path
 from django.conf.urls.static import static
 
+from sauna.views import ProfileDetailView, ProfileListView, QueryStatsView, metrics_view
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/users/", include("users.urls")),
     path("api/bookings/", include("bookings.urls")),
+    path("api/ops/query-stats/", QueryStatsView.as_view(), name="query-stats"),
+    path("api/ops/profiles/", ProfileListView.as_view(), name="profiles"),
+    path("api/ops/profiles/<str:profile_id>/", ProfileDetailView.as_view(), name="profile-detail"),
+    path("metrics", metrics_view, name="metrics"),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,103 @@
+import hmac
+
+import redis
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from sauna import metrics, profiling, query_stats
+from users.permissions import IsSuperAdmin
+
+
+class QueryStatsView(APIView):
+    """
+    Sampled SQL fingerprints collected by QueryInstrumentationMiddleware.
+
+    GET query params: order_by ("time" or "count", default "time"), limit (default 50)
+    DELETE clears the collected statistics.
+    """
+
+    permission_classes = [IsSuperAdmin]
+
+    def get(self, request):
+        order_by = request.query_params.get("order_by", "time")
+        if order_by not in ("time", "count"):
+            return Response(
+                {"error": "order_by must be 'time' or 'count'"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            limit = max(1, min(int(request.query_params.get("limit", 50)), 500))
+        except ValueError:
+            return Response({"error": "limit must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            queries = query_stats.top(order_by, limit)
+        except redis.RedisError:
+            return Response(
+                {"error": "Query stats storage unavailable"},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+        return Response({"order_by": order_by, "queries": queries})
+
+    def delete(self, request):
+        try:
+            query_stats.reset()
+        except redis.RedisError:
+            return Response(
+                {"error": "Query stats storage unavailable"},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class ProfileListView(APIView):
+    """Recent request profiles that have not expired, newest first."""
+
+    permission_classes = [IsSuperAdmin]
+
+    def get(self, request):
+        try:
+            profiles = profiling.recent()
+        except redis.RedisError:
+            return Response(
+                {"error": "Profile storage unavailable"},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+        return Response({"profiles": profiles})
+
+
+class ProfileDetailView(APIView):
+    """A report stored by ProfilerMiddleware; the id comes from the X-Profile-ID header."""
+
+    permission_classes = [IsSuperAdmin]
+
+    def get(self, request, profile_id):
+        try:
+            report = profiling.fetch(profile_id)
+        except redis.RedisError:
+            return Response(
+                {"error": "Profile storage unavailable"},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+        if report is None:
+            return Response({"error": "Profile not found or expired"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(report)
+
+
+def metrics_view(request):
+    """
+    Prometheus exposition. The scraper has to send METRICS_AUTH_TOKEN as
+    "Authorization: Bearer <token>"; without a token the endpoint only exists
+    in DEV.
+    """
+    token = settings.METRICS_AUTH_TOKEN
+    if token:
+        supplied = request.headers.get("Authorization", "").removeprefix("Bearer ")
+        if not hmac.compare_digest(supplied, token):
+            return HttpResponse(status=401)
+    elif settings.STAGE != "DEV":
+        return HttpResponse(status=404)
+    body, content_type = metrics.exposition()
+    return HttpResponse(body, content_type=content_type)
@@ -13,6 +13,7 @@ class UserAdmin(admin.ModelAdmin):
 @admin.register(Bathhouse)
 class BathhouseAdmin(admin.ModelAdmin):
     list_display = ("name", "address", "owner")
+    list_select_related = ("owner",)
     search_fields = ("name", "address")
     list_filter = ("owner",)
     ordering = ("name",)
@@ -41,6 +42,7 @@ class RoomAdmin(admin.ModelAdmin):
         "is_available",
         "has_pool",
     )
+    list_select_related = ("bathhouse",)
     search_fields = ("room_number", "bathhouse__name")
     list_filter = ("bathhouse", "is_available", "has_pool")
     ordering = ("bathhouse", "room_number")
@@ -50,6 +52,7 @@ class RoomAdmin(admin.ModelAdmin):
 @admin.register(RoomPhoto)
 class RoomPhotoAdmin(admin.ModelAdmin):
     list_display = ("room", "image_preview", "caption", "is_primary", "created_at")
+    list_select_related = ("room__bathhouse",)
     search_fields = ("room__room_number", "caption")
     list_filter = ("is_primary", "created_at", "room__bathhouse")
     ordering = ("-created_at",)
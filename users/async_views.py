@@ -0,0 +1,14 @@
+"""
+Async handlers for the public catalog lists, see sauna/async_views.py.
+"""
+from sauna.async_views import list_handler
+
+from .views import BathhouseItemViewSet, BathhouseViewSet, MenuCategoryViewSet, RoomViewSet
+
+# url name -> handler
+HANDLERS = {
+    "bathhouse-list": list_handler(BathhouseViewSet),
+    "room-list": list_handler(RoomViewSet),
+    "bathhouseitem-list": list_handler(BathhouseItemViewSet),
+    "menucategory-list": list_handler(MenuCategoryViewSet),
+}
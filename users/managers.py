@@ -5,7 +5,6 @@ class UserManager(BaseUserManager):
     use_in_migrations = True
 
     def create_user(self, username, email=None, password=None, **extra_fields):
-        print(f"Creating user: {username}, email: {email}, password: {password}")
         if not username:
             raise ValueError("The given username must be set")
         email = self.normalize_email(email)
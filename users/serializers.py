@@ -1,11 +1,53 @@
+from django.db.models import Prefetch
 from rest_framework import serializers
 from .models import ExtraItem, MenuCategory, Room, RoomPhoto, User, Bathhouse, BathhouseItem
 
 
+class PrefetchedPrimaryKeyField(serializers.PrimaryKeyRelatedField):
+    """Takes objects from `prefetched` (set by the list) and queries only for the rest."""
+
+    prefetched = None
+
+    def to_internal_value(self, data):
+        if self.prefetched is not None and not isinstance(data, bool):
+            try:
+                return self.prefetched[int(data)]
+            except (KeyError, TypeError, ValueError):
+                pass
+        return super().to_internal_value(data)
+
+
+def prefetch_related_field(field, entries):
+    """Load the objects `entries` refer to by field.field_name into field.prefetched, in one query."""
+    ids = set()
+    for entry in entries:
+        try:
+            ids.add(int(entry[field.field_name]))
+        except (KeyError, TypeError, ValueError):
+            continue
+    prefetched = field.prefetched or {}
+    missing = ids - prefetched.keys()
+    if missing:
+        prefetched = {**prefetched, **field.get_queryset().in_bulk(missing)}
+    field.prefetched = prefetched
+
+
+class ExtraItemInputListSerializer(serializers.ListSerializer):
+    """Loads the items of all entries in one query instead of one per entry."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            prefetch_related_field(self.child.fields["item"], data)
+        return super().to_internal_value(data)
+
+
 class ExtraItemInputSerializer(serializers.Serializer):
-    item = serializers.PrimaryKeyRelatedField(queryset=BathhouseItem.objects.all())
+    item = PrefetchedPrimaryKeyField(queryset=BathhouseItem.objects.all())
     quantity = serializers.IntegerField(min_value=1)
 
+    class Meta:
+        list_serializer_class = ExtraItemInputListSerializer
+
 
 class RoomPhotoSerializer(serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
@@ -25,7 +67,11 @@ class RoomPhotoSerializer(serializers.ModelSerializer):
 
 class RoomSerializer(serializers.ModelSerializer):
     photos = serializers.SerializerMethodField()
-    
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.prefetch_related("photos")
+
     def get_photos(self, obj):
         photos = obj.photos.all()
         return RoomPhotoSerializer(photos, many=True, context=self.context).data
@@ -57,6 +103,12 @@ class BathhouseSerializer(serializers.ModelSerializer):
     rooms = RoomSerializer(many=True, read_only=True)
     extra_items = ExtraItemSerializer(many=True, read_only=True)
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related("owner").prefetch_related(
+            Prefetch("rooms", queryset=RoomSerializer.setup_eager_loading(Room.objects.all()))
+        )
+
     def validate(self, data):
         is_24_hours = data.get("is_24_hours")
         start_of_work = data.get("start_of_work")
@@ -92,6 +144,15 @@ class UserSerializer(serializers.ModelSerializer):
     bathhouses = BathhouseSerializer(many=True, read_only=True)
     password = serializers.CharField(write_only=True)
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.prefetch_related(
+            Prefetch(
+                "bathhouses",
+                queryset=BathhouseSerializer.setup_eager_loading(Bathhouse.objects.all()),
+            )
+        )
+
     class Meta:
         model = User
         fields = ["id", "username", "email", "role", "bathhouses", "password"]
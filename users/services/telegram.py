@@ -1,8 +1,10 @@
 # app/services/telegram.py
 from __future__ import annotations
 import logging
+import time
 import httpx
 from django.conf import settings
+from sauna import metrics
 
 log = logging.getLogger(__name__)
 API_BASE = f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}"
@@ -46,6 +48,7 @@ def send_message(
         "parse_mode": parse_mode,
         "disable_notification": disable_notification,
     }
+    started = time.perf_counter()
     try:
         with httpx.Client(timeout=10) as client:
             r = client.post(f"{API_BASE}/sendMessage", json=payload)
@@ -55,8 +58,12 @@ def send_message(
                 raise TelegramError(data)
             return data
     except httpx.HTTPStatusError as e:
+        metrics.TELEGRAM_ERRORS.labels(chat_type, f"http_{e.response.status_code}").inc()
         log.error(f"HTTP error occurred: {e.response.text}")
         raise TelegramError(f"HTTP error: {e.response.text}") from e
     except Exception as e:
+        metrics.TELEGRAM_ERRORS.labels(chat_type, type(e).__name__).inc()
         log.exception("Failed to send Telegram message")
         raise TelegramError(str(e)) from e
+    finally:
+        metrics.TELEGRAM_SEND_DURATION.labels(chat_type).observe(time.perf_counter() - started)
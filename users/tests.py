@@ -1,3 +1,81 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.urls import reverse
 
-# Create your tests here.
+from sauna.testing import AsyncReadParityMixin, QueryBudgetMixin, build_dataset
+
+from .async_views import HANDLERS
+
+
+@override_settings(THROTTLING_ENABLED=False)
+class UsersEndpointQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """
+    Query budgets for the users API per role. The subclasses below rerun
+    every test on 10x and 100x the data, so an N+1 in BathhouseSerializer,
+    RoomSerializer.get_photos or UserSerializer fails here.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = build_dataset(cls.SCALE)
+
+    def test_users(self):
+        self.assertQueryBudget("superadmin", reverse("user-list"), 4)
+        self.assertQueryBudget("superadmin", reverse("user-detail", args=[self.data.owner.pk]), 4)
+        self.assertQueryBudget("bath_admin", reverse("user-list"), 0, status=403)
+        self.assertQueryBudget("anonymous", reverse("user-list"), 0, status=401)
+
+    def test_me(self):
+        self.assertQueryBudget("bath_admin", reverse("me"), 4)
+        self.assertQueryBudget("superadmin", reverse("me"), 2)
+
+    def test_bathhouses(self):
+        for role in ("anonymous", "bath_admin", "superadmin"):
+            with self.subTest(role=role):
+                self.assertQueryBudget(role, reverse("bathhouse-list"), 3)
+        self.assertQueryBudget(
+            "anonymous", reverse("bathhouse-detail", args=[self.data.bathhouse.pk]), 3
+        )
+
+    def test_rooms(self):
+        for role in ("anonymous", "bath_admin", "superadmin"):
+            with self.subTest(role=role):
+                self.assertQueryBudget(role, reverse("room-list"), 2)
+                self.assertQueryBudget(
+                    role, f"{reverse('room-list')}?bathhouse_id={self.data.bathhouse.pk}", 2
+                )
+        self.assertQueryBudget("anonymous", reverse("room-detail", args=[self.data.room.pk]), 2)
+
+    def test_menu(self):
+        for role in ("anonymous", "bath_admin", "superadmin"):
+            with self.subTest(role=role):
+                self.assertQueryBudget(role, reverse("menucategory-list"), 1)
+                self.assertQueryBudget(role, reverse("bathhouseitem-list"), 1)
+
+    def test_extra_items(self):
+        self.assertQueryBudget("bath_admin", reverse("extraitem-list"), 1)
+        self.assertQueryBudget("superadmin", reverse("extraitem-list"), 1)
+        response = self.assertQueryBudget("anonymous", reverse("extraitem-list"), 0)
+        self.assertEqual(response.data, [])
+
+
+class UsersEndpointQueryBudgetTests10x(UsersEndpointQueryBudgetTests):
+    SCALE = 10
+
+
+class UsersEndpointQueryBudgetTests100x(UsersEndpointQueryBudgetTests):
+    SCALE = 100
+
+
+@override_settings(THROTTLING_ENABLED=False, ALLOWED_HOSTS=["testserver"])
+class AsyncReadParityTests(AsyncReadParityMixin, TestCase):
+    """The async catalog lists served under ASGI answer byte for byte like the DRF views."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = build_dataset()
+
+    def test_catalog_lists(self):
+        for name, handler in HANDLERS.items():
+            with self.subTest(name=name):
+                self.assertSameAsSync(handler, reverse(name))
+                self.assertSameAsSync(handler, reverse(name), {"bathhouse_id": self.data.bathhouse.pk})
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
@@ -25,3 +26,9 @@ urlpatterns = [
     path("token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
     path("me/", MeView.as_view(), name="me"),
 ]
+
+if settings.ASYNC_READ_VIEWS:
+    from sauna import async_views
+    from .async_views import HANDLERS
+
+    async_views.install(urlpatterns, HANDLERS)
@@ -23,7 +23,7 @@ class MeView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        user = request.user
+        user = UserSerializer.setup_eager_loading(User.objects.filter(pk=request.user.pk)).get()
         serializer = UserSerializer(user)
         return Response(serializer.data)
 
@@ -33,6 +33,9 @@ class UserViewSet(viewsets.ModelViewSet):
     serializer_class = UserSerializer
     permission_classes = [IsSuperAdmin]
 
+    def get_queryset(self):
+        return UserSerializer.setup_eager_loading(User.objects.all())
+
 
 class BathhouseViewSet(viewsets.ModelViewSet):
     queryset = Bathhouse.objects.all()
@@ -47,16 +50,16 @@ class BathhouseViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
+        queryset = BathhouseSerializer.setup_eager_loading(Bathhouse.objects.all())
         if user.is_authenticated:
             if user.role == "superadmin":
-                return Bathhouse.objects.all()
-            return Bathhouse.objects.filter(owner=user)
+                return queryset
+            return queryset.filter(owner=user)
         else:
-            return Bathhouse.objects.all()
+            return queryset
 
     def create(self, request, *args, **kwargs):
         response = super().create(request, *args, **kwargs)
-        print(response.data)
         bathhouse_data = response.data
         text = (
             "<b>НОВАЯ БАНЯ</b>\n"
@@ -74,7 +77,6 @@ class BathhouseViewSet(viewsets.ModelViewSet):
 
     def update(self, request, *args, **kwargs):
         response = super().update(request, *args, **kwargs)
-        print(response.data)
         bathhouse_data = response.data
 
         text = (
@@ -105,14 +107,14 @@ class RoomViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
-        queryset = Room.objects.all()
+        queryset = RoomSerializer.setup_eager_loading(Room.objects.all())
 
         if user.is_authenticated and user.role == "superadmin":
-            queryset = Room.objects.all()
+            pass
         elif user.is_authenticated and user.role == "bath_admin":
-            queryset = Room.objects.filter(bathhouse__owner=user)
+            queryset = queryset.filter(bathhouse__owner=user)
         else:
-            queryset = Room.objects.filter(is_available=True)
+            queryset = queryset.filter(is_available=True)
 
         bathhouse_id = self.request.query_params.get("bathhouse_id")
         if bathhouse_id:
@@ -228,9 +230,14 @@ class ExtraItemViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
-        if user.role == "superadmin":
-            return ExtraItem.objects.all()
-        return ExtraItem.objects.filter(bathhouse__owner=user)
+        queryset = ExtraItem.objects.select_related("item")
+
+        if user.is_authenticated and user.role == "superadmin":
+            return queryset
+        elif user.is_authenticated and user.role == "bath_admin":
+            return queryset.filter(booking__bathhouse__owner=user)
+        # Extras belong to customers' bookings, so they are not public
+        return queryset.none()
 
 
 class MenuCategoryViewSet(viewsets.ModelViewSet):